@@ -0,0 +1,110 @@
+# coding: utf-8
+"""
+Бенчмарк кластерного режима: обновлений в секунду в зависимости от числа воркеров.
+Заглушка Bot API запускается отдельным процессом, воркеры - настоящий main.py.
+
+Запуск из корня проекта:
+    python -m bench.cluster_scaling --workers 1 2 4 --updates 2000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+import cluster
+import config
+import database
+from bench.updates import mixed_updates, seed_database
+
+async def _wait_http(url: str, timeout: float = 15.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(url) as resp:
+                    if resp.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            if time.monotonic() > deadline:
+                raise TimeoutError(url)
+            await asyncio.sleep(0.2)
+
+async def _api_stats(api_url: str) -> dict:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"{api_url}/_stats") as resp:
+            return await resp.json()
+
+async def run_once(workers: int, updates: list, seeded_db: str, tmp_dir: str, api_url: str, base_port: int) -> dict:
+    # Каждый прогон - на свежей копии БД
+    db_path = os.path.join(tmp_dir, f"cluster_{workers}.db")
+    shutil.copyfile(seeded_db, db_path)
+    os.environ["DATABASE_PATH"] = db_path
+    os.environ["TELEGRAM_API_URL"] = api_url
+
+    pool = cluster.WorkerPool(workers, base_port, "bench-secret")
+    await pool.start()
+    front = cluster.ClusterFront(pool.urls, "bench-secret", config.CLUSTER_MAX_IN_FLIGHT)
+    await front.start()
+
+    calls_before = sum((await _api_stats(api_url)).values())
+    started = time.perf_counter()
+    for update in updates:
+        front.submit(update)
+    await front.drain()
+    elapsed = time.perf_counter() - started
+    calls_after = sum((await _api_stats(api_url)).values())
+
+    await front.close()
+    await pool.stop()
+
+    return {
+        "workers": workers,
+        "updates": len(updates),
+        "elapsed_sec": round(elapsed, 3),
+        "updates_per_sec": round(len(updates) / elapsed, 1) if elapsed else 0.0,
+        "failed": front.failed,
+        "bot_api_calls": calls_after - calls_before,
+    }
+
+async def run(worker_counts: list, updates_count: int, api_port: int, base_port: int) -> list:
+    tmp_dir = tempfile.mkdtemp(prefix="poputchik_cluster_")
+    seeded_db = os.path.join(tmp_dir, "seed.db")
+    database.DATABASE_NAME = seeded_db
+    database.init_db()
+    route_ids = seed_database()
+    updates = list(mixed_updates(updates_count, route_ids))
+
+    api_url = f"http://127.0.0.1:{api_port}"
+    api_process = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "bench.fake_bot_api", "--port", str(api_port)
+    )
+    try:
+        await _wait_http(f"{api_url}/_stats")
+        results = []
+        for workers in worker_counts:
+            results.append(await run_once(workers, updates, seeded_db, tmp_dir, api_url, base_port))
+        return results
+    finally:
+        api_process.terminate()
+        await api_process.wait()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Масштабирование по числу воркеров")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--base-port", type=int, default=8100)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    results = asyncio.run(run(args.workers, args.updates, args.api_port, args.base_port))
+    print(json.dumps(results, ensure_ascii=False, indent=2))
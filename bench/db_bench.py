@@ -0,0 +1,406 @@
+# coding: utf-8
+"""
+Микробенчмарк функций database.py на синтетических БД (bench/synthetic_data.py)
+размером 1k / 100k / 1M заявок, в файле и в памяти.
+
+Для каждой публичной функции: операций в секунду, среднее и p95 времени вызова,
+запросов на вызов (db_profiler.count_queries), пик и остаток выделенной памяти
+на вызов (tracemalloc) и таблицы, которые запросы функции просматривают целиком.
+Функция без сценария в CASES попадает в отчёт как missing - так новые функции
+не выпадают из бенчмарка.
+
+Фикстуры генерируются один раз и кешируются в --fixtures; каждая функция
+замеряется на свежей копии, поэтому пишущие функции не влияют ни на фикстуру,
+ни на замеры остальных.
+
+Запуск из корня проекта:
+    python -m bench.db_bench --scale 1k --scale 100k
+    python -m bench.db_bench --scale 1m --mode file --only search_routes --json result.json
+    python -m bench.db_bench --scale 100k --compare before.json
+"""
+import argparse
+import inspect
+import itertools
+import json
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import config
+import database
+import db_profiler
+from bench.synthetic_data import generate, pick_pair
+
+# Размер - по числу заявок, самой большой таблице
+SCALES: Dict[str, Dict[str, int]] = {
+    "1k": {"users": 200, "routes": 100, "requests": 1_000},
+    "100k": {"users": 10_000, "routes": 10_000, "requests": 100_000},
+    "1m": {"users": 100_000, "routes": 100_000, "requests": 1_000_000},
+}
+MODES = ("file", "memory")
+
+# Функции database.py, которые не ходят в БД или не имеют смысла в бенчмарке
+# (backup_database копирует всю БД в файл)
+SKIPPED = {"add_route_listener", "backup_database"}
+
+# Не меньше MIN_OPS вызовов, даже если время вышло; вызовов под tracemalloc
+MIN_OPS = 3
+ALLOC_CALLS = 5
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+# ==== Фикстуры ===============================================================
+
+def _add_extras(path: str, rnd: random.Random) -> None:
+    """Чаты, сообщения и показанные карточки - их synthetic_data не создаёт"""
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA synchronous = OFF")
+    requests = cursor.execute("SELECT MAX(id) FROM requests").fetchone()[0] or 0
+    routes = cursor.execute("SELECT MAX(id) FROM routes").fetchone()[0] or 0
+    now = datetime.now()
+    chats = max(1, requests // 100)
+    cursor.executemany('''
+        INSERT INTO chats (request_id, driver_id, passenger_id, created_at)
+        SELECT q.id, r.user_id, q.passenger_id, ? FROM requests q JOIN routes r ON r.id = q.route_id
+        WHERE q.id = ?
+    ''', [(now.isoformat(), request_id) for request_id in rnd.sample(range(1, requests + 1), min(chats, requests))])
+    cursor.executemany('''
+        INSERT INTO messages (chat_id, sender_id, message_text, created_at)
+        SELECT id, passenger_id, ?, ? FROM chats WHERE id = ?
+    ''', [("Здравствуйте! Место ещё есть?", (now - timedelta(minutes=n)).isoformat(), chat_id)
+          for chat_id in range(1, chats + 1) for n in range(5)])
+    cursor.executemany('''
+        INSERT INTO displayed_cards (chat_id, message_id, route_id, viewer_id, variant, content_hash, shown_at)
+        VALUES (?, ?, ?, ?, 'search', 'x', ?)
+    ''', [(rnd.randint(1, 10 ** 6), n, rnd.randint(1, max(routes, 1)), 0,
+           (now - timedelta(hours=rnd.randint(0, 96))).isoformat()) for n in range(1, requests // 10 + 2)])
+    # Часть заявок с сохранённой карточкой (get_card_requests_after)
+    cursor.execute("UPDATE requests SET card_chat_id = passenger_id, card_message_id = id WHERE id % 20 = 0")
+    conn.commit()
+    conn.close()
+
+def fixture(scale: str, cache_dir: str, seed: int) -> str:
+    """Путь к БД размера scale; создаётся при первом обращении"""
+    path = os.path.join(cache_dir, f"{scale}-{seed}.db")
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = path + ".tmp"
+        summary = generate(tmp_path, seed=seed, **SCALES[scale])
+        _add_extras(tmp_path, random.Random(seed))
+        os.replace(tmp_path, path)
+        logging.info(f"Фикстура {scale}: {summary}")
+    return path
+
+class Workspace:
+    """Копия фикстуры в файле или в общей БД в памяти + ID для аргументов"""
+
+    def __init__(self, source: str, mode: str, tmp_dir: str, name: str) -> None:
+        self.mode = mode
+        self._anchor: Optional[sqlite3.Connection] = None
+        if mode == "memory":
+            # Пока открыто хотя бы одно соединение, общая БД в памяти живёт
+            self.path = f"file:poputchik_{name}?mode=memory&cache=shared"
+            self._anchor = sqlite3.connect(self.path, uri=True)
+            with sqlite3.connect(source) as src:
+                src.backup(self._anchor)
+        else:
+            self.path = os.path.join(tmp_dir, f"{name}.db")
+            shutil.copyfile(source, self.path)
+        database.DATABASE_NAME = self.path
+        # Фикстура из кеша могла быть создана до появления новых таблиц
+        database.init_db()
+
+        conn = sqlite3.connect(self.path, uri=mode == "memory")
+        self.users = conn.execute("SELECT MAX(user_id) FROM users").fetchone()[0]
+        self.drivers = [row[0] for row in conn.execute("SELECT user_id FROM users WHERE display_name IS NOT NULL")]
+        self.first_passenger = len(self.drivers) + 1
+        self.routes = conn.execute("SELECT MAX(id) FROM routes").fetchone()[0]
+        self.active = conn.execute("SELECT id, user_id FROM routes WHERE is_active = 1").fetchall()
+        self.requests = conn.execute("SELECT MAX(id) FROM requests").fetchone()[0]
+        self.pending = [row[0] for row in conn.execute('''
+            SELECT q.id FROM requests q JOIN routes r ON r.id = q.route_id
+            WHERE q.status = 'pending' AND r.is_active = 1
+        ''')]
+        self.chats = conn.execute("SELECT MAX(id) FROM chats").fetchone()[0] or 1
+        self.cards = conn.execute("SELECT chat_id, message_id FROM displayed_cards LIMIT 10000").fetchall()
+        conn.close()
+        self.new_ids = itertools.count(self.users + 1)
+        self.message_ids = itertools.count(10 ** 7)
+
+    def close(self) -> None:
+        if self._anchor is not None:
+            self._anchor.close()
+            self._anchor = None
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+
+# ==== Сценарии ===============================================================
+
+# Аргументы вызова: функция (ws, rnd) -> (args, kwargs)
+Case = Callable[[Workspace, random.Random], Tuple[tuple, dict]]
+
+def _user(ws, rnd):
+    return rnd.randint(1, ws.users)
+
+def _driver(ws, rnd):
+    return rnd.choice(ws.drivers)
+
+def _passenger(ws, rnd):
+    return rnd.randint(ws.first_passenger, ws.users)
+
+def _route(ws, rnd):
+    return rnd.randint(1, ws.routes)
+
+def _active(ws, rnd):
+    return rnd.choice(ws.active)[0] if ws.active else _route(ws, rnd)
+
+def _request(ws, rnd):
+    return rnd.randint(1, ws.requests)
+
+def _pending(ws, rnd):
+    # Каждая заявка принимается один раз, дальше - уже решённые
+    return ws.pending.pop() if ws.pending else _request(ws, rnd)
+
+def _search(ws, rnd):
+    from_loc, to_loc = pick_pair(rnd)
+    return (), {"from_loc": from_loc, "to_loc": to_loc, "viewer_id": _passenger(ws, rnd)}
+
+def _decide(ws, rnd):
+    route_id, driver_id = rnd.choice(ws.active)
+    return (route_id, driver_id), {"accept_limit": 1, "reject_rest": False}
+
+def _ago(**delta) -> str:
+    return (datetime.now() - timedelta(**delta)).isoformat()
+
+CASES: Dict[str, Case] = {
+    "is_valid_telegram_username": lambda ws, rnd: ((f"user{_user(ws, rnd)}",), {}),
+    "init_db": lambda ws, rnd: ((), {}),
+    "get_user_by_id": lambda ws, rnd: ((_user(ws, rnd),), {}),
+    "create_user": lambda ws, rnd: ((_user(ws, rnd), None), {}),
+    "update_usernames": lambda ws, rnd: (([(_passenger(ws, rnd), f"renamed{n}") for n in range(10)],), {}),
+    "create_route": lambda ws, rnd: ((_driver(ws, rnd), *pick_pair(rnd), "01.01.2030", "08:00", 300, 3, ""), {}),
+    "search_routes": _search,
+    "get_route_by_id": lambda ws, rnd: ((_route(ws, rnd),), {}),
+    "get_user_routes": lambda ws, rnd: ((_driver(ws, rnd),), {}),
+    "get_card_route": lambda ws, rnd: ((_active(ws, rnd),), {"viewer_id": _passenger(ws, rnd)}),
+    "get_route_request_statuses": lambda ws, rnd: ((_active(ws, rnd),), {}),
+    "create_or_get_request": lambda ws, rnd: ((_active(ws, rnd), _passenger(ws, rnd)), {}),
+    "book_seat": lambda ws, rnd: ((_active(ws, rnd), _passenger(ws, rnd)), {}),
+    "create_request": lambda ws, rnd: ((_active(ws, rnd), _passenger(ws, rnd)), {}),
+    "get_route_requests": lambda ws, rnd: ((_active(ws, rnd),), {}),
+    "update_request_status": lambda ws, rnd: ((_request(ws, rnd), "rejected"), {}),
+    "accept_request": lambda ws, rnd: ((_pending(ws, rnd),), {}),
+    "decide_pending_requests": _decide,
+    "get_request_by_id": lambda ws, rnd: ((_request(ws, rnd),), {}),
+    "get_user_trips": lambda ws, rnd: ((_passenger(ws, rnd),), {}),
+    "cancel_trip_request": lambda ws, rnd: ((_request(ws, rnd), _passenger(ws, rnd)), {}),
+    "join_waitlist": lambda ws, rnd: ((_active(ws, rnd), _passenger(ws, rnd)), {}),
+    "get_waitlist_size": lambda ws, rnd: ((_active(ws, rnd),), {}),
+    "promote_waitlist": lambda ws, rnd: ((_active(ws, rnd),), {}),
+    "cancel_route": lambda ws, rnd: ((_route(ws, rnd),), {}),
+    "update_route": lambda ws, rnd: ((_route(ws, rnd),), {"price": rnd.randrange(100, 1000, 50)}),
+    "create_chat": lambda ws, rnd: ((_request(ws, rnd), _driver(ws, rnd), _passenger(ws, rnd)), {}),
+    "get_chat_by_request": lambda ws, rnd: ((_request(ws, rnd),), {}),
+    "save_message": lambda ws, rnd: ((rnd.randint(1, ws.chats), _user(ws, rnd), "Выезжаю"), {}),
+    "get_chat_messages": lambda ws, rnd: ((rnd.randint(1, ws.chats),), {}),
+    "get_user_profile": lambda ws, rnd: ((_user(ws, rnd),), {}),
+    "update_user_profile": lambda ws, rnd: ((_driver(ws, rnd),), {"bio": "Езжу по будням"}),
+    "delete_user": lambda ws, rnd: ((next(ws.new_ids),), {}),
+    "get_digest_requests": lambda ws, rnd: (([_request(ws, rnd) for _ in range(10)],), {}),
+    "get_passenger_request_status": lambda ws, rnd: ((_active(ws, rnd), _passenger(ws, rnd)), {}),
+    "update_request_card_info": lambda ws, rnd: ((_request(ws, rnd), _passenger(ws, rnd), next(ws.message_ids)), {}),
+    "register_displayed_cards": lambda ws, rnd: (([
+        (_active(ws, rnd), _passenger(ws, rnd), next(ws.message_ids), 0, "search", "x") for _ in range(10)
+    ],), {}),
+    "get_displayed_cards": lambda ws, rnd: ((_active(ws, rnd), _ago(days=1)), {}),
+    "update_displayed_card_hash": lambda ws, rnd: ((*rnd.choice(ws.cards), "y"), {}),
+    "delete_displayed_card": lambda ws, rnd: (rnd.choice(ws.cards), {}),
+    "delete_expired_displayed_cards": lambda ws, rnd: ((_ago(days=30),), {}),
+    "get_card_requests_after": lambda ws, rnd: ((_request(ws, rnd), 100), {}),
+    "get_card_job": lambda ws, rnd: (("bench",), {}),
+    "start_card_job": lambda ws, rnd: (("bench",), {}),
+    "save_card_job_progress": lambda ws, rnd: (("bench", _request(ws, rnd), 10, 5, 0), {}),
+    "add_scheduled_job": lambda ws, rnd: (("bench", time.time() + rnd.randint(0, 3600), {"n": 1}), {}),
+    "get_due_jobs": lambda ws, rnd: ((time.time() + 30, time.time()), {}),
+    "claim_scheduled_job": lambda ws, rnd: ((rnd.randint(1, 100), time.time(), 60), {}),
+    "finish_scheduled_job": lambda ws, rnd: ((rnd.randint(1, 100),), {}),
+    "retry_scheduled_job": lambda ws, rnd: ((rnd.randint(1, 100), time.time() + 60, "bench"), {}),
+    "release_scheduled_job": lambda ws, rnd: ((rnd.randint(1, 100),), {}),
+    "count_scheduled_jobs": lambda ws, rnd: ((), {}),
+    "delete_finished_jobs": lambda ws, rnd: ((_ago(days=7),), {}),
+    "expire_routes": lambda ws, rnd: ((datetime.now(),), {}),
+    "get_departing_routes": lambda ws, rnd: ((datetime.now(), datetime.now() + timedelta(hours=2)), {}),
+    # VACUUM не выполняется: только PRAGMA optimize и сброс WAL
+    "optimize_database": lambda ws, rnd: ((1.0,), {}),
+}
+
+def public_functions() -> List[str]:
+    return [name for name, function in vars(database).items()
+            if not name.startswith("_") and inspect.isfunction(function)
+            and function.__module__ == database.__name__ and name not in SKIPPED]
+
+# ==== Замер ==================================================================
+
+def measure(name: str, ws: Workspace, rnd: random.Random, seconds: float, max_ops: int) -> Dict[str, Any]:
+    function = getattr(database, name)
+    case = CASES[name]
+    # Свой профайлер на функцию: планы её запросов -> просмотренные целиком таблицы
+    db_profiler.PROFILER = db_profiler.QueryProfiler(float("inf"), config.DB_HOT_TABLES, explain=True)
+    args, kwargs = case(ws, rnd)
+    function(*args, **kwargs)  # прогрев и планы
+
+    times = []
+    with db_profiler.count_queries() as queries:
+        deadline = time.perf_counter() + seconds
+        while len(times) < max_ops and (len(times) < MIN_OPS or time.perf_counter() < deadline):
+            args, kwargs = case(ws, rnd)
+            started = time.perf_counter()
+            function(*args, **kwargs)
+            times.append(time.perf_counter() - started)
+
+    peak = retained = 0
+    tracemalloc.start()
+    try:
+        for _ in range(ALLOC_CALLS):
+            args, kwargs = case(ws, rnd)
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            function(*args, **kwargs)
+            current, call_peak = tracemalloc.get_traced_memory()
+            peak = max(peak, call_peak - before)
+            retained += current - before
+    finally:
+        tracemalloc.stop()
+
+    scans = sorted({table for sql, plan in db_profiler.PROFILER.plans.items()
+                    for table in db_profiler.scanned_tables(sql, plan)})
+    total = sum(times)
+    return {
+        "function": name,
+        "ops": len(times),
+        "ops_per_sec": round(len(times) / total, 1) if total else 0.0,
+        "mean_us": round(total / len(times) * 1e6, 1),
+        "p95_us": round(_percentile(times, 95) * 1e6, 1),
+        "queries_per_call": round(queries[0] / len(times), 2),
+        "peak_kb": round(peak / 1024, 1),
+        "retained_kb": round(retained / ALLOC_CALLS / 1024, 2),
+        "full_scans": scans,
+    }
+
+def run(scales: List[str], modes: List[str], only: List[str], seconds: float, max_ops: int,
+        cache_dir: str, seed: int) -> Dict[str, Any]:
+    names = [name for name in public_functions() if not only or name in only]
+    missing = [name for name in names if name not in CASES]
+    profiler = db_profiler.PROFILER
+    results = []
+    tmp_dir = tempfile.mkdtemp(prefix="poputchik_dbbench_")
+    try:
+        for scale in scales:
+            source = fixture(scale, cache_dir, seed)
+            for mode in modes:
+                for name in names:
+                    if name in missing:
+                        continue
+                    # Свежая копия на функцию: записи одной функции не меняют замер следующей
+                    ws = Workspace(source, mode, tmp_dir, f"{scale}_{mode}")
+                    try:
+                        row = measure(name, ws, random.Random(seed), seconds, max_ops)
+                    finally:
+                        ws.close()
+                    row.update(scale=scale, mode=mode)
+                    results.append(row)
+                    logging.info(f"{scale}/{mode} {name}: {row['ops_per_sec']} оп/с")
+    finally:
+        db_profiler.PROFILER = profiler
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "sqlite": sqlite3.sqlite_version,
+        "params": {"scales": scales, "modes": modes, "seconds": seconds, "max_ops": max_ops, "seed": seed},
+        "missing": missing,
+        "results": results,
+    }
+
+# ==== Вывод ==================================================================
+
+def _key(row: Dict[str, Any]) -> Tuple[str, str, str]:
+    return row["scale"], row["mode"], row["function"]
+
+def compare(result: Dict[str, Any], previous: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Отношение ops/sec и разница запросов на вызов к предыдущему прогону"""
+    old = {_key(row): row for row in previous.get("results", [])}
+    rows = []
+    for row in result["results"]:
+        before = old.get(_key(row))
+        if before is None or not before["ops_per_sec"]:
+            continue
+        rows.append({
+            "scale": row["scale"],
+            "mode": row["mode"],
+            "function": row["function"],
+            "speedup": round(row["ops_per_sec"] / before["ops_per_sec"], 2),
+            "queries_delta": round(row["queries_per_call"] - before["queries_per_call"], 2),
+            "full_scans_before": before["full_scans"],
+            "full_scans": row["full_scans"],
+        })
+    return rows
+
+def _print_table(result: Dict[str, Any]) -> None:
+    width = max([len(row["function"]) for row in result["results"]] + [8])
+    header = (f"{'scale':<5} {'mode':<6} {'function':<{width}} {'ops/s':>10} {'p95 us':>10} "
+              f"{'q/call':>7} {'peak KB':>8}  full scans")
+    print(header)
+    print("-" * len(header))
+    for row in result["results"]:
+        print(f"{row['scale']:<5} {row['mode']:<6} {row['function']:<{width}} {row['ops_per_sec']:>10.1f} "
+              f"{row['p95_us']:>10.1f} {row['queries_per_call']:>7.2f} {row['peak_kb']:>8.1f}  "
+              f"{', '.join(row['full_scans']) or '-'}")
+    if result["missing"]:
+        print(f"\nНет сценария в CASES: {', '.join(result['missing'])}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Микробенчмарк функций database.py")
+    parser.add_argument("--scale", action="append", choices=sorted(SCALES), help="размер (можно несколько), по умолчанию 1k")
+    parser.add_argument("--mode", action="append", choices=MODES, help="file / memory (по умолчанию оба)")
+    parser.add_argument("--only", action="append", default=[], help="только эта функция (можно несколько)")
+    parser.add_argument("--seconds", type=float, default=0.5, help="время замера на функцию")
+    parser.add_argument("--max-ops", type=int, default=2000, help="не больше вызовов на функцию")
+    parser.add_argument("--fixtures", default=os.path.join(tempfile.gettempdir(), "poputchik_db_fixtures"),
+                        help="папка кеша фикстур")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", default="", help="записать результат в JSON-файл ('-' - в stdout)")
+    parser.add_argument("--compare", default="", help="JSON предыдущего прогона для сравнения")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    result = run(args.scale or ["1k"], args.mode or list(MODES), args.only, args.seconds, args.max_ops,
+                 args.fixtures, args.seed)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            result["compare"] = compare(result, json.load(f))
+
+    if args.json == "-":
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        _print_table(result)
+        for row in result.get("compare", []):
+            print(f"{row['scale']:<5} {row['mode']:<6} {row['function']}: x{row['speedup']}"
+                  f" (запросов {row['queries_delta']:+}), просмотры {row['full_scans_before']} -> {row['full_scans']}")
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,234 @@
+# coding: utf-8
+"""
+Локальная заглушка Telegram Bot API для бенчмарков и нагрузочных тестов.
+Отвечает правдоподобными ответами на методы, которые вызывает бот,
+и считает вызовы по методам.
+
+Бот направляется на заглушку через TELEGRAM_API_URL=http://127.0.0.1:8081
+и может работать в обоих режимах:
+- webhook: обновления шлёт сам бенчмарк;
+- polling: getUpdates отдаёт очередь обновлений (long polling с timeout),
+  обновления добавляются через POST /_updates (объект или список) или push_update().
+
+Неисправности для проверки устойчивости (все по умолчанию выключены):
+- latency_ms / jitter_ms - задержка каждого ответа;
+- flood_rate - доля ответов 429 "Too Many Requests" с retry_after;
+- error_rate - доля ответов 5xx.
+429 и 5xx получают только методы из fault_methods (отправка, правка, ответы
+на кнопки) - getMe, getUpdates и установка webhook работают всегда.
+Настройки меняются на ходу: POST /_config с JSON тех же полей.
+
+Служебные адреса: GET /_stats - вызовы по методам, GET /_faults - выданные
+ошибки, POST /_updates - добавить обновления, POST /_config - настройки.
+"""
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+BOT_USER = {"id": 1000000001, "is_bot": True, "first_name": "Попутчик", "username": "fake_poputchik_bot"}
+
+# Методы, которым достаются 429 и 5xx
+FAULT_METHODS = frozenset({
+    "sendmessage", "sendphoto", "editmessagetext", "editmessagecaption",
+    "editmessagereplymarkup", "deletemessage", "answercallbackquery",
+})
+
+# Поля, которые можно менять через POST /_config
+_SETTINGS = ("latency_ms", "jitter_ms", "flood_rate", "retry_after", "error_rate", "error_status")
+
+class FakeBotAPI:
+    """Заглушка Bot API: POST /bot<token>/<method>"""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, flood_rate: float = 0.0,
+                 retry_after: int = 1, error_rate: float = 0.0, error_status: int = 502,
+                 fault_methods=FAULT_METHODS, seed: Optional[int] = None) -> None:
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.fault_methods = frozenset(fault_methods)
+        self.calls = Counter()
+        self.faults = Counter()
+        self._random = random.Random(seed)
+        self._message_ids = itertools.count(100000)
+        self._update_ids = itertools.count(1)
+        self._updates: List[Dict[str, Any]] = []
+        self._updates_added: Optional[asyncio.Condition] = None
+
+    # ---- Обновления для getUpdates ------------------------------------------
+
+    def _condition(self) -> asyncio.Condition:
+        if self._updates_added is None:
+            self._updates_added = asyncio.Condition()
+        return self._updates_added
+
+    async def push_update(self, update: Dict[str, Any]) -> int:
+        """Ставит обновление в очередь getUpdates (update_id перенумеровывается по порядку)"""
+        update = dict(update, update_id=next(self._update_ids))
+        async with self._condition():
+            self._updates.append(update)
+            self._condition().notify_all()
+        return update["update_id"]
+
+    @property
+    def pending_updates(self) -> int:
+        return len(self._updates)
+
+    async def _get_updates(self, form: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(form.get("offset") or 0)
+        limit = min(int(form.get("limit") or 100), 100)
+        timeout = float(form.get("timeout") or 0)
+        condition = self._condition()
+        async with condition:
+            # offset подтверждает всё, что меньше него
+            if offset:
+                self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            if not self._updates and timeout > 0:
+                try:
+                    await asyncio.wait_for(condition.wait_for(lambda: bool(self._updates)), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            return self._updates[:limit]
+
+    # ---- Ответы -------------------------------------------------------------
+
+    def _message(self, form: Dict[str, Any], message_id: int = None) -> Dict[str, Any]:
+        chat_id = form.get("chat_id", 0)
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        message = {
+            "message_id": message_id or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+        }
+        if "text" in form:
+            message["text"] = form["text"]
+        if "caption" in form:
+            message["caption"] = form["caption"]
+        return message
+
+    async def _result(self, method: str, form: Dict[str, Any]) -> Any:
+        if method == "getme":
+            return BOT_USER
+        if method == "getupdates":
+            return await self._get_updates(form)
+        if method == "sendmessage":
+            return self._message(form)
+        if method == "sendphoto":
+            message = self._message(form)
+            file_id = f"fake-photo-{message['message_id']}"
+            message["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 640, "height": 480}]
+            return message
+        if method in ("editmessagetext", "editmessagecaption", "editmessagereplymarkup"):
+            if "inline_message_id" in form:
+                return True
+            return self._message(form, message_id=int(form.get("message_id", 0)))
+        # answerCallbackQuery, deleteMessage, setWebhook, deleteWebhook и прочее
+        return True
+
+    def _fault(self, method: str) -> Optional[web.Response]:
+        if method not in self.fault_methods:
+            return None
+        if self.flood_rate and self._random.random() < self.flood_rate:
+            self.faults[f"{method}:429"] += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.faults[f"{method}:{self.error_status}"] += 1
+            return web.json_response({
+                "ok": False, "error_code": self.error_status, "description": "Bad Gateway",
+            }, status=self.error_status)
+        return None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        form = dict(await request.post())
+        self.calls[method] += 1
+        delay = self.latency_ms + (self._random.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        fault = self._fault(method)
+        if fault is not None:
+            return fault
+        return web.json_response({"ok": True, "result": await self._result(method, form)})
+
+    # ---- Служебные адреса ---------------------------------------------------
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(dict(self.calls))
+
+    async def handle_faults(self, request: web.Request) -> web.Response:
+        return web.json_response(dict(self.faults))
+
+    async def handle_push(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        ids = [await self.push_update(update) for update in (body if isinstance(body, list) else [body])]
+        return web.json_response({"queued": len(ids), "update_ids": ids, "pending": self.pending_updates})
+
+    async def handle_config(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        for name in _SETTINGS:
+            if name in body:
+                setattr(self, name, type(getattr(self, name))(body[name]))
+        return web.json_response({name: getattr(self, name) for name in _SETTINGS})
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.router.add_get("/_stats", self.handle_stats)
+        app.router.add_get("/_faults", self.handle_faults)
+        app.router.add_post("/_updates", self.handle_push)
+        app.router.add_post("/_config", self.handle_config)
+        return app
+
+async def start_fake_api(host: str = "127.0.0.1", port: int = 8081, **settings):
+    """Запускает заглушку в текущем event loop. Возвращает (api, runner).
+    settings - параметры FakeBotAPI (latency_ms, flood_rate, ...)"""
+    api = FakeBotAPI(**settings)
+    runner = web.AppRunner(api.create_app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return api, runner
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Заглушка Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="задержка каждого ответа")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="случайная добавка к задержке, 0..N мс")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after в ответах 429, секунды")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 5xx")
+    parser.add_argument("--error-status", type=int, default=502, help="код ответов с ошибкой")
+    parser.add_argument("--updates", default="", help="JSONL с обновлениями для очереди getUpdates")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    api = FakeBotAPI(args.latency_ms, args.jitter_ms, args.flood_rate, args.retry_after,
+                     args.error_rate, args.error_status, seed=args.seed)
+    app = api.create_app()
+    if args.updates:
+        async def _load_updates(app: web.Application) -> None:
+            with open(args.updates, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        await api.push_update(json.loads(line))
+        app.on_startup.append(_load_updates)
+    web.run_app(app, host=args.host, port=args.port)
@@ -0,0 +1,217 @@
+# coding: utf-8
+"""
+Воспроизведение журнала обновлений (update_recorder.py, UPDATE_RECORD_FILE)
+через Dispatcher бота на заглушке Bot API и копии БД.
+
+Скорость: --speed 1 - с исходными интервалами между обновлениями, --speed N -
+в N раз быстрее, --speed max - без пауз. Паузы дольше --max-gap (например,
+между перезапусками бота) сокращаются до --max-gap. Обновления подаются в
+порядке журнала и не ждут обработки предыдущих, как при доставке Telegram;
+одновременно обрабатывается не больше --concurrency. С --concurrency 1 и
+--speed max прогон детерминирован: тот же журнал - те же запросы к БД и Bot API.
+
+Отчёт: обновлений в секунду, задержка обработки p50/p95/p99, отставание
+от расписания, ошибки, вызовы Bot API и счётчики запросов БД.
+
+В журнале ID пользователей и чатов - псевдонимы (HMAC с UPDATE_RECORD_SALT),
+поэтому в копии БД (--db) ID и username заменяются теми же псевдонимами:
+иначе журнал не совпадёт с владельцами маршрутов и заявок. Соль - та же,
+что при записи (--salt, по умолчанию UPDATE_RECORD_SALT); для журнала
+с настоящими ID - --keep-ids.
+
+Запуск из корня проекта:
+    python -m bench.replay updates.jsonl.gz --speed 1
+    python -m bench.replay updates.jsonl.gz --speed 10 --db poputchik.db --salt "$UPDATE_RECORD_SALT"
+    python -m bench.replay updates.jsonl.gz --speed max --concurrency 1
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import config
+import database
+import db_profiler
+import main
+from bench.fake_bot_api import start_fake_api
+from update_recorder import UpdateRecorder, read_journal
+
+# Колонки с Telegram ID пользователей и чатов
+_ID_COLUMNS = {
+    "users": ("user_id",),
+    "routes": ("user_id",),
+    "requests": ("passenger_id", "card_chat_id"),
+    "waitlist": ("passenger_id",),
+    "chats": ("driver_id", "passenger_id"),
+    "messages": ("sender_id",),
+    "displayed_cards": ("chat_id", "viewer_id"),
+}
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+def schedule(records: List[Dict[str, Any]], speed: Optional[float], max_gap: float) -> List[float]:
+    """Момент подачи каждого обновления от начала прогона, секунды"""
+    offsets = []
+    offset = 0.0
+    previous = None
+    for record in records:
+        ts = record.get("ts")
+        if speed and ts is not None and previous is not None:
+            offset += min(max(ts - previous, 0.0), max_gap) / speed
+        if ts is not None:
+            previous = ts
+        offsets.append(offset)
+    return offsets
+
+def pseudonymize_database(path: str, salt: str) -> None:
+    """ID и username в БД - псевдонимы, как в журнале, записанном с солью salt"""
+    recorder = UpdateRecorder("", salt)
+    conn = sqlite3.connect(path)
+    conn.create_function("pseudonym", 1, lambda value: None if value is None else recorder.pseudonym(value))
+    conn.create_function("username_alias", 1, lambda value: value and recorder.username_alias(value))
+    with conn:
+        for table, columns in _ID_COLUMNS.items():
+            assignments = ", ".join(f"{column} = pseudonym({column})" for column in columns)
+            conn.execute(f"UPDATE {table} SET {assignments}")
+        conn.execute("UPDATE users SET tg_username = username_alias(tg_username)")
+    conn.close()
+
+async def run(path: str, speed: Optional[float], db_path: str, concurrency: int, max_gap: float,
+              limit: int, api_port: int, seed: int, salt: str = "", keep_ids: bool = False) -> Dict[str, Any]:
+    random.seed(seed)
+    records = list(read_journal(path))
+    if limit:
+        records = records[:limit]
+
+    # Копия БД: воспроизведение не должно трогать исходную
+    tmp_dir = tempfile.mkdtemp(prefix="poputchik_replay_")
+    database.DATABASE_NAME = os.path.join(tmp_dir, "replay.db")
+    if db_path:
+        shutil.copyfile(db_path, database.DATABASE_NAME)
+        database.init_db()
+        if keep_ids:
+            pass
+        elif salt:
+            pseudonymize_database(database.DATABASE_NAME, salt)
+        else:
+            logging.warning("⚠️ Соль журнала не задана (--salt): ID в журнале не совпадут с ID в копии БД")
+    else:
+        database.init_db()
+
+    fake_api, api_runner = await start_fake_api(port=api_port)
+    config.TELEGRAM_API_URL = f"http://127.0.0.1:{api_port}"
+    config.METRICS_PORT = 0
+    config.SCHEDULER_ENABLED = False
+    config.UPDATE_RECORD_FILE = ""
+
+    bot = main.create_bot()
+    dp = main.create_dispatcher()
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+
+    offsets = schedule(records, speed, max_gap)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    lags: List[float] = []
+    errors: Counter = Counter()
+    types: Counter = Counter()
+    statements_before = db_profiler.PROFILER.statements
+
+    async def feed(update: Dict[str, Any], due: float) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            lags.append(max(started - due, 0.0))
+            try:
+                await dp.feed_raw_update(bot, update)
+            except Exception as e:
+                errors[type(e).__name__] += 1
+                logging.warning(f"Ошибка обновления {update.get('update_id')}: {type(e).__name__}: {e}")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    tasks = []
+    for record, offset in zip(records, offsets):
+        due = started + offset
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        update = record["update"]
+        types[next((key for key in update if key != "update_id"), "unknown")] += 1
+        task = asyncio.create_task(feed(update, due))
+        tasks.append(task)
+        if concurrency == 1:
+            # Строгий порядок: следующее обновление - только после предыдущего
+            await task
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    await dp.emit_shutdown(bot=bot, dispatcher=dp)
+    await bot.session.close()
+    await api_runner.cleanup()
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return {
+        "journal": path,
+        "speed": speed or "max",
+        "concurrency": concurrency,
+        "updates": len(records),
+        "update_types": dict(types),
+        "recorded_span_sec": round(offsets[-1] * (speed or 1), 3) if offsets and speed else None,
+        "elapsed_sec": round(elapsed, 3),
+        "updates_per_sec": round(len(records) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(_percentile(latencies, 50) * 1000, 2),
+            "p95": round(_percentile(latencies, 95) * 1000, 2),
+            "p99": round(_percentile(latencies, 99) * 1000, 2),
+            "max": round(max(latencies) * 1000, 2) if latencies else 0.0,
+        },
+        "schedule_lag_ms": {
+            "p95": round(_percentile(lags, 95) * 1000, 2),
+            "max": round(max(lags) * 1000, 2) if lags else 0.0,
+        },
+        "errors": dict(errors),
+        "db_queries": db_profiler.PROFILER.statements - statements_before,
+        "bot_api_calls": dict(fake_api.calls),
+    }
+
+def _speed(value: str) -> Optional[float]:
+    if value == "max":
+        return None
+    speed = float(value)
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("скорость должна быть больше 0 или max")
+    return speed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Воспроизведение записанных обновлений")
+    parser.add_argument("path", help="журнал (.jsonl.gz из UPDATE_RECORD_FILE или JSONL с обновлениями)")
+    parser.add_argument("--speed", type=_speed, default=1.0, help="1, N (в N раз быстрее) или max")
+    parser.add_argument("--db", default="", help="БД, копия которой используется (по умолчанию - пустая)")
+    parser.add_argument("--salt", default=config.UPDATE_RECORD_SALT,
+                        help="UPDATE_RECORD_SALT, с которой записан журнал (для ID в копии БД)")
+    parser.add_argument("--keep-ids", action="store_true",
+                        help="не заменять ID в копии БД (журнал с настоящими ID)")
+    parser.add_argument("--concurrency", type=int, default=config.MAX_IN_FLIGHT_UPDATES,
+                        help="одновременно обрабатываемых обновлений")
+    parser.add_argument("--max-gap", type=float, default=5.0, help="самая длинная пауза между обновлениями, с")
+    parser.add_argument("--limit", type=int, default=0, help="только первые N обновлений")
+    parser.add_argument("--api-port", type=int, default=8081, help="порт заглушки Bot API")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    result = asyncio.run(run(args.path, args.speed, args.db, args.concurrency, args.max_gap,
+                             args.limit, args.api_port, args.seed, args.salt, args.keep_ids))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
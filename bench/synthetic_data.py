@@ -0,0 +1,204 @@
+# coding: utf-8
+"""
+Генератор синтетической БД для бенчмарков: пользователи, водители с профилями,
+маршруты по реальным направлениям (Москва, Тверь и область) и заявки пассажиров.
+
+Как в живой базе, почти все маршруты - прошедшие (is_active = 0), активных -
+active_share от общего числа: поиск показывает карточку на каждый активный
+маршрут, поэтому их доля важнее общего размера таблицы.
+
+Запуск из корня проекта:
+    python -m bench.synthetic_data bench.db --scale small
+    python -m bench.synthetic_data bench.db --routes 100000 --requests 1000000
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List, Tuple
+
+import database
+
+# Направление -> относительная частота (в обе стороны)
+CITY_PAIRS: List[Tuple[Tuple[str, str], int]] = [
+    (("Москва", "Тверь"), 30),
+    (("Тверь", "Москва"), 30),
+    (("Москва", "Клин"), 12),
+    (("Клин", "Москва"), 12),
+    (("Тверь", "Конаково"), 10),
+    (("Конаково", "Тверь"), 10),
+    (("Тверь", "Торжок"), 8),
+    (("Торжок", "Тверь"), 8),
+    (("Тверь", "Ржев"), 6),
+    (("Ржев", "Тверь"), 6),
+    (("Москва", "Дубна"), 6),
+    (("Дубна", "Москва"), 6),
+    (("Тверь", "Кимры"), 5),
+    (("Кимры", "Тверь"), 5),
+    (("Тверь", "Вышний Волочёк"), 5),
+    (("Вышний Волочёк", "Тверь"), 5),
+    (("Москва", "Зеленоград"), 5),
+    (("Зеленоград", "Москва"), 5),
+    (("Тверь", "Санкт-Петербург"), 4),
+    (("Санкт-Петербург", "Тверь"), 4),
+    (("Москва", "Санкт-Петербург"), 4),
+    (("Санкт-Петербург", "Москва"), 4),
+    (("Тверь", "Бологое"), 3),
+    (("Бологое", "Тверь"), 3),
+    (("Клин", "Тверь"), 3),
+    (("Тверь", "Клин"), 3),
+]
+
+# Готовые размеры: пользователи, маршруты, заявки
+SCALES: Dict[str, Dict[str, int]] = {
+    "small": {"users": 2_000, "routes": 5_000, "requests": 50_000},
+    "medium": {"users": 20_000, "routes": 20_000, "requests": 200_000},
+    "full": {"users": 100_000, "routes": 100_000, "requests": 1_000_000},
+}
+
+DRIVER_SHARE = 0.2
+INSTANT_BOOKING_SHARE = 0.1
+COMMENTS = ["", "", "", "Без животных", "Багаж небольшой", "Выезд от вокзала", "Можно с детьми"]
+
+# Статусы заявок: у прошедших маршрутов заявки уже решены, у активных в основном ждут
+_PAST_STATUSES = (("accepted", 45), ("rejected", 20), ("cancelled", 35))
+_ACTIVE_STATUSES = (("pending", 60), ("accepted", 25), ("rejected", 10), ("cancelled", 5))
+
+_PAIRS = [pair for pair, _ in CITY_PAIRS]
+_PAIR_WEIGHTS = [weight for _, weight in CITY_PAIRS]
+
+def pick_pair(rnd: random.Random) -> Tuple[str, str]:
+    """Случайное направление с частотами CITY_PAIRS"""
+    return rnd.choices(_PAIRS, _PAIR_WEIGHTS)[0]
+
+def _pick_status(rnd: random.Random, statuses) -> str:
+    return rnd.choices([s for s, _ in statuses], [w for _, w in statuses])[0]
+
+def _chunks(rows: Iterator[tuple], size: int = 10000) -> Iterator[List[tuple]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def generate(path: str, users: int = 2_000, routes: int = 5_000, requests: int = 50_000,
+             active_share: float = 0.01, seed: int = 42) -> Dict[str, Any]:
+    """Создаёт БД path со схемой database.init_db и заполняет её. Возвращает сводку"""
+    started = time.perf_counter()
+    rnd = random.Random(seed)
+    if os.path.exists(path):
+        os.remove(path)
+    database.DATABASE_NAME = path
+    database.init_db()
+
+    drivers = max(1, int(users * DRIVER_SHARE))
+    passengers = list(range(drivers + 1, users + 1)) or [1]
+    active_routes = min(routes, max(1, int(routes * active_share))) if routes else 0
+    now = datetime.now()
+    today = date.today()
+    # Маршруты создавались равномерно за последние два года, id растёт со временем
+    history = timedelta(days=730)
+    step = history / max(routes, 1)
+
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA synchronous = OFF")
+
+    def user_rows():
+        for user_id in range(1, users + 1):
+            created = (now - history - timedelta(days=rnd.randint(1, 60))).isoformat()
+            if user_id <= drivers:
+                yield (user_id, f"user{user_id}", created, f"Водитель {user_id}", "Езжу каждый день", 1,
+                       int(rnd.random() < 0.1))
+            else:
+                yield (user_id, f"user{user_id}", created, None, None, 1, 0)
+
+    for chunk in _chunks(user_rows()):
+        cursor.executemany('''
+            INSERT INTO users (user_id, tg_username, created_at, display_name, bio, is_active, notify_digest)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', chunk)
+
+    route_info: List[Tuple[bool, datetime]] = []
+
+    def route_rows():
+        for n in range(routes):
+            created = now - history + step * n
+            active = n >= routes - active_routes
+            if active:
+                trip_day = today + timedelta(days=rnd.randint(1, 30))
+            else:
+                trip_day = min(created.date() + timedelta(days=rnd.randint(0, 7)), today - timedelta(days=1))
+            route_info.append((active, created))
+            from_loc, to_loc = pick_pair(rnd)
+            yield (
+                rnd.randint(1, drivers), from_loc, to_loc, trip_day.strftime("%d.%m.%Y"),
+                f"{rnd.randint(5, 22):02d}:{rnd.choice((0, 15, 30, 45)):02d}",
+                rnd.randrange(100, 1550, 50), rnd.randint(1, 4), rnd.choice(COMMENTS),
+                int(active), created.isoformat(), int(rnd.random() < INSTANT_BOOKING_SHARE),
+            )
+
+    for chunk in _chunks(route_rows()):
+        cursor.executemany('''
+            INSERT INTO routes (user_id, from_location, to_location, date_dmy, time_hm,
+                                price, seats, comment, is_active, created_at, instant_booking)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', chunk)
+
+    # Заявки распределяются по маршрутам случайно, пассажиры у маршрута не повторяются
+    per_route = Counter(rnd.choices(range(routes), k=requests)) if routes else Counter()
+    statuses: Counter = Counter()
+
+    def request_rows():
+        for index in sorted(per_route):
+            active, created = route_info[index]
+            count = min(per_route[index], len(passengers))
+            for passenger_id in rnd.sample(passengers, count):
+                status = _pick_status(rnd, _ACTIVE_STATUSES if active else _PAST_STATUSES)
+                statuses[status] += 1
+                requested = created + timedelta(minutes=rnd.randint(1, 60 * 24))
+                yield (index + 1, passenger_id, status, requested.isoformat())
+
+    for chunk in _chunks(request_rows()):
+        cursor.executemany('''
+            INSERT INTO requests (route_id, passenger_id, status, created_at) VALUES (?, ?, ?, ?)
+        ''', chunk)
+
+    conn.commit()
+    conn.close()
+    return {
+        "path": path,
+        "users": users,
+        "drivers": drivers,
+        "routes": routes,
+        "active_routes": active_routes,
+        "requests": sum(statuses.values()),
+        "request_statuses": dict(statuses),
+        "seed": seed,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Синтетическая БД для бенчмарков")
+    parser.add_argument("path", help="файл БД (будет пересоздан)")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small", help="готовый размер")
+    parser.add_argument("--users", type=int, help="пользователей (вместо размера из --scale)")
+    parser.add_argument("--routes", type=int, help="маршрутов")
+    parser.add_argument("--requests", type=int, help="заявок")
+    parser.add_argument("--active-share", type=float, default=0.01, help="доля активных маршрутов")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    sizes = dict(SCALES[args.scale])
+    for name in sizes:
+        if getattr(args, name) is not None:
+            sizes[name] = getattr(args, name)
+    print(json.dumps(generate(args.path, active_share=args.active_share, seed=args.seed, **sizes),
+                     ensure_ascii=False, indent=2))
@@ -0,0 +1,113 @@
+# coding: utf-8
+"""
+Сводка по файлу трасс (TRACE_FILE, см. tracing.py): для каждого имени спана -
+количество, p50/p95/p99/max и суммарное время; по желанию - разбор самых
+медленных обновлений по дочерним спанам.
+
+Запуск из корня проекта:
+    python -m bench.trace_report traces.jsonl
+    python -m bench.trace_report traces.jsonl --slowest 5 --json
+"""
+import argparse
+import json
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+def read_spans(path: str) -> Iterator[Dict[str, Any]]:
+    """Спаны из JSONL в формате OTLP JSON (строка - resourceSpans или один спан)"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if "resourceSpans" not in record:
+                yield record
+                continue
+            for resource in record["resourceSpans"]:
+                for scope in resource.get("scopeSpans", []):
+                    yield from scope.get("spans", [])
+
+def _duration_ms(span: Dict[str, Any]) -> float:
+    return (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e6
+
+def summarize(spans: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    durations: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    for span in spans:
+        durations[span["name"]].append(_duration_ms(span))
+        if span.get("status", {}).get("code") == 2:
+            errors[span["name"]] += 1
+    rows = []
+    for name, values in durations.items():
+        rows.append({
+            "name": name,
+            "count": len(values),
+            "errors": errors[name],
+            "p50_ms": round(_percentile(values, 50), 2),
+            "p95_ms": round(_percentile(values, 95), 2),
+            "p99_ms": round(_percentile(values, 99), 2),
+            "max_ms": round(max(values), 2),
+            "total_ms": round(sum(values), 1),
+        })
+    rows.sort(key=lambda row: row["total_ms"], reverse=True)
+    return rows
+
+def slowest_traces(spans: List[Dict[str, Any]], count: int) -> List[Dict[str, Any]]:
+    """Самые долгие корневые спаны и время их дочерних спанов по именам"""
+    by_trace: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    roots = []
+    for span in spans:
+        by_trace[span["traceId"]].append(span)
+        if not span.get("parentSpanId"):
+            roots.append(span)
+    roots.sort(key=_duration_ms, reverse=True)
+    result = []
+    for root in roots[:count]:
+        children: Dict[str, float] = defaultdict(float)
+        for span in by_trace[root["traceId"]]:
+            if span is not root:
+                children[span["name"]] += _duration_ms(span)
+        result.append({
+            "trace_id": root["traceId"],
+            "duration_ms": round(_duration_ms(root), 2),
+            "attributes": {a["key"]: next(iter(a["value"].values())) for a in root.get("attributes", [])},
+            "spans_ms": {name: round(ms, 2) for name, ms in sorted(children.items(), key=lambda x: -x[1])},
+        })
+    return result
+
+def _print_table(rows: List[Dict[str, Any]]) -> None:
+    width = max([len(row["name"]) for row in rows] + [4])
+    header = f"{'span':<{width}} {'count':>7} {'err':>5} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9} {'total':>11}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(f"{row['name']:<{width}} {row['count']:>7} {row['errors']:>5} {row['p50_ms']:>9.2f} "
+              f"{row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['max_ms']:>9.2f} {row['total_ms']:>11.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сводка p50/p95/p99 по спанам трассировки")
+    parser.add_argument("path", help="JSONL-файл трасс (TRACE_FILE)")
+    parser.add_argument("--slowest", type=int, default=0, help="разобрать N самых медленных обновлений")
+    parser.add_argument("--json", action="store_true", help="вывод в JSON")
+    args = parser.parse_args()
+
+    spans = list(read_spans(args.path))
+    rows = summarize(spans)
+    slowest = slowest_traces(spans, args.slowest) if args.slowest else []
+    if args.json:
+        print(json.dumps({"spans": rows, "slowest": slowest}, ensure_ascii=False, indent=2))
+    else:
+        print(f"Спанов: {len(spans)}, времена в мс\n")
+        _print_table(rows)
+        for trace in slowest:
+            print(f"\n{trace['duration_ms']:.2f} мс  trace {trace['trace_id']}  {trace['attributes']}")
+            for name, ms in trace["spans_ms"].items():
+                print(f"    {ms:>9.2f}  {name}")
@@ -0,0 +1,93 @@
+# coding: utf-8
+"""
+Образцы обновлений Telegram для бенчмарков (в формате, который присылает Bot API).
+"""
+import itertools
+import json
+import random
+import time
+from typing import Any, Dict, Iterator, List
+
+from bench.fake_bot_api import BOT_USER
+
+import database
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+def _user(user_id: int) -> Dict[str, Any]:
+    return {
+        "id": user_id,
+        "is_bot": False,
+        "first_name": f"User{user_id}",
+        "username": f"user{user_id}",
+        "language_code": "ru",
+    }
+
+def message_update(user_id: int, text: str) -> Dict[str, Any]:
+    """Текстовое сообщение от пользователя (команды размечаются entity)"""
+    message = {
+        "message_id": next(_message_ids),
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": _user(user_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": next(_update_ids), "message": message}
+
+def callback_update(user_id: int, data: str, message_id: int = None) -> Dict[str, Any]:
+    """Нажатие inline-кнопки под сообщением бота"""
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": message_id or next(_message_ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": BOT_USER,
+                "text": "👋 Главное меню",
+            },
+        },
+    }
+
+def seed_database(drivers: int = 20, routes_per_driver: int = 3) -> List[int]:
+    """Заполняет пустую БД водителями с профилями и маршрутами. Возвращает ID маршрутов"""
+    route_ids = []
+    for driver_id in range(1, drivers + 1):
+        database.create_user(driver_id, f"driver{driver_id}")
+        database.update_user_profile(driver_id, display_name=f"Водитель {driver_id}", bio="Езжу на работу")
+        for n in range(routes_per_driver):
+            route_ids.append(database.create_route(
+                driver_id, "Москва", "Тверь", "01.01.2030", f"{8 + n:02d}:00", 300, 4, ""
+            ))
+    return route_ids
+
+def mixed_updates(count: int, route_ids: List[int], first_user_id: int = 10000) -> Iterator[Dict[str, Any]]:
+    """Поток обновлений, похожий на реальный: /start, меню, поиск, профиль, отклики"""
+    rnd = random.Random(42)
+    for n in range(count):
+        user_id = first_user_id + rnd.randrange(max(count // 4, 1))
+        kind = rnd.random()
+        if kind < 0.15:
+            yield message_update(user_id, "/start")
+        elif kind < 0.35:
+            yield callback_update(user_id, "main_menu")
+        elif kind < 0.55:
+            yield callback_update(user_id, "search_route")
+        elif kind < 0.70:
+            yield callback_update(user_id, "profile")
+        elif kind < 0.80:
+            yield callback_update(user_id, "my_trips")
+        else:
+            yield callback_update(user_id, f"rs:card:reply:{rnd.choice(route_ids)}")
+
+def load_updates(path: str) -> List[Dict[str, Any]]:
+    """Записанные обновления из JSONL-файла (по одному объекту Update в строке)"""
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
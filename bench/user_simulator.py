@@ -0,0 +1,337 @@
+# coding: utf-8
+"""
+Симулятор пользователей: водители и пассажиры проходят сценарии через
+настоящие роутеры бота (dp.feed_raw_update) на заглушке Bot API, в БД
+из bench/synthetic_data.py.
+
+Сценарии (flow) и порядок фаз:
+1. водители: onboarding (/start) -> profile (имя, описание) -> create_route (мастер до публикации)
+2. пассажиры: onboarding -> search (фильтр откуда/куда или "все маршруты") -> reply (Откликнуться)
+3. водители: decide (принять/отклонить заявки на свои маршруты)
+4. водители: edit (число мест), пассажиры: cancel (отмена заявки)
+
+Отчёт: обновлений в секунду, p50/p95 задержки обновления и длительности
+сценария, запросов к БД на прогон сценария (db_profiler.count_queries).
+Базовый результат лежит в bench/baselines/user_simulator.json: --check
+сравнивает с ним и завершается с кодом 1 при регрессии, --save-baseline
+записывает новый.
+
+Запуск из корня проекта:
+    python -m bench.user_simulator
+    python -m bench.user_simulator --drivers 1000 --passengers 5000 --scale full
+    python -m bench.user_simulator --check
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+import config
+import database
+import db_profiler
+import main
+from bench.fake_bot_api import start_fake_api
+from bench.synthetic_data import SCALES, generate, pick_pair
+from bench.updates import callback_update, message_update
+
+FLOWS = ("onboarding", "profile", "create_route", "search", "reply", "decide", "edit", "cancel")
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "user_simulator.json")
+
+# ID симулируемых пользователей - вне диапазона синтетической БД
+DRIVER_BASE_ID = 10_000_000
+PASSENGER_BASE_ID = 20_000_000
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+class Simulator:
+    """Прогон сценариев с замером задержек и запросов к БД по сценариям"""
+
+    def __init__(self, dp, bot, concurrency: int, seed: int) -> None:
+        self.dp = dp
+        self.bot = bot
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.rnd = random.Random(seed)
+        self.update_latencies: Dict[str, List[float]] = defaultdict(list)
+        self.flow_durations: Dict[str, List[float]] = defaultdict(list)
+        self.flow_queries: Dict[str, List[int]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.updates = 0
+
+    async def run_flow(self, flow: str, updates: List[Dict[str, Any]]) -> None:
+        """Обновления одного пользователя по порядку, как их прислал бы Telegram"""
+        async with self.semaphore:
+            started = time.perf_counter()
+            with db_profiler.count_queries() as queries:
+                for update in updates:
+                    update_started = time.perf_counter()
+                    try:
+                        await self.dp.feed_raw_update(self.bot, update)
+                    except Exception as e:
+                        self.errors[flow] += 1
+                        logging.warning(f"Ошибка в сценарии {flow}: {type(e).__name__}: {e}")
+                    self.update_latencies[flow].append(time.perf_counter() - update_started)
+                    self.updates += 1
+            self.flow_durations[flow].append(time.perf_counter() - started)
+            self.flow_queries[flow].append(queries[0])
+
+    async def run_phase(self, flows: List[tuple]) -> None:
+        await asyncio.gather(*(self.run_flow(flow, updates) for flow, updates in flows))
+
+    def report(self) -> Dict[str, Any]:
+        flows = {}
+        for flow in FLOWS:
+            latencies = self.update_latencies.get(flow)
+            if not latencies:
+                continue
+            runs = self.flow_durations[flow]
+            queries = self.flow_queries[flow]
+            flows[flow] = {
+                "runs": len(runs),
+                "updates": len(latencies),
+                "errors": self.errors[flow],
+                "update_p50_ms": round(_percentile(latencies, 50) * 1000, 2),
+                "update_p95_ms": round(_percentile(latencies, 95) * 1000, 2),
+                "flow_p95_ms": round(_percentile(runs, 95) * 1000, 2),
+                "db_queries_per_run": round(sum(queries) / len(queries), 2),
+            }
+        return flows
+
+# ==== Сценарии ===============================================================
+
+def onboarding(user_id: int) -> List[Dict[str, Any]]:
+    return [message_update(user_id, "/start"), callback_update(user_id, "welcome:continue")]
+
+def profile(user_id: int) -> List[Dict[str, Any]]:
+    return [
+        callback_update(user_id, "profile"),
+        callback_update(user_id, "profile:edit"),
+        callback_update(user_id, "profile:edit:name"),
+        message_update(user_id, f"Водитель {user_id}"),
+        callback_update(user_id, "profile:edit:bio"),
+        message_update(user_id, "Езжу на работу каждый день, некурящий"),
+    ]
+
+def create_route(user_id: int, rnd: random.Random) -> List[Dict[str, Any]]:
+    from_loc, to_loc = pick_pair(rnd)
+    day = date.today() + timedelta(days=rnd.randint(1, 14))
+    return [
+        callback_update(user_id, "create_route"),
+        message_update(user_id, from_loc),
+        message_update(user_id, to_loc),
+        callback_update(user_id, f"date_{day.year}_{day.month}_{day.day}"),
+        message_update(user_id, f"{rnd.randint(6, 21):02d}:{rnd.choice((0, 30)):02d}"),
+        message_update(user_id, str(rnd.randrange(200, 900, 50))),
+        message_update(user_id, str(rnd.randint(1, 4))),
+        message_update(user_id, "-"),
+        callback_update(user_id, "route_publish"),
+    ]
+
+def search(user_id: int, from_loc: str, to_loc: str, show_all: bool) -> List[Dict[str, Any]]:
+    if show_all:
+        return [callback_update(user_id, "search_route")]
+    return [
+        callback_update(user_id, "search:start"),
+        message_update(user_id, from_loc),
+        message_update(user_id, to_loc),
+        callback_update(user_id, "search:apply"),
+    ]
+
+def edit_seats(user_id: int, route_id: int, seats: int) -> List[Dict[str, Any]]:
+    return [
+        callback_update(user_id, f"myroutes:edit:{route_id}"),
+        callback_update(user_id, f"myroutes:edit_field:{route_id}:seats"),
+        message_update(user_id, str(seats)),
+        callback_update(user_id, f"myroutes:edit_done:{route_id}"),
+    ]
+
+# ==== Прогон =================================================================
+
+def _query(sql: str, params: tuple = ()) -> List[tuple]:
+    """Чтение состояния БД самим симулятором - мимо db_profiler, не попадает в счётчики"""
+    conn = sqlite3.connect(database.DATABASE_NAME)
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+async def run(drivers: int, passengers: int, scale: str, db_path: str, concurrency: int,
+              show_all_share: float, cancel_share: float, api_port: int, seed: int) -> Dict[str, Any]:
+    tmp_dir = tempfile.mkdtemp(prefix="poputchik_sim_")
+    path = os.path.join(tmp_dir, "sim.db")
+    if db_path:
+        # Готовая БД копируется - прогон не меняет оригинал
+        shutil.copyfile(db_path, path)
+        database.DATABASE_NAME = path
+        database.init_db()
+        data = {"path": db_path}
+    else:
+        data = generate(path, seed=seed, **SCALES[scale])
+        del data["path"]
+
+    fake_api, api_runner = await start_fake_api(port=api_port)
+    config.TELEGRAM_API_URL = f"http://127.0.0.1:{api_port}"
+    config.METRICS_PORT = 0
+    config.SCHEDULER_ENABLED = False
+
+    bot = main.create_bot()
+    dp = main.create_dispatcher()
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+
+    sim = Simulator(dp, bot, concurrency, seed)
+    rnd = sim.rnd
+    driver_ids = [DRIVER_BASE_ID + n for n in range(drivers)]
+    passenger_ids = [PASSENGER_BASE_ID + n for n in range(passengers)]
+    started = time.perf_counter()
+
+    # 1. Водители: регистрация, профиль, маршрут
+    await sim.run_phase([("onboarding", onboarding(d)) for d in driver_ids])
+    await sim.run_phase([("profile", profile(d)) for d in driver_ids])
+    await sim.run_phase([("create_route", create_route(d, rnd)) for d in driver_ids])
+    sim_routes = _query("SELECT id, user_id, from_location, to_location, seats FROM routes WHERE user_id >= ?",
+                        (DRIVER_BASE_ID,))
+
+    # 2. Пассажиры: регистрация, поиск направления одного из новых маршрутов, отклик
+    await sim.run_phase([("onboarding", onboarding(p)) for p in passenger_ids])
+    chosen = {p: rnd.choice(sim_routes) for p in passenger_ids} if sim_routes else {}
+    await sim.run_phase([
+        ("search", search(p, route[2], route[3], rnd.random() < show_all_share)) for p, route in chosen.items()
+    ])
+    await sim.run_phase([
+        ("reply", [callback_update(p, f"rs:card:reply:{route[0]}")]) for p, route in chosen.items()
+    ])
+
+    # 3. Водители решают по заявкам: принимают, пока есть места, остальных - по жребию
+    pending = defaultdict(list)
+    for req_id, driver_id, seats in _query('''
+        SELECT q.id, r.user_id, r.seats FROM requests q JOIN routes r ON r.id = q.route_id
+        WHERE r.user_id >= ? AND q.status = 'pending' ORDER BY q.id
+    ''', (DRIVER_BASE_ID,)):
+        pending[driver_id].append((req_id, seats))
+    decisions = []
+    for driver_id, requests in pending.items():
+        updates = []
+        for n, (req_id, seats) in enumerate(requests):
+            action = "reply:accept" if n < seats and rnd.random() < 0.7 else "reply:reject"
+            updates.append(callback_update(driver_id, f"{action}:{req_id}"))
+        decisions.append(("decide", updates))
+    await sim.run_phase(decisions)
+
+    # 4. Правка мест у части маршрутов и отмена части заявок
+    edits = [("edit", edit_seats(route[1], route[0], rnd.randint(2, 4)))
+             for route in sim_routes if rnd.random() < 0.5]
+    trips = _query("SELECT id, passenger_id FROM requests WHERE passenger_id >= ? AND status != 'cancelled'",
+                   (PASSENGER_BASE_ID,))
+    cancels = [("cancel", [callback_update(p, f"mytrips:cancel:{req_id}")])
+               for req_id, p in trips if rnd.random() < cancel_share]
+    await sim.run_phase(edits + cancels)
+
+    elapsed = time.perf_counter() - started
+    await dp.emit_shutdown(bot=bot, dispatcher=dp)
+    await bot.session.close()
+    await api_runner.cleanup()
+
+    statuses = dict(_query('''
+        SELECT q.status, COUNT(*) FROM requests q WHERE q.passenger_id >= ? GROUP BY q.status
+    ''', (PASSENGER_BASE_ID,)))
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    return {
+        "params": {
+            "drivers": drivers,
+            "passengers": passengers,
+            "scale": "file" if db_path else scale,
+            "concurrency": concurrency,
+            "show_all_share": show_all_share,
+            "cancel_share": cancel_share,
+            "seed": seed,
+        },
+        "data": data,
+        "updates": sim.updates,
+        "elapsed_sec": round(elapsed, 3),
+        "updates_per_sec": round(sim.updates / elapsed, 1) if elapsed else 0.0,
+        "flows": sim.report(),
+        "outcome": {"routes_created": len(sim_routes), "requests": statuses},
+        "bot_api_calls": dict(fake_api.calls),
+    }
+
+# ==== Базовый результат ======================================================
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Регрессии относительно baseline: медленнее/больше запросов, чем на tolerance"""
+    problems = []
+    if result["updates_per_sec"] < baseline["updates_per_sec"] * (1 - tolerance):
+        problems.append(f"updates/sec: {result['updates_per_sec']} < {baseline['updates_per_sec']}")
+    for flow, old in baseline["flows"].items():
+        new = result["flows"].get(flow)
+        if new is None:
+            problems.append(f"{flow}: сценарий не выполнялся")
+            continue
+        for key in ("update_p95_ms", "flow_p95_ms", "db_queries_per_run"):
+            if new[key] > old[key] * (1 + tolerance):
+                problems.append(f"{flow}.{key}: {new[key]} > {old[key]}")
+        if new["errors"] > old["errors"]:
+            problems.append(f"{flow}.errors: {new['errors']} > {old['errors']}")
+    return problems
+
+def _load_baseline(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Симуляция водителей и пассажиров через роутеры бота")
+    parser.add_argument("--drivers", type=int, default=50)
+    parser.add_argument("--passengers", type=int, default=200)
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small", help="размер синтетической БД")
+    parser.add_argument("--db", default="", help="готовая БД (python -m bench.synthetic_data) вместо генерации")
+    parser.add_argument("--concurrency", type=int, default=50, help="одновременно активных пользователей")
+    parser.add_argument("--show-all-share", type=float, default=0.1, help="доля поисков без фильтра")
+    parser.add_argument("--cancel-share", type=float, default=0.2, help="доля заявок, которые пассажиры отменяют")
+    parser.add_argument("--api-port", type=int, default=8081, help="порт заглушки Bot API")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="файл базового результата")
+    parser.add_argument("--save-baseline", action="store_true", help="записать результат как базовый")
+    parser.add_argument("--check", action="store_true", help="сравнить с базовым, код 1 при регрессии")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимое ухудшение, доля")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    result = asyncio.run(run(args.drivers, args.passengers, args.scale, args.db, args.concurrency,
+                             args.show_all_share, args.cancel_share, args.api_port, args.seed))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"Базовый результат записан: {args.baseline}", file=sys.stderr)
+
+    baseline = _load_baseline(args.baseline)
+    if baseline is not None and not args.save_baseline:
+        if baseline["params"] != result["params"]:
+            print("Базовый результат снят с другими параметрами - сравнение пропущено", file=sys.stderr)
+        else:
+            problems = compare(result, baseline, args.tolerance)
+            for problem in problems:
+                print(f"РЕГРЕССИЯ {problem}", file=sys.stderr)
+            if not problems:
+                print(f"Регрессий нет (допуск {args.tolerance:.0%})", file=sys.stderr)
+            if problems and args.check:
+                sys.exit(1)
@@ -0,0 +1,121 @@
+# coding: utf-8
+"""
+Бенчмарк webhook-режима: отправляет обновления на локальный webhook
+и измеряет пропускную способность и задержку обработки.
+
+Запуск из корня проекта:
+    python -m bench.webhook_throughput --updates 2000 --concurrency 50
+    python -m bench.webhook_throughput --file recorded.jsonl
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+from collections import Counter
+
+import aiohttp
+from aiohttp import web
+
+import config
+import database
+import main
+import webhook
+from bench.fake_bot_api import start_fake_api
+from bench.updates import load_updates, mixed_updates, seed_database
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+async def run(updates_count: int, concurrency: int, path: str, api_port: int, port: int) -> dict:
+    # Отдельная временная БД, чтобы не трогать poputchik.db
+    tmp_dir = tempfile.mkdtemp(prefix="poputchik_bench_")
+    database.DATABASE_NAME = os.path.join(tmp_dir, "bench.db")
+    database.init_db()
+    route_ids = seed_database()
+
+    if path:
+        updates = load_updates(path)
+    else:
+        updates = list(mixed_updates(updates_count, route_ids))
+
+    fake_api, api_runner = await start_fake_api(port=api_port)
+    config.TELEGRAM_API_URL = f"http://127.0.0.1:{api_port}"
+    config.WEBHOOK_SECRET = config.WEBHOOK_SECRET or "bench-secret"
+    config.WEBHOOK_BASE_URL = ""
+
+    bot = main.create_bot()
+    dp = main.create_dispatcher()
+    # Ответ на POST только после обработки - так видна реальная задержка
+    app = webhook.create_app(dp, bot, dp.resolve_used_update_types(), handle_in_background=False)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+
+    url = f"http://127.0.0.1:{port}{config.WEBHOOK_PATH}"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": config.WEBHOOK_SECRET}
+    latencies = []
+    statuses = Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with aiohttp.ClientSession() as session:
+        # Без секрета запрос должен отклоняться
+        async with session.post(url, json=updates[0]) as resp:
+            secret_rejected = resp.status == 401
+
+        async def post(update):
+            async with semaphore:
+                started = time.perf_counter()
+                async with session.post(url, data=json.dumps(update), headers={
+                    **headers, "Content-Type": "application/json"
+                }) as resp:
+                    await resp.read()
+                    statuses[resp.status] += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(post(u) for u in updates))
+        elapsed = time.perf_counter() - started
+
+        async with session.get(f"http://127.0.0.1:{port}/healthz") as resp:
+            health_ok = resp.status == 200
+
+    await runner.cleanup()
+    await api_runner.cleanup()
+
+    return {
+        "updates": len(updates),
+        "concurrency": concurrency,
+        "elapsed_sec": round(elapsed, 3),
+        "updates_per_sec": round(len(updates) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(_percentile(latencies, 50) * 1000, 2),
+            "p95": round(_percentile(latencies, 95) * 1000, 2),
+            "p99": round(_percentile(latencies, 99) * 1000, 2),
+            "mean": round(statistics.mean(latencies) * 1000, 2) if latencies else 0.0,
+        },
+        "http_statuses": dict(statuses),
+        "bot_api_calls": dict(fake_api.calls),
+        "secret_rejected": secret_rejected,
+        "health_ok": health_ok,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пропускная способность webhook-режима")
+    parser.add_argument("--updates", type=int, default=1000, help="сколько обновлений сгенерировать")
+    parser.add_argument("--concurrency", type=int, default=50, help="одновременных POST-запросов")
+    parser.add_argument("--file", default="", help="JSONL с записанными обновлениями вместо генерации")
+    parser.add_argument("--api-port", type=int, default=8081, help="порт заглушки Bot API")
+    parser.add_argument("--port", type=int, default=8082, help="порт webhook-сервера")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    result = asyncio.run(run(args.updates, args.concurrency, args.file, args.api_port, args.port))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
@@ -0,0 +1,108 @@
+# coding: utf-8
+"""
+Формат callback_data inline-кнопок: "<префикс>:<число>:<число>..."
+Числа пишутся в десятичном виде - так же, как в кнопках, которые уже
+разосланы пользователям, поэтому старые карточки продолжают работать.
+Telegram ограничивает callback_data 64 байтами - pack() это проверяет.
+"""
+import re
+from typing import Optional, Tuple
+
+MAX_CALLBACK_BYTES = 64
+
+# ==== Префиксы ===============================================================
+
+ROUTE_REPLY = "rs:card:reply"
+ROUTE_CHAT_OPEN = "route:chat:open"
+ROUTE_CHAT_ERROR = "route:chat:error"
+DRIVER_ACCEPT = "reply:accept"
+DRIVER_REJECT = "reply:reject"
+DRIVER_PROFILE = "driver:profile"
+DRIVER_PROFILE_CLOSE = "driver:profile:close"
+TRIP_CANCEL = "mytrips:cancel"
+TRIP_CHAT_ERROR = "mytrips:chat:error"
+TRIPS_PAGE = "mytrips:page"                 # номер страницы
+ROUTE_ACCEPT_PENDING = "myroutes:accept"    # route_id, сколько принять (0 - все, сколько позволяют места)
+ROUTE_REJECT_PENDING = "myroutes:reject"    # route_id
+
+# Маршруты водителя ("Мои маршруты"), параметр - route_id
+ROUTE_DETAILS = "myroutes:details"
+ROUTE_BACK = "myroutes:back"
+ROUTE_CANCEL = "myroutes:cancel"
+ROUTE_CANCEL_CONFIRM = "myroutes:cancel_confirm"
+ROUTE_CANCEL_NO = "myroutes:cancel_no"
+ROUTE_RESTORE = "myroutes:restore"
+ROUTE_EDIT = "myroutes:edit"
+ROUTE_EDIT_FIELD = "myroutes:edit_field"    # route_id, имя поля (pack_field)
+ROUTE_EDIT_BACK = "myroutes:edit_back"
+ROUTE_EDIT_DONE = "myroutes:edit_done"
+ROUTE_EDIT_CANCEL = "myroutes:edit_cancel"
+ROUTE_COMMENT_REPLACE = "myroutes:comment_replace"
+ROUTE_COMMENT_APPEND = "myroutes:comment_append"
+ROUTE_COMMENT_DELETE = "myroutes:comment_delete"
+
+# Календарь при редактировании даты маршрута
+EDIT_CALENDAR = "editcal"
+EDIT_CALENDAR_IGNORE = "editcal:ignore"     # без параметров (заголовки, прошедшие дни)
+EDIT_CALENDAR_PREV = "editcal:prev"         # год, месяц
+EDIT_CALENDAR_NEXT = "editcal:next"         # год, месяц
+EDIT_CALENDAR_DAY = "editcal:day"           # год, месяц, день
+EDIT_CALENDAR_BACK = "editcal:back"         # route_id
+
+# ==== Упаковка ===============================================================
+
+def pack(prefix: str, *values: int) -> str:
+    """pack("reply:accept", 12) -> "reply:accept:12" """
+    data = ":".join([prefix] + [str(int(value)) for value in values])
+    if len(data.encode("utf-8")) > MAX_CALLBACK_BYTES:
+        raise ValueError(f"callback_data длиннее {MAX_CALLBACK_BYTES} байт: {data}")
+    return data
+
+def unpack(data: Optional[str], prefix: str, count: int = 1) -> Optional[Tuple[int, ...]]:
+    """unpack("reply:accept:12", "reply:accept") -> (12,). None - если формат не совпал"""
+    if not data or not data.startswith(prefix + ":"):
+        return None
+    parts = data[len(prefix) + 1:].split(":")
+    if len(parts) != count:
+        return None
+    try:
+        return tuple(int(part) for part in parts)
+    except ValueError:
+        return None
+
+def unpack_id(data: Optional[str], prefix: str) -> Optional[int]:
+    """Единственный числовой параметр кнопки или None"""
+    values = unpack(data, prefix)
+    return values[0] if values else None
+
+# Имя поля маршрута в кнопке: латиница и "_" (колонка или шаг редактирования)
+_FIELD_NAME = re.compile(r"^[a-z_]+$")
+
+def pack_field(prefix: str, value: int, field: str) -> str:
+    """pack_field("myroutes:edit_field", 12, "price") -> "myroutes:edit_field:12:price" """
+    if not _FIELD_NAME.match(field):
+        raise ValueError(f"недопустимое имя поля в callback_data: {field}")
+    return f"{pack(prefix, value)}:{field}"
+
+def unpack_field(data: Optional[str], prefix: str) -> Optional[Tuple[int, str]]:
+    """unpack_field("myroutes:edit_field:12:price", "myroutes:edit_field") -> (12, "price")"""
+    if not data or not data.startswith(prefix + ":"):
+        return None
+    value, _, field = data[len(prefix) + 1:].partition(":")
+    if not _FIELD_NAME.match(field):
+        return None
+    try:
+        return int(value), field
+    except ValueError:
+        return None
+
+# ==== Метрики ================================================================
+
+# Числовые параметры callback_data: "reply:accept:12" -> "reply:accept", "date_2030_1_5" -> "date"
+_NUMERIC_PART = re.compile(r"[:_](-?\d+|None)(?=[:_]|$)")
+
+def callback_prefix(data: Optional[str]) -> str:
+    """Префикс callback_data без числовых параметров (для метрик)"""
+    if not data:
+        return "<empty>"
+    return _NUMERIC_PART.sub("", data) or data
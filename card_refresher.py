@@ -0,0 +1,188 @@
+# coding: utf-8
+"""
+Обновление показанных карточек маршрутов.
+Каждая карточка, отправленная пользователю, записывается в displayed_cards
+(маршрут, чат, сообщение, кто смотрит, вариант карточки, хеш содержимого).
+После записи в БД, меняющей маршрут (места, поля, статус заявки, отмена),
+database вызывает CardRefresher.mark_changed. Изменения за
+CARD_REFRESH_DELAY_SEC собираются вместе, затем карточки маршрута
+перерисовываются, и редактируются только те, у которых изменился текст
+или кнопки. Редактирование идёт через RateLimitedSender.
+Карточки старше CARD_REGISTRY_TTL_HOURS не обновляются и удаляются из реестра.
+Рисует карточки cards.py; маршрут и статусы заявок читаются одним запросом
+на маршрут, а не отдельно для каждой карточки.
+"""
+import asyncio
+import contextvars
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.types import InlineKeyboardMarkup
+
+import cards
+import config
+import database
+from sender import RateLimitedSender
+
+# Карточки, которые отслеживаются: в результатах поиска и после нажатия "Откликнуться"
+TRACKED_VARIANTS = (cards.VARIANT_SEARCH, cards.VARIANT_REPLY)
+
+INACTIVE_NOTE = "\n\n🚫 <b>Маршрут больше не активен</b>"
+
+def card_hash(text: str, reply_markup: Optional[InlineKeyboardMarkup] = None) -> str:
+    """Хеш текста и кнопок карточки"""
+    digest = hashlib.sha1(text.encode("utf-8"))
+    if reply_markup is not None:
+        digest.update(reply_markup.model_dump_json(exclude_none=True).encode("utf-8"))
+    return digest.hexdigest()
+
+def render_card(route: Optional[dict], variant: str, viewer_status: Optional[str]):
+    """Карточка в текущем состоянии маршрута: (текст, клавиатура, маршрут активен)"""
+    if route and route.get("is_active"):
+        text, keyboard = cards.route_card(route, variant, viewer_status)
+        return text, keyboard, True
+    if route:
+        return cards.route_card(route, variant, viewer_status)[0] + INACTIVE_NOTE, None, False
+    return "🚫 <b>Маршрут удалён</b>", None, False
+
+class CardRefresher:
+    """Отложенное обновление карточек изменившихся маршрутов"""
+
+    def __init__(
+        self,
+        sender: RateLimitedSender,
+        delay: float = 2.0,
+        ttl_hours: float = 48,
+    ) -> None:
+        self.sender = sender
+        self.delay = delay
+        self.ttl = timedelta(hours=ttl_hours)
+        self._bot: Optional[Bot] = None
+        self._dirty = set()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._last_purge: Optional[datetime] = None
+        self.edited = 0
+        self.unchanged = 0
+        self.failed = 0
+        self.expired = 0
+
+    async def start(self, bot: Bot) -> None:
+        self._bot = bot
+
+    async def stop(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._flush_task is not None:
+            await asyncio.wait([self._flush_task])
+        await self.flush()
+
+    def mark_changed(self, route_id: int) -> None:
+        """Маршрут изменился - его карточки обновятся через delay секунд"""
+        if self._bot is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._dirty.add(route_id)
+        if self._timer is None:
+            # Пустой контекст: обновление карточек - общая работа, не часть трассы изменившего маршрут
+            self._timer = loop.call_later(self.delay, self._start_flush, context=contextvars.Context())
+
+    def _start_flush(self) -> None:
+        self._timer = None
+        self._flush_task = asyncio.ensure_future(self.flush())
+
+    async def flush(self) -> None:
+        """Обновляет карточки всех маршрутов, изменившихся с прошлого раза"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            routes, self._dirty = self._dirty, set()
+            shown_after = (datetime.now() - self.ttl).isoformat()
+            for route_id in routes:
+                try:
+                    await self._refresh_route(route_id, shown_after)
+                except Exception as e:
+                    logging.error(f"❌ Не удалось обновить карточки маршрута {route_id}: {e}")
+            self._purge(shown_after)
+
+    def _purge(self, shown_after: str) -> None:
+        """Раз в час удаляет из реестра устаревшие карточки"""
+        now = datetime.now()
+        if self._last_purge and now - self._last_purge < timedelta(hours=1):
+            return
+        self._last_purge = now
+        self.expired += database.delete_expired_displayed_cards(shown_after)
+
+    async def _refresh_route(self, route_id: int, shown_after: str) -> None:
+        shown = database.get_displayed_cards(route_id, shown_after)
+        if not shown:
+            return
+        route = database.get_card_route(route_id)
+        statuses = database.get_route_request_statuses(route_id)
+        jobs = []
+        for card in shown:
+            if card["variant"] not in TRACKED_VARIANTS:
+                continue
+            text, keyboard, active = render_card(route, card["variant"], statuses.get(card["viewer_id"]))
+            content_hash = card_hash(text, keyboard)
+            if content_hash == card["content_hash"]:
+                self.unchanged += 1
+                continue
+            jobs.append(self._edit(card, text, keyboard, content_hash, final=not active))
+        if jobs:
+            await asyncio.gather(*jobs)
+
+    async def _edit(self, card: dict, text: str, keyboard: Optional[InlineKeyboardMarkup],
+                    content_hash: str, final: bool) -> None:
+        chat_id, message_id = card["chat_id"], card["message_id"]
+        try:
+            await self.sender.call(chat_id, lambda: self._bot.edit_message_text(
+                chat_id=chat_id,
+                message_id=message_id,
+                text=text,
+                reply_markup=keyboard,
+                parse_mode="HTML",
+            ))
+            self.edited += 1
+        except TelegramBadRequest as e:
+            if "not modified" not in str(e):
+                # Сообщение удалено или слишком старое - больше не отслеживаем
+                self.failed += 1
+                database.delete_displayed_card(chat_id, message_id)
+                return
+        except TelegramForbiddenError:
+            self.failed += 1
+            database.delete_displayed_card(chat_id, message_id)
+            return
+        except Exception as e:
+            self.failed += 1
+            logging.warning(f"⚠️ Не удалось обновить карточку {chat_id}/{message_id}: {e}")
+            return
+
+        # Карточку неактивного маршрута обновили в последний раз
+        if final:
+            database.delete_displayed_card(chat_id, message_id)
+        else:
+            database.update_displayed_card_hash(chat_id, message_id, content_hash)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending_routes": len(self._dirty),
+            "edited": self.edited,
+            "unchanged": self.unchanged,
+            "failed": self.failed,
+            "expired": self.expired,
+        }
+
+def create_card_refresher(sender: RateLimitedSender) -> CardRefresher:
+    """Обновлятель карточек с настройками из config"""
+    return CardRefresher(sender, config.CARD_REFRESH_DELAY_SEC, config.CARD_REGISTRY_TTL_HOURS)
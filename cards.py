@@ -0,0 +1,283 @@
+# coding: utf-8
+"""
+Карточки маршрутов - единственное место, где рисуются их текст и кнопки.
+
+Варианты:
+- SEARCH - результат поиска: профиль водителя, маршрут, статус заявки смотрящего
+- REPLY  - компактная карточка после нажатия "Откликнуться"
+- TRIP   - заявка пассажира в "Мои поездки"
+- OWNER  - маршрут водителя в "Мои маршруты"
+
+Рендер не ходит в БД: маршрут приходит уже с данными водителя и статусами
+(database.search_routes / get_card_route / get_user_trips / get_user_routes).
+Готовые карточки кешируются по (route_id, version, статус, вариант):
+version маршрута увеличивается при каждой записи в маршрут и при изменении
+профиля или username водителя, поэтому устаревшая запись в кеше не найдётся.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+import callbacks
+import config
+import database
+
+VARIANT_SEARCH = "search"
+VARIANT_REPLY = "reply"
+VARIANT_TRIP = "trip"
+VARIANT_OWNER = "owner"
+
+Card = Tuple[str, Optional[InlineKeyboardMarkup]]
+
+# ==== Кеш ====================================================================
+
+class _RenderCache:
+    """LRU-кеш готовых карточек"""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._items: "OrderedDict[tuple, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple):
+        value = self._items.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._items.move_to_end(key)
+        return value
+
+    def put(self, key: tuple, value: Any) -> None:
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+_cache = _RenderCache(config.CARD_RENDER_CACHE_SIZE)
+
+def _cache_key(route: dict, status: Optional[str], variant: str) -> Optional[tuple]:
+    # Без version (маршрут собран не из БД) кешировать нельзя
+    if route.get('version') is None or route.get('id') is None:
+        return None
+    return (route['id'], route['version'], status, variant)
+
+def cache_stats() -> Dict[str, int]:
+    return {"size": len(_cache._items), "hits": _cache.hits, "misses": _cache.misses}
+
+# ==== Общие блоки ============================================================
+
+_VIEWER_STATUS_LINES = {
+    'pending': "\n\n⏳ <b>Заявка отправлена</b>",
+    'rejected': "\n\n❌ <b>Заявка отклонена</b>",
+    'accepted': "\n\n✅ <b>Заявка принята!</b>",
+}
+
+def _driver_block(route: dict) -> str:
+    """Профиль водителя над маршрутом (если водитель есть в БД)"""
+    if not route.get('driver_user_id'):
+        return ""
+    driver_name = route.get('driver_name')
+    driver_bio = route.get('driver_bio') or ''
+
+    block = "👤 <b>ВОДИТЕЛЬ:</b>\n"
+    block += f"🆔 {driver_name}\n"
+    if driver_bio:
+        # Обрезаем описание если слишком длинное
+        if len(driver_bio) > 60:
+            driver_bio = driver_bio[:60] + "..."
+        block += f"💬 {driver_bio}\n"
+    return block + "\n"
+
+def _route_block(route: dict) -> str:
+    card = f"📍 <b>Маршрут:</b> {route.get('from_location', '—')} → {route.get('to_location', '—')}\n"
+    card += f"📅 {route.get('date_dmy', '—')} | 🕐 {route.get('time_hm', '—')}\n"
+    card += f"💰 {route.get('price', 0)}₽ | 💺 {route.get('seats', 0)} мест"
+    comment = (route.get('comment') or '').strip()
+    if comment:
+        card += f"\n💬 <b>О поездке:</b> {comment}"
+    return card
+
+def _one_line(route: dict) -> str:
+    return (
+        f"• {route.get('date_dmy', '—')}г. {route.get('time_hm', '—')} — "
+        f"{route.get('from_location', '—')} → {route.get('to_location', '—')} | "
+        f"цена: {route.get('price', 0)}₽ | мест: {route.get('seats', 0)}"
+    )
+
+def _chat_button(route: dict, fallback_callback: str) -> InlineKeyboardButton:
+    """URL-кнопка чата, если у водителя есть username, иначе - кнопка с подсказкой"""
+    driver_username = route.get('driver_username')
+    if route.get('user_id') and database.is_valid_telegram_username(driver_username):
+        return InlineKeyboardButton(text="💬 Чат", url=f"https://t.me/{driver_username.strip()}")
+    return InlineKeyboardButton(text="💬 Чат", callback_data=fallback_callback)
+
+# ==== Карточка маршрута для пассажира ========================================
+
+def _route_card_keyboard(route: dict, variant: str) -> InlineKeyboardMarkup:
+    route_id = route.get('id')
+    driver_id = route.get('user_id')
+    buttons = []
+    if driver_id:
+        buttons.append(InlineKeyboardButton(
+            text="👤 Профиль",
+            callback_data=callbacks.pack(callbacks.DRIVER_PROFILE, driver_id)
+        ))
+    buttons.append(InlineKeyboardButton(
+        text="⚡ Забронировать" if route.get('instant_booking') else "👋 Откликнуться",
+        callback_data=callbacks.pack(callbacks.ROUTE_REPLY, route_id)
+    ))
+    # Без username: в поиске - сообщение об ошибке, после отклика - инструкция
+    fallback = callbacks.ROUTE_CHAT_ERROR if variant == VARIANT_SEARCH else callbacks.ROUTE_CHAT_OPEN
+    buttons.append(_chat_button(route, callbacks.pack(fallback, route_id)))
+    return InlineKeyboardMarkup(inline_keyboard=[buttons])
+
+def route_card(route: dict, variant: str = VARIANT_SEARCH, viewer_status: Optional[str] = None) -> Card:
+    """Карточка маршрута (SEARCH или REPLY) и статус заявки того, кто её видит"""
+    key = _cache_key(route, viewer_status, variant)
+    cached = _cache.get(key) if key else None
+    if cached is not None:
+        return cached
+
+    if variant == VARIANT_SEARCH:
+        text = _driver_block(route) + _route_block(route)
+    else:
+        text = _one_line(route)
+        if route.get('comment'):
+            text += f"\n💬 {route['comment']}"
+    if route.get('instant_booking'):
+        text += "\n⚡ Мгновенное бронирование - без подтверждения водителя"
+    text += _VIEWER_STATUS_LINES.get(viewer_status, "")
+
+    card = (text, _route_card_keyboard(route, variant))
+    if key:
+        _cache.put(key, card)
+    return card
+
+# ==== Карточка заявки пассажира ==============================================
+
+def _trip_status(trip: dict) -> str:
+    if trip['is_active'] == 0:
+        return "маршрут отменен"
+    return {
+        'pending': "заявка отправлена",
+        'accepted': "заявка принята",
+        'rejected': "заявка отклонена",
+        'cancelled': "отменена",
+    }.get(trip['status'], "неизвестный статус")
+
+def trip_card(trip: dict) -> Card:
+    """Карточка из database.get_user_trips (id маршрута - route_id, водителя - driver_id)"""
+    route = dict(trip, id=trip['route_id'], user_id=trip['driver_id'])
+    key = _cache_key(route, (trip['status'], trip['is_active']), VARIANT_TRIP)
+    text = _cache.get(key) if key else None
+    if text is None:
+        text = _driver_block(route) + _route_block(route)
+        text += f"\n\n📊 <b>Статус:</b> {_trip_status(trip)}"
+        if key:
+            _cache.put(key, text)
+
+    # Кнопки содержат ID заявки - их не кешируем
+    buttons = []
+    if trip['driver_id']:
+        buttons.append(InlineKeyboardButton(
+            text="👤 Профиль",
+            callback_data=callbacks.pack(callbacks.DRIVER_PROFILE, trip['driver_id'])
+        ))
+    if trip['status'] not in ['cancelled'] and trip['is_active'] == 1:
+        buttons.append(InlineKeyboardButton(
+            text="❌ Отменить",
+            callback_data=callbacks.pack(callbacks.TRIP_CANCEL, trip['request_id'])
+        ))
+    buttons.append(_chat_button(route, callbacks.pack(callbacks.TRIP_CHAT_ERROR, trip['request_id'])))
+    return text, InlineKeyboardMarkup(inline_keyboard=[buttons])
+
+# ==== Карточка маршрута водителя =============================================
+
+def owner_status(route: dict) -> str:
+    """Статус маршрута для водителя по заявкам (has_accepted / has_rejected из БД)"""
+    if route.get('is_active', 1) == 0:
+        return "❌ Отменена"
+    if route.get('has_accepted'):
+        return "✅ Заявка принята!"
+    if route.get('has_rejected'):
+        return "❌ Заявка отклонена"
+    return "✅ Опубликована"
+
+def owner_keyboard(route_id: int, is_active: int) -> InlineKeyboardMarkup:
+    """Кнопки карточки в "Мои маршруты" - разные для активных и отменённых"""
+    if is_active == 1:
+        return InlineKeyboardMarkup(inline_keyboard=[
+            [
+                InlineKeyboardButton(text="✏️ Изменить", callback_data=callbacks.pack(callbacks.ROUTE_EDIT, route_id)),
+                InlineKeyboardButton(text="❌ Отменить", callback_data=callbacks.pack(callbacks.ROUTE_CANCEL, route_id)),
+                InlineKeyboardButton(text="👁️ Детали", callback_data=callbacks.pack(callbacks.ROUTE_DETAILS, route_id))
+            ]
+        ])
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text="👁️ Детали", callback_data=callbacks.pack(callbacks.ROUTE_DETAILS, route_id)),
+            InlineKeyboardButton(text="🔄 Восстановить", callback_data=callbacks.pack(callbacks.ROUTE_RESTORE, route_id))
+        ]
+    ])
+
+def owner_card(route: dict) -> Card:
+    """Карточка из database.get_user_routes / get_card_route"""
+    status = owner_status(route)
+    key = _cache_key(route, status, VARIANT_OWNER)
+    cached = _cache.get(key) if key else None
+    if cached is not None:
+        return cached
+
+    text = _one_line(route) + "\n"
+    if route.get('comment'):
+        text += f"💬 {route['comment']}\n"
+    text += f"\n{status}"
+
+    card = (text, owner_keyboard(route.get('id'), route.get('is_active', 1)))
+    if key:
+        _cache.put(key, card)
+    return card
+
+# ==== Уведомления пассажиру о решении водителя ===============================
+
+def request_accepted_text(route: dict, seats: int, driver_username: Optional[str]) -> str:
+    """seats - свободные места на момент решения (до списания)"""
+    driver_contact = f"👤 Водитель: @{driver_username}\n" if driver_username else ""
+    return (
+        f"🎉 <b>Ваша заявка принята!</b>\n\n"
+        f"📍 Маршрут: {route.get('from_location', '?')} → {route.get('to_location', '?')}\n"
+        f"📅 Дата: {route.get('date_dmy', '?')}г.\n"
+        f"🕐 Время: {route.get('time_hm', '?')}\n"
+        f"💰 Цена: {route.get('price', '?')}₽\n"
+        f"👥 Количество мест: {seats}\n"
+        f"{driver_contact}\n"
+        f"Водитель подтвердил вашу поездку. "
+        f"Свяжитесь с ним для уточнения деталей."
+    )
+
+def instant_booking_text(route: dict, seats_left: int, driver_username: Optional[str]) -> str:
+    """Мгновенное бронирование: место занято без решения водителя; seats_left - после списания"""
+    driver_contact = f"👤 Водитель: @{driver_username}\n" if driver_username else ""
+    return (
+        f"🎉 <b>Место забронировано!</b>\n\n"
+        f"📍 Маршрут: {route.get('from_location', '?')} → {route.get('to_location', '?')}\n"
+        f"📅 Дата: {route.get('date_dmy', '?')}г.\n"
+        f"🕐 Время: {route.get('time_hm', '?')}\n"
+        f"💰 Цена: {route.get('price', '?')}₽\n"
+        f"👥 Осталось мест: {seats_left}\n"
+        f"{driver_contact}\n"
+        f"Водитель включил мгновенное бронирование - место закреплено за вами. "
+        f"Свяжитесь с водителем для уточнения деталей."
+    )
+
+def request_rejected_text(route: Optional[dict]) -> str:
+    route = route or {}
+    return (
+        f"😔 <b>Ваша заявка отклонена</b>\n\n"
+        f"📍 Маршрут: {route.get('from_location', '?')} → {route.get('to_location', '?')}\n\n"
+        f"К сожалению, водитель не смог принять вашу заявку. "
+        f"Попробуйте найти другой маршрут."
+    )
@@ -0,0 +1,297 @@
+# coding: utf-8
+"""
+Кластерный режим (BOT_MODE=cluster): несколько процессов-воркеров за фронтом.
+
+Фронт принимает обновления (webhook или long polling) и раздаёт их воркерам
+по chat_id: один чат всегда попадает в один и тот же воркер, поэтому
+MemoryStorage воркера видит все шаги FSM этого пользователя.
+Обновления одного чата передаются строго по очереди (следующее - только
+после того, как воркер обработал предыдущее), разные чаты - параллельно.
+
+Воркеры - обычный main.py в webhook-режиме на локальных портах.
+БД общая (SQLite в режиме WAL, см. database.init_db).
+Лимит Bot API общий на бота, поэтому каждому воркеру - его доля
+SENDER_RATE_PER_SEC; фоновые задания выполняет только воркер 0.
+"""
+import asyncio
+import logging
+import os
+import secrets
+import sys
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+from aiogram import Bot
+
+import config
+import webhook
+
+def chat_id_of(update: Dict[str, Any]) -> int:
+    """chat_id обновления (для inline-запросов и прочего - ID пользователя)"""
+    for key, value in update.items():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat and "id" in chat:
+            return int(chat["id"])
+        user = value.get("from") or value.get("user")
+        if user and "id" in user:
+            return int(user["id"])
+    return int(update.get("update_id", 0))
+
+def worker_index(chat_id: int, workers: int) -> int:
+    """Номер воркера для чата (одинаковый во всех процессах и после перезапуска)"""
+    return chat_id % workers
+
+class ClusterFront:
+    """Раздаёт обновления воркерам с сохранением порядка внутри чата"""
+
+    def __init__(self, worker_urls: List[str], secret: str, max_in_flight: int = 64,
+                 retry_for: float = 30.0, max_pending: int = 1000) -> None:
+        self.worker_urls = worker_urls
+        self.secret = secret
+        self.retry_for = retry_for
+        self.max_pending = max_pending
+        self._semaphores = [asyncio.Semaphore(max_in_flight) for _ in worker_urls]
+        self._chat_tails: Dict[int, asyncio.Task] = {}
+        self._tasks = set()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.forwarded = 0
+        self.retried = 0
+        self.failed = 0
+
+    async def start(self) -> None:
+        self._session = aiohttp.ClientSession()
+
+    async def close(self) -> None:
+        await self.drain()
+        if self._session:
+            await self._session.close()
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    async def wait_capacity(self) -> None:
+        """Ждёт, пока принятых, но не обработанных обновлений станет меньше max_pending"""
+        while len(self._tasks) >= self.max_pending:
+            await asyncio.wait(list(self._tasks), return_when=asyncio.FIRST_COMPLETED)
+
+    def submit(self, update: Dict[str, Any]) -> None:
+        """Ставит обновление в очередь его чата"""
+        chat_id = chat_id_of(update)
+        previous = self._chat_tails.get(chat_id)
+        task = asyncio.ensure_future(self._forward(chat_id, update, previous))
+        self._chat_tails[chat_id] = task
+        self._tasks.add(task)
+        task.add_done_callback(lambda t: self._forget(chat_id, t))
+
+    def _forget(self, chat_id: int, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if self._chat_tails.get(chat_id) is task:
+            del self._chat_tails[chat_id]
+
+    async def _forward(self, chat_id: int, update: Dict[str, Any], previous: Optional[asyncio.Task]) -> None:
+        # Ждём, пока воркер обработает предыдущее обновление этого чата
+        if previous is not None:
+            await asyncio.wait([previous])
+
+        index = worker_index(chat_id, len(self.worker_urls))
+        deadline = asyncio.get_running_loop().time() + self.retry_for
+        delay = 0.2
+        while True:
+            try:
+                async with self._semaphores[index]:
+                    async with self._session.post(
+                        self.worker_urls[index],
+                        json=update,
+                        headers={"X-Telegram-Bot-Api-Secret-Token": self.secret},
+                    ) as resp:
+                        await resp.read()
+                        if resp.status != 200:
+                            raise RuntimeError(f"HTTP {resp.status}")
+                self.forwarded += 1
+                return
+            except aiohttp.ClientConnectorError as e:
+                # Соединение не установлено - воркер перезапускается, обновление он не получал.
+                # Ждём его, порядок чата сохраняется
+                if asyncio.get_running_loop().time() + delay < deadline:
+                    self.retried += 1
+                    logging.warning(f"⚠️ Кластер: воркер {index} недоступен ({e}), повтор через {delay:.1f} с")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 5.0)
+                    continue
+                error = e
+            except Exception as e:
+                # Обрыв, таймаут или ошибка после отправки: воркер мог уже получить
+                # обновление - повтор обработал бы его дважды
+                error = e
+            self.failed += 1
+            logging.error(f"❌ Кластер: воркер {index} не принял обновление {update.get('update_id')}: {error}")
+            return
+
+    async def drain(self) -> None:
+        """Ждёт, пока все принятые обновления будут обработаны воркерами"""
+        while self._tasks:
+            await asyncio.wait(list(self._tasks))
+
+    # ==== Источники обновлений ===============================================
+
+    async def handle_webhook(self, request: web.Request) -> web.Response:
+        if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != webhook.webhook_secret():
+            return web.Response(status=401, text="Unauthorized")
+        update = await request.json()
+        # Пока воркеры не разберут очередь, Telegram ждёт ответа и не шлёт новые
+        await self.wait_capacity()
+        self.submit(update)
+        return web.json_response({})
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        workers = []
+        for url in self.worker_urls:
+            health_url = url.rsplit("/", 1)[0] + "/healthz"
+            try:
+                async with self._session.get(health_url) as resp:
+                    workers.append(resp.status == 200)
+            except aiohttp.ClientError:
+                workers.append(False)
+        status = 200 if all(workers) else 503
+        return web.json_response({
+            "status": "ok" if status == 200 else "degraded",
+            "mode": "cluster",
+            "workers": workers,
+            "pending": self.pending,
+            "forwarded": self.forwarded,
+            "retried": self.retried,
+            "failed": self.failed,
+        }, status=status)
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(config.WEBHOOK_PATH, self.handle_webhook)
+        app.router.add_get("/healthz", self.handle_health)
+        return app
+
+    async def poll(self, bot: Bot, allowed_updates: List[str]) -> None:
+        """Long polling в одном процессе с раздачей обновлений воркерам"""
+        offset = None
+        while True:
+            # Следующую пачку - только когда воркеры разберут очередь: принятые
+            # обновления (offset сдвинут) пропадут при падении фронта
+            await self.wait_capacity()
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=allowed_updates)
+            except Exception as e:
+                logging.error(f"❌ Кластер: ошибка getUpdates: {e}")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                self.submit(update.model_dump(mode="json", exclude_none=True))
+                offset = update.update_id + 1
+
+# ==== Воркеры ================================================================
+
+def worker_env(index: int, port: int, secret: str) -> Dict[str, str]:
+    """Окружение процесса-воркера"""
+    env = dict(os.environ)
+    env.update({
+        "BOT_MODE": "webhook",
+        "WEBAPP_HOST": "127.0.0.1",
+        "PORT": str(port),
+        "WEBHOOK_BASE_URL": "",
+        "WEBHOOK_SECRET": secret,
+        "WEBHOOK_HANDLE_IN_BACKGROUND": "0",
+        "BOT_WORKER_INDEX": str(index),
+        # Один лимит Bot API на всех: у каждого процесса свой RateLimitedSender
+        "SENDER_RATE_PER_SEC": str(config.SENDER_RATE_PER_SEC / config.BOT_WORKERS),
+        "METRICS_PORT": str(config.METRICS_PORT + 1 + index) if config.METRICS_PORT else "0",
+    })
+    return env
+
+async def start_worker(index: int, port: int, secret: str) -> asyncio.subprocess.Process:
+    main_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    return await asyncio.create_subprocess_exec(sys.executable, main_py, env=worker_env(index, port, secret))
+
+async def wait_ready(port: int, timeout: float = 30.0) -> None:
+    """Ждёт, пока воркер начнёт отвечать на /healthz"""
+    deadline = asyncio.get_running_loop().time() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(f"http://127.0.0.1:{port}/healthz") as resp:
+                    if resp.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            if asyncio.get_running_loop().time() > deadline:
+                raise TimeoutError(f"Воркер на порту {port} не запустился")
+            await asyncio.sleep(0.2)
+
+class WorkerPool:
+    """Запускает воркеры и перезапускает упавшие"""
+
+    def __init__(self, count: int, base_port: int, secret: str) -> None:
+        self.ports = [base_port + i for i in range(count)]
+        self.secret = secret
+        self.processes: List[Optional[asyncio.subprocess.Process]] = [None] * count
+        self._supervisor: Optional[asyncio.Task] = None
+
+    @property
+    def urls(self) -> List[str]:
+        return [f"http://127.0.0.1:{port}{config.WEBHOOK_PATH}" for port in self.ports]
+
+    async def start(self) -> None:
+        for index, port in enumerate(self.ports):
+            self.processes[index] = await start_worker(index, port, self.secret)
+        await asyncio.gather(*(wait_ready(port) for port in self.ports))
+        self._supervisor = asyncio.ensure_future(self._supervise())
+        logging.info(f"Кластер: запущено воркеров - {len(self.ports)}")
+
+    async def _supervise(self) -> None:
+        while True:
+            await asyncio.sleep(1)
+            for index, process in enumerate(self.processes):
+                if process is not None and process.returncode is not None:
+                    logging.error(f"❌ Кластер: воркер {index} завершился с кодом {process.returncode}, перезапуск")
+                    self.processes[index] = await start_worker(index, self.ports[index], self.secret)
+
+    async def stop(self) -> None:
+        if self._supervisor:
+            self._supervisor.cancel()
+        for process in self.processes:
+            if process is not None and process.returncode is None:
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                await process.wait()
+
+async def run_cluster(bot: Bot, allowed_updates: List[str]) -> None:
+    """Фронт + воркеры. Источник обновлений - webhook, если задан WEBHOOK_BASE_URL, иначе polling"""
+    internal_secret = secrets.token_urlsafe(16)
+    pool = WorkerPool(config.BOT_WORKERS, config.CLUSTER_WORKER_BASE_PORT, internal_secret)
+    await pool.start()
+
+    front = ClusterFront(pool.urls, internal_secret, config.CLUSTER_MAX_IN_FLIGHT,
+                         config.CLUSTER_FORWARD_RETRY_SEC, config.CLUSTER_MAX_PENDING)
+    await front.start()
+    runner = web.AppRunner(front.create_app())
+    await runner.setup()
+    await web.TCPSite(runner, config.WEBAPP_HOST, config.WEBAPP_PORT).start()
+
+    try:
+        if config.WEBHOOK_BASE_URL:
+            await bot.set_webhook(
+                url=f"{config.WEBHOOK_BASE_URL}{config.WEBHOOK_PATH}",
+                secret_token=webhook.webhook_secret(),
+                allowed_updates=allowed_updates,
+            )
+            await asyncio.Event().wait()
+        else:
+            await bot.delete_webhook()
+            await front.poll(bot, allowed_updates)
+    finally:
+        await front.close()
+        await runner.cleanup()
+        await pool.stop()
+        await bot.session.close()
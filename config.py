@@ -0,0 +1,196 @@
+# coding: utf-8
+"""
+Настройки бота из переменных окружения (.env)
+"""
+import os
+from dotenv import load_dotenv
+
+# Загружаем переменные из .env
+load_dotenv()
+
+def _get_int(name: str, default: int) -> int:
+    """Целое число из окружения (при ошибке - значение по умолчанию)"""
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+def _get_float(name: str, default: float) -> float:
+    """Дробное число из окружения (при ошибке - значение по умолчанию)"""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+# ==== Бот ====================================================================
+
+BOT_TOKEN = (
+    os.getenv("TELEGRAM_BOT_TOKEN")
+    or os.getenv("BOT_TOKEN")
+    or "8270928147:AAEz1zbYarSM_PFe7v3V6gmZ2-6TBjkh8lA"
+)
+
+# Адрес Bot API (пусто - официальный api.telegram.org)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+
+# Telegram ID администраторов через запятую (команды из handlers/admin.py)
+ADMIN_IDS = tuple(int(x) for x in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if x.isdigit())
+
+# Режим получения обновлений: polling или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower()
+
+# Файл SQLite
+DATABASE_PATH = os.getenv("DATABASE_PATH", "poputchik.db")
+
+# Запросы дольше DB_SLOW_QUERY_MS пишутся в лог с параметрами; для каждого нового
+# SQL снимается EXPLAIN QUERY PLAN (DB_EXPLAIN_QUERIES=0 - не снимать), полный
+# просмотр таблиц из DB_HOT_TABLES - предупреждение в логе
+DB_SLOW_QUERY_MS = _get_float("DB_SLOW_QUERY_MS", 50)
+DB_EXPLAIN_QUERIES = os.getenv("DB_EXPLAIN_QUERIES", "1") != "0"
+DB_HOT_TABLES = tuple(
+    name.strip() for name in os.getenv("DB_HOT_TABLES", "routes,requests,users,waitlist,displayed_cards").split(",")
+    if name.strip()
+)
+
+# ==== Webhook ================================================================
+
+# Публичный адрес сервера, например https://poputchik.onrender.com
+# Если пусто - webhook у Telegram не регистрируется (локальный запуск)
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+
+# Адрес, на котором слушает aiohttp (Render передаёт порт в PORT)
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = _get_int("PORT", 8080)
+
+# Обрабатывать обновление в фоне и сразу отвечать Telegram 200
+# (воркеры кластера отвечают только после обработки - так фронт держит порядок)
+WEBHOOK_HANDLE_IN_BACKGROUND = os.getenv("WEBHOOK_HANDLE_IN_BACKGROUND", "1") != "0"
+
+# ==== Кластер (BOT_MODE=cluster) =============================================
+
+# Количество процессов-воркеров и порт первого из них (остальные - следующие порты)
+BOT_WORKERS = _get_int("BOT_WORKERS", 2)
+CLUSTER_WORKER_BASE_PORT = _get_int("CLUSTER_WORKER_BASE_PORT", 8100)
+# Сколько обновлений фронт одновременно передаёт одному воркеру
+CLUSTER_MAX_IN_FLIGHT = _get_int("CLUSTER_MAX_IN_FLIGHT", 64)
+# Сколько секунд фронт повторяет передачу обновления недоступному воркеру
+# (перезапуск воркера), прежде чем отбросить обновление
+CLUSTER_FORWARD_RETRY_SEC = _get_float("CLUSTER_FORWARD_RETRY_SEC", 30)
+# Сколько принятых, но ещё не обработанных обновлений держит фронт;
+# больше - не берёт новые (getUpdates ждёт, ответ вебхуку задерживается)
+CLUSTER_MAX_PENDING = _get_int("CLUSTER_MAX_PENDING", 1000)
+# Номер воркера (ставит фронт кластера). Фоновые задания - только в воркере 0
+BOT_WORKER_INDEX = _get_int("BOT_WORKER_INDEX", 0)
+
+# ==== Обработка обновлений ===================================================
+
+# Сколько обновлений обрабатывается одновременно (разные чаты)
+MAX_IN_FLIGHT_UPDATES = _get_int("MAX_IN_FLIGHT_UPDATES", 100)
+
+# Через сколько мс ответить на нажатие кнопки, если обработчик ещё не ответил сам
+CALLBACK_ACK_DEADLINE_MS = _get_float("CALLBACK_ACK_DEADLINE_MS", 300)
+
+# Сколько пользователей помнить в памяти и через сколько секунд записывать смену username
+USER_CACHE_SIZE = _get_int("USER_CACHE_SIZE", 100000)
+USER_FLUSH_INTERVAL_SEC = _get_float("USER_FLUSH_INTERVAL_SEC", 5)
+
+# Сколько последних нажатий кнопок помнить, чтобы не обработать повторную доставку
+CALLBACK_DEDUP_CACHE_SIZE = _get_int("CALLBACK_DEDUP_CACHE_SIZE", 10000)
+
+# ==== Отправка сообщений =====================================================
+
+# Общий лимит Bot API (сообщений в секунду) и пауза между сообщениями в один чат
+SENDER_RATE_PER_SEC = _get_float("SENDER_RATE_PER_SEC", 25)
+SENDER_CHAT_INTERVAL_MS = _get_float("SENDER_CHAT_INTERVAL_MS", 1000)
+
+# Сколько последних сообщений помнить, чтобы не отправлять редактирования без изменений
+EDIT_DEDUP_CACHE_SIZE = _get_int("EDIT_DEDUP_CACHE_SIZE", 10000)
+
+# Сводка заявок водителю: сколько секунд после первой заявки дописывать в то же
+# сообщение, как часто его редактировать и сколько заявок в одной сводке
+# (две кнопки на заявку; дальше - новое сообщение)
+DIGEST_WINDOW_SEC = _get_float("DIGEST_WINDOW_SEC", 120)
+DIGEST_EDIT_DELAY_SEC = _get_float("DIGEST_EDIT_DELAY_SEC", 1)
+DIGEST_MAX_REQUESTS = _get_int("DIGEST_MAX_REQUESTS", 20)
+
+# ==== Карточки маршрутов =====================================================
+
+# Через сколько секунд после изменения маршрута обновлять показанные карточки
+# (изменения за это время собираются в одно обновление)
+CARD_REFRESH_DELAY_SEC = _get_float("CARD_REFRESH_DELAY_SEC", 2)
+# Сколько часов карточка считается актуальной и обновляется
+CARD_REGISTRY_TTL_HOURS = _get_float("CARD_REGISTRY_TTL_HOURS", 48)
+# Сколько готовых карточек держать в памяти (ключ - маршрут, его версия, статус, вид)
+CARD_RENDER_CACHE_SIZE = _get_int("CARD_RENDER_CACHE_SIZE", 5000)
+
+# ==== Метрики ================================================================
+
+# Адрес HTTP-сервера с /metrics (формат Prometheus); METRICS_PORT=0 - не запускать.
+# Воркеры кластера слушают METRICS_PORT + 1 + номер воркера
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = _get_int("METRICS_PORT", 9100)
+
+# Сторож цикла событий (loop_watchdog.py): как часто замерять задержку и с какой
+# задержки считать цикл заблокированным (в лог - стек блокирующего кода).
+# LOOP_STRICT_MS > 0 - строгий режим для тестов: блокировка дольше - ошибка при остановке
+LOOP_WATCHDOG_INTERVAL_MS = _get_float("LOOP_WATCHDOG_INTERVAL_MS", 50)
+LOOP_LAG_WARN_MS = _get_float("LOOP_LAG_WARN_MS", 100)
+LOOP_STRICT_MS = _get_float("LOOP_STRICT_MS", 0)
+
+# Сэмплирующий профайлер (sampling_profiler.py, команда /profile): куда писать
+# файлы collapsed stacks, как часто снимать стек, окно по умолчанию, какую долю
+# самых медленных обновлений сохранять и включать ли этот режим при запуске
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_MS = _get_float("PROFILE_INTERVAL_MS", 5)
+PROFILE_WINDOW_SEC = _get_float("PROFILE_WINDOW_SEC", 30)
+PROFILE_SLOW_PERCENT = _get_float("PROFILE_SLOW_PERCENT", 1)
+PROFILE_SLOW_UPDATES = os.getenv("PROFILE_SLOW_UPDATES", "0") == "1"
+
+# Трассировка обновлений (tracing.py): файл JSONL со спанами в формате OTLP JSON
+# (пусто - выключена) и доля обновлений, которые трассируются
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+TRACE_SAMPLE_RATE = _get_float("TRACE_SAMPLE_RATE", 1)
+
+# Журнал входящих обновлений (update_recorder.py) для воспроизведения нагрузки
+# (python -m bench.replay): файл .jsonl.gz (пусто - не писать) и соль псевдонимов
+# id пользователей - с одной солью псевдонимы совпадают между перезапусками
+UPDATE_RECORD_FILE = os.getenv("UPDATE_RECORD_FILE", "")
+UPDATE_RECORD_SALT = os.getenv("UPDATE_RECORD_SALT", "")
+
+# ==== Фоновые задания ========================================================
+
+# Планировщик (scheduler.py): SCHEDULER_ENABLED=0 - не запускать (бенчмарки).
+# Как часто читать задания из БД, первая пауза перед повтором после ошибки
+# (дальше удваивается), сколько попыток, случайный сдвиг повторяющихся заданий
+# и сколько дней хранить выполненные задания
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1") == "1"
+SCHEDULER_POLL_SEC = _get_float("SCHEDULER_POLL_SEC", 30)
+SCHEDULER_RETRY_DELAY_SEC = _get_float("SCHEDULER_RETRY_DELAY_SEC", 60)
+SCHEDULER_MAX_ATTEMPTS = _get_int("SCHEDULER_MAX_ATTEMPTS", 5)
+SCHEDULER_JITTER_SEC = _get_float("SCHEDULER_JITTER_SEC", 30)
+SCHEDULER_KEEP_DAYS = _get_float("SCHEDULER_KEEP_DAYS", 7)
+
+# Снятие с публикации маршрутов, отправившихся больше ROUTE_EXPIRY_GRACE_MIN назад,
+# раз в ROUTE_EXPIRY_INTERVAL_MIN минут (0 - выключено)
+ROUTE_EXPIRY_INTERVAL_MIN = _get_float("ROUTE_EXPIRY_INTERVAL_MIN", 10)
+ROUTE_EXPIRY_GRACE_MIN = _get_float("ROUTE_EXPIRY_GRACE_MIN", 30)
+
+# Напоминание водителю и принятым пассажирам за REMINDER_BEFORE_MIN минут до
+# отправления (0 - выключено); маршруты проверяются раз в REMINDER_SCAN_MIN минут,
+# одновременно рассылается не больше REMINDER_CONCURRENCY напоминаний
+REMINDER_BEFORE_MIN = _get_int("REMINDER_BEFORE_MIN", 60)
+REMINDER_SCAN_MIN = _get_float("REMINDER_SCAN_MIN", 5)
+REMINDER_CONCURRENCY = _get_int("REMINDER_CONCURRENCY", 4)
+
+# Обслуживание БД ежедневно в VACUUM_AT ("ЧЧ:ММ", пусто - выключено): PRAGMA optimize,
+# VACUUM - только если свободных страниц больше VACUUM_FREE_RATIO
+VACUUM_AT = os.getenv("VACUUM_AT", "04:00")
+VACUUM_FREE_RATIO = _get_float("VACUUM_FREE_RATIO", 0.2)
+
+# Резервная копия БД ежедневно в BACKUP_AT в BACKUP_DIR (пусто - выключено),
+# хранятся BACKUP_KEEP последних
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+BACKUP_AT = os.getenv("BACKUP_AT", "03:30")
+BACKUP_KEEP = _get_int("BACKUP_KEEP", 7)
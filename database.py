@@ -1,9 +1,32 @@
 import sqlite3
+import json
 from datetime import datetime
 import logging
 import re
+import config
+import db_profiler
 
-DATABASE_NAME = 'poputchik.db'
+DATABASE_NAME = config.DATABASE_PATH
+
+def _connect():
+    """Соединение с замером запросов и снятием планов (db_profiler.py)"""
+    # "file:...?mode=memory&cache=shared" - общая БД в памяти (bench/db_bench.py)
+    return sqlite3.connect(DATABASE_NAME, factory=db_profiler.ProfiledConnection,
+                           uri=DATABASE_NAME.startswith("file:"))
+
+# Подписчики на изменения маршрутов (обновление показанных карточек)
+_route_listeners = []
+
+def add_route_listener(listener):
+    """listener(route_id) вызывается после каждой записи, меняющей карточку маршрута"""
+    _route_listeners.append(listener)
+
+def _notify_route_changed(route_id):
+    for listener in _route_listeners:
+        try:
+            listener(route_id)
+        except Exception as e:
+            logging.error(f"Ошибка подписчика изменений маршрута {route_id}: {e}")
 
 def is_valid_telegram_username(username):
     """Проверка что username валидный (латиница, цифры, подчёркивание)"""
@@ -15,9 +38,12 @@ def is_valid_telegram_username(username):
     return bool(re.match(pattern, username))
 
 def init_db():
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = _connect()
     cursor = conn.cursor()
     
+    # WAL: читатели не блокируют писателя - нужно, когда с БД работают несколько процессов
+    cursor.execute('PRAGMA journal_mode=WAL')
+    
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
             user_id INTEGER PRIMARY KEY,
@@ -26,9 +52,12 @@ def init_db():
             display_name TEXT,
             photo_file_id TEXT,
             bio TEXT,
-            is_active INTEGER DEFAULT 1
+            is_active INTEGER DEFAULT 1,
+            notify_digest INTEGER DEFAULT 0
         )
     ''')
+    # Заявки водителю сводкой (driver_digest.py), а не по одной
+    _ensure_column(cursor, 'users', 'notify_digest', 'INTEGER DEFAULT 0')
     
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS routes (
@@ -43,10 +72,17 @@ def init_db():
             comment TEXT,
             is_active INTEGER DEFAULT 1,
             created_at TEXT,
+            version INTEGER DEFAULT 0,
+            instant_booking INTEGER DEFAULT 0,
             FOREIGN KEY (user_id) REFERENCES users (user_id)
         )
     ''')
     
+    # Версия карточки маршрута (ключ кеша в cards.py)
+    _ensure_column(cursor, 'routes', 'version', 'INTEGER DEFAULT 0')
+    # Мгновенное бронирование: отклик сразу занимает место (database.book_seat)
+    _ensure_column(cursor, 'routes', 'instant_booking', 'INTEGER DEFAULT 0')
+    
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS requests (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -60,6 +96,20 @@ def init_db():
             FOREIGN KEY (passenger_id) REFERENCES users (user_id)
         )
     ''')
+    _ensure_live_request_index(cursor)
+    
+    # Лист ожидания на маршруты без свободных мест (очередь по id)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS waitlist (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            route_id INTEGER,
+            passenger_id INTEGER,
+            created_at TEXT,
+            UNIQUE (route_id, passenger_id)
+        )
+    ''')
+    # Голова очереди маршрута - поиск по индексу, без просмотра таблицы
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_waitlist_route ON waitlist (route_id, id)')
     
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS chats (
@@ -86,12 +136,92 @@ def init_db():
         )
     ''')
     
+    # Карточки маршрутов, показанные пользователям (для обновления после изменений)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS displayed_cards (
+            chat_id INTEGER,
+            message_id INTEGER,
+            route_id INTEGER,
+            viewer_id INTEGER,
+            variant TEXT,
+            content_hash TEXT,
+            shown_at TEXT,
+            PRIMARY KEY (chat_id, message_id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_displayed_cards_route ON displayed_cards (route_id, shown_at)')
+    
+    # Прогресс массового обновления карточек (update_old_cards.py) - для продолжения после сбоя
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS card_jobs (
+            job_id TEXT PRIMARY KEY,
+            last_request_id INTEGER DEFAULT 0,
+            updated INTEGER DEFAULT 0,
+            unchanged INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0,
+            started_at TEXT,
+            updated_at TEXT,
+            finished_at TEXT
+        )
+    ''')
+    
+    # Задания планировщика (scheduler.py): выполняются хотя бы раз, в том числе после перезапуска.
+    # job_key - уникальный ключ (повторяющееся задание, напоминание о маршруте) или NULL;
+    # locked_until - до какого времени задание считается выполняющимся (потом - снова в очередь)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scheduled_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_type TEXT,
+            job_key TEXT,
+            payload TEXT,
+            run_at REAL,
+            status TEXT DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            locked_until REAL,
+            last_error TEXT,
+            created_at TEXT,
+            finished_at TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_scheduled_jobs_due ON scheduled_jobs (status, run_at)')
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_scheduled_jobs_key ON scheduled_jobs (job_key)
+        WHERE job_key IS NOT NULL
+    ''')
+    
     conn.commit()
     conn.close()
     logging.info("База данных инициализирована")
 
+def _ensure_column(cursor, table, column, definition):
+    """Добавляет колонку, которой нет в БД, созданной старой версией бота"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+def _ensure_live_request_index(cursor):
+    """Не больше одной неотменённой заявки пассажира на маршрут - на уровне БД"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_requests_live'")
+    if cursor.fetchone():
+        return
+    # В старых БД гонка SELECT/INSERT могла оставить дубли - оставляем самую раннюю заявку
+    cursor.execute('''
+        UPDATE requests SET status = 'cancelled'
+        WHERE status != 'cancelled' AND id NOT IN (
+            SELECT MIN(id) FROM requests
+            WHERE status != 'cancelled'
+            GROUP BY route_id, passenger_id
+        )
+    ''')
+    if cursor.rowcount:
+        logging.warning(f"Отменено дублирующих заявок: {cursor.rowcount}")
+    cursor.execute('''
+        CREATE UNIQUE INDEX idx_requests_live ON requests (route_id, passenger_id)
+        WHERE status != 'cancelled'
+    ''')
+
 def get_user_by_id(user_id):
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = _connect()
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
@@ -100,12 +230,13 @@ def get_user_by_id(user_id):
     return dict(user) if user else None
 
 def create_user(user_id, username):
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = _connect()
     cursor = conn.cursor()
     created_at = datetime.now().isoformat()
     
-    cursor.execute('SELECT is_active FROM users WHERE user_id = ?', (user_id,))
+    cursor.execute('SELECT is_active, tg_username FROM users WHERE user_id = ?', (user_id,))
     existing = cursor.fetchone()
+    changed_routes = []
     
     if existing:
         is_active = existing[0]
@@ -128,6 +259,9 @@ def create_user(user_id, username):
                 SET tg_username = ?
                 WHERE user_id = ?
             ''', (username, user_id))
+            if existing[1] != username:
+                # Кнопка "Чат" в карточках маршрутов водителя ведёт на username
+                changed_routes = _bump_driver_routes(cursor, user_id)
     else:
         cursor.execute('''
             INSERT INTO users (user_id, tg_username, created_at, display_name, is_active)
@@ -137,28 +271,83 @@ def create_user(user_id, username):
     
     conn.commit()
     conn.close()
+    for route_id in changed_routes:
+        _notify_route_changed(route_id)
+
+def update_usernames(usernames):
+    """Пакетная смена username: usernames - список (user_id, username)"""
+    if not usernames:
+        return
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.executemany('UPDATE users SET tg_username = ? WHERE user_id = ?',
+                       [(username, user_id) for user_id, username in usernames])
+    changed_routes = []
+    for user_id, _ in usernames:
+        changed_routes += _bump_driver_routes(cursor, user_id)
+    conn.commit()
+    conn.close()
+    for route_id in changed_routes:
+        _notify_route_changed(route_id)
 
-def create_route(user_id, from_loc, to_loc, date_dmy, time_hm, price, seats, comment):
-    conn = sqlite3.connect(DATABASE_NAME)
+def _bump_driver_routes(cursor, user_id):
+    """Увеличивает version всех маршрутов водителя. Возвращает их id"""
+    cursor.execute('UPDATE routes SET version = version + 1 WHERE user_id = ?', (user_id,))
+    cursor.execute('SELECT id FROM routes WHERE user_id = ?', (user_id,))
+    return [row[0] for row in cursor.fetchall()]
+
+def create_route(user_id, from_loc, to_loc, date_dmy, time_hm, price, seats, comment, instant_booking=0):
+    conn = _connect()
     cursor = conn.cursor()
     created_at = datetime.now().isoformat()
     cursor.execute('''
         INSERT INTO routes (user_id, from_location, to_location, date_dmy, time_hm, 
-                           price, seats, comment, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (user_id, from_loc, to_loc, date_dmy, time_hm, price, seats, comment, created_at))
+                           price, seats, comment, created_at, instant_booking)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (user_id, from_loc, to_loc, date_dmy, time_hm, price, seats, comment, created_at,
+          1 if instant_booking else 0))
     conn.commit()
     route_id = cursor.lastrowid
     conn.close()
     logging.info(f"Создан маршрут: {route_id}")
     return route_id
 
-def search_routes(from_loc=None, to_loc=None):
-    conn = sqlite3.connect(DATABASE_NAME)
+# Маршрут вместе с данными водителя - всё, что нужно для карточки (cards.py)
+_CARD_ROUTE_COLUMNS = '''
+    r.*,
+    u.user_id AS driver_user_id,
+    u.display_name AS driver_name,
+    u.bio AS driver_bio,
+    u.tg_username AS driver_username,
+    u.notify_digest AS driver_notify_digest
+'''
+
+# Статус последней заявки смотрящего на маршрут (параметр - passenger_id)
+_VIEWER_STATUS_COLUMN = '''
+    (SELECT q.status FROM requests q
+     WHERE q.route_id = r.id AND q.passenger_id = ?
+     ORDER BY q.created_at DESC LIMIT 1) AS viewer_status
+'''
+
+# Флаги для статуса маршрута в "Мои маршруты"
+_OWNER_FLAGS_COLUMNS = '''
+    EXISTS (SELECT 1 FROM requests q WHERE q.route_id = r.id AND q.status = 'accepted') AS has_accepted,
+    EXISTS (SELECT 1 FROM requests q WHERE q.route_id = r.id AND q.status = 'rejected') AS has_rejected
+'''
+
+def search_routes(from_loc=None, to_loc=None, viewer_id=None):
+    """Активные маршруты для карточек поиска; viewer_status - статус заявки viewer_id"""
+    conn = _connect()
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
-    cursor.execute('SELECT * FROM routes WHERE is_active = 1 ORDER BY created_at ASC')
+    cursor.execute(f'''
+        SELECT {_CARD_ROUTE_COLUMNS}, {_VIEWER_STATUS_COLUMN}
+        FROM routes r
+        LEFT JOIN users u ON u.user_id = r.user_id
+        WHERE r.is_active = 1
+        ORDER BY r.created_at ASC
+    ''', (viewer_id,))
     all_routes = cursor.fetchall()
     conn.close()
     
@@ -180,7 +369,7 @@ def search_routes(from_loc=None, to_loc=None):
     return filtered_routes
 
 def get_route_by_id(route_id):
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = _connect()
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM routes WHERE id = ?', (route_id,))
@@ -189,44 +378,134 @@ def get_route_by_id(route_id):
     return dict(route) if route else None
 
 def get_user_routes(user_id):
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = _connect()
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT * FROM routes 
-        WHERE user_id = ? AND is_active = 1 
-        ORDER BY created_at ASC
+    cursor.execute(f'''
+        SELECT {_CARD_ROUTE_COLUMNS}, {_OWNER_FLAGS_COLUMNS}
+        FROM routes r
+        LEFT JOIN users u ON u.user_id = r.user_id
+        WHERE r.user_id = ? AND r.is_active = 1 
+        ORDER BY r.created_at ASC
     ''', (user_id,))
     routes = cursor.fetchall()
     conn.close()
     return [dict(row) for row in routes]
 
-def create_request(route_id, passenger_id):
-    conn = sqlite3.connect(DATABASE_NAME)
+def get_card_route(route_id, viewer_id=None):
+    """Маршрут со всеми данными для любой карточки (cards.py)"""
+    conn = _connect()
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT {_CARD_ROUTE_COLUMNS}, {_VIEWER_STATUS_COLUMN}, {_OWNER_FLAGS_COLUMNS}
+        FROM routes r
+        LEFT JOIN users u ON u.user_id = r.user_id
+        WHERE r.id = ?
+    ''', (viewer_id, route_id))
+    route = cursor.fetchone()
+    conn.close()
+    return dict(route) if route else None
+
+def get_route_request_statuses(route_id):
+    """{passenger_id: статус последней заявки} по маршруту"""
+    conn = _connect()
     cursor = conn.cursor()
-    created_at = datetime.now().isoformat()
-    
     cursor.execute('''
-        SELECT id FROM requests 
-        WHERE route_id = ? AND passenger_id = ? AND status != 'cancelled'
-    ''', (route_id, passenger_id))
+        SELECT passenger_id, status FROM requests
+        WHERE route_id = ?
+        ORDER BY created_at ASC
+    ''', (route_id,))
+    statuses = dict(cursor.fetchall())
+    conn.close()
+    return statuses
+
+def create_or_get_request(route_id, passenger_id):
+    """
+    Создаёт заявку или возвращает уже существующую неотменённую.
+    Возвращает (request_id, создана ли новая). Одновременные вызовы
+    не создадут двух заявок - их не пропустит индекс idx_requests_live.
+    """
+    conn = _connect()
+    cursor = conn.cursor()
+    created_at = datetime.now().isoformat()
     
-    if cursor.fetchone():
-        conn.close()
-        return None
+    try:
+        cursor.execute('''
+            INSERT INTO requests (route_id, passenger_id, created_at)
+            VALUES (?, ?, ?)
+        ''', (route_id, passenger_id, created_at))
+        request_id, created = cursor.lastrowid, True
+    except sqlite3.IntegrityError:
+        # Неотменённая заявка уже есть (idx_requests_live)
+        cursor.execute('''
+            SELECT id FROM requests 
+            WHERE route_id = ? AND passenger_id = ? AND status != 'cancelled'
+        ''', (route_id, passenger_id))
+        row = cursor.fetchone()
+        if row is None:
+            conn.close()
+            raise
+        request_id, created = row[0], False
+    conn.commit()
+    conn.close()
     
+    if created:
+        logging.info(f"Создана заявка: {request_id}")
+        _notify_route_changed(route_id)
+    return request_id, created
+
+def book_seat(route_id, passenger_id):
+    """
+    Мгновенное бронирование: принятая заявка и списание места одной транзакцией.
+    Возвращает (request_id, результат, оставшиеся места): "booked" - место занято,
+    "exists" - пассажир уже откликался (request_id его заявки),
+    "full" - мест нет или маршрут неактивен (request_id = None).
+    Оставшиеся места известны только для "booked", иначе None.
+    """
+    conn = _connect()
+    cursor = conn.cursor()
+    created_at = datetime.now().isoformat()
+    cursor.execute('BEGIN IMMEDIATE')
     cursor.execute('''
-        INSERT INTO requests (route_id, passenger_id, created_at)
-        VALUES (?, ?, ?)
+        INSERT OR IGNORE INTO requests (route_id, passenger_id, status, created_at)
+        VALUES (?, ?, 'accepted', ?)
     ''', (route_id, passenger_id, created_at))
-    conn.commit()
+    if cursor.rowcount != 1:
+        conn.rollback()
+        cursor.execute('''
+            SELECT id FROM requests 
+            WHERE route_id = ? AND passenger_id = ? AND status != 'cancelled'
+        ''', (route_id, passenger_id))
+        row = cursor.fetchone()
+        conn.close()
+        return (row[0] if row else None), "exists", None
     request_id = cursor.lastrowid
+
+    cursor.execute('''
+        UPDATE routes SET seats = seats - 1, version = version + 1
+        WHERE id = ? AND is_active = 1 AND seats > 0
+    ''', (route_id,))
+    if cursor.rowcount != 1:
+        conn.rollback()
+        conn.close()
+        return None, "full", None
+    cursor.execute('SELECT seats FROM routes WHERE id = ?', (route_id,))
+    seats_left = cursor.fetchone()[0]
+    conn.commit()
     conn.close()
-    logging.info(f"Создана заявка: {request_id}")
-    return request_id
+
+    logging.info(f"Заявка {request_id}: место на маршруте {route_id} забронировано")
+    _notify_route_changed(route_id)
+    return request_id, "booked", seats_left
+
+def create_request(route_id, passenger_id):
+    """ID новой заявки или None, если пассажир уже откликался"""
+    request_id, created = create_or_get_request(route_id, passenger_id)
+    return request_id if created else None
 
 def get_route_requests(route_id):
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = _connect()
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     cursor.execute('''
@@ -241,15 +520,103 @@ def get_route_requests(route_id):
     return [dict(row) for row in requests]
 
 def update_request_status(request_id, status):
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = _connect()
     cursor = conn.cursor()
     cursor.execute('UPDATE requests SET status = ? WHERE id = ?', (status, request_id))
+    cursor.execute('SELECT route_id FROM requests WHERE id = ?', (request_id,))
+    row = cursor.fetchone()
     conn.commit()
     conn.close()
     logging.info(f"Заявка {request_id} → {status}")
+    if row:
+        _notify_route_changed(row[0])
+
+def accept_request(request_id):
+    """
+    Водитель принял заявку: статус и списание места одной транзакцией.
+    Возвращает оставшееся число мест или None, если заявка уже обработана
+    или мест нет.
+    """
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    cursor.execute("SELECT route_id FROM requests WHERE id = ? AND status = 'pending'", (request_id,))
+    row = cursor.fetchone()
+    if row is None:
+        conn.rollback()
+        conn.close()
+        return None
+    route_id = row[0]
+    cursor.execute('''
+        UPDATE routes SET seats = seats - 1, version = version + 1
+        WHERE id = ? AND seats > 0
+    ''', (route_id,))
+    if cursor.rowcount != 1:
+        conn.rollback()
+        conn.close()
+        return None
+    cursor.execute("UPDATE requests SET status = 'accepted' WHERE id = ?", (request_id,))
+    cursor.execute('SELECT seats FROM routes WHERE id = ?', (route_id,))
+    seats_left = cursor.fetchone()[0]
+    conn.commit()
+    conn.close()
+
+    logging.info(f"Заявка {request_id} → accepted")
+    _notify_route_changed(route_id)
+    return seats_left
+
+def decide_pending_requests(route_id, driver_id, accept_limit=None, reject_rest=False):
+    """
+    Решение водителя сразу по всем ожидающим заявкам маршрута - одной транзакцией.
+    Принимает до accept_limit самых ранних заявок (None - сколько позволяют места)
+    и списывает места; reject_rest=True - отклоняет оставшиеся.
+    Возвращает (маршрут до изменений, принятые, отклонённые), заявки - списки
+    (request_id, passenger_id). Чужой или отменённый маршрут - (None, [], []).
+    """
+    conn = _connect()
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    # IMMEDIATE: места и статусы не изменятся между чтением и записью
+    cursor.execute('BEGIN IMMEDIATE')
+    cursor.execute('SELECT * FROM routes WHERE id = ? AND user_id = ? AND is_active = 1',
+                   (route_id, driver_id))
+    route = cursor.fetchone()
+    if route is None:
+        conn.rollback()
+        conn.close()
+        return None, [], []
+    route = dict(route)
+
+    cursor.execute('''
+        SELECT id, passenger_id FROM requests
+        WHERE route_id = ? AND status = 'pending'
+        ORDER BY created_at, id
+    ''', (route_id,))
+    pending = [(row['id'], row['passenger_id']) for row in cursor.fetchall()]
+
+    free = max(route['seats'] or 0, 0)
+    count = free if accept_limit is None else min(accept_limit, free)
+    accepted = pending[:count]
+    rejected = pending[count:] if reject_rest else []
+
+    if accepted:
+        cursor.executemany("UPDATE requests SET status = 'accepted' WHERE id = ?",
+                           [(request_id,) for request_id, _ in accepted])
+        cursor.execute('UPDATE routes SET seats = seats - ?, version = version + 1 WHERE id = ?',
+                       (len(accepted), route_id))
+    if rejected:
+        cursor.executemany("UPDATE requests SET status = 'rejected' WHERE id = ?",
+                           [(request_id,) for request_id, _ in rejected])
+    conn.commit()
+    conn.close()
+
+    if accepted or rejected:
+        logging.info(f"Маршрут {route_id}: принято заявок {len(accepted)}, отклонено {len(rejected)}")
+        _notify_route_changed(route_id)
+    return route, accepted, rejected
 
 def get_request_by_id(request_id):
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = _connect()
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM requests WHERE id = ?', (request_id,))
@@ -258,7 +625,7 @@ def get_request_by_id(request_id):
     return dict(request) if request else None
 
 def get_user_trips(user_id):
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = _connect()
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     cursor.execute('''
@@ -275,9 +642,15 @@ def get_user_trips(user_id):
             r.seats,
             r.comment,
             r.is_active,
-            r.user_id as driver_id
+            r.version,
+            r.user_id as driver_id,
+            u.user_id as driver_user_id,
+            u.display_name as driver_name,
+            u.bio as driver_bio,
+            u.tg_username as driver_username
         FROM requests req
         JOIN routes r ON req.route_id = r.id
+        LEFT JOIN users u ON u.user_id = r.user_id
         WHERE req.passenger_id = ?
         ORDER BY req.created_at ASC
     ''', (user_id,))
@@ -286,36 +659,139 @@ def get_user_trips(user_id):
     return [dict(row) for row in trips]
 
 def cancel_trip_request(request_id, user_id):
-    conn = sqlite3.connect(DATABASE_NAME)
+    """Отмена заявки пассажиром. Место принятой заявки возвращается в той же транзакции"""
+    conn = _connect()
     cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
     
     cursor.execute('''
-        SELECT passenger_id FROM requests WHERE id = ?
+        SELECT passenger_id, route_id, status FROM requests WHERE id = ?
     ''', (request_id,))
     result = cursor.fetchone()
     
-    if not result or result[0] != user_id:
+    if not result or result[0] != user_id or result[2] == 'cancelled':
+        conn.rollback()
         conn.close()
         return False
     
     cursor.execute('''
         UPDATE requests SET status = 'cancelled' WHERE id = ?
     ''', (request_id,))
+    if result[2] == 'accepted':
+        cursor.execute('UPDATE routes SET seats = seats + 1, version = version + 1 WHERE id = ?',
+                       (result[1],))
     conn.commit()
     conn.close()
     logging.info(f"Заявка {request_id} отменена пассажиром {user_id}")
+    _notify_route_changed(result[1])
     return True
 
+def join_waitlist(route_id, passenger_id):
+    """Ставит пассажира в лист ожидания маршрута. Возвращает номер в очереди"""
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT OR IGNORE INTO waitlist (route_id, passenger_id, created_at)
+        VALUES (?, ?, ?)
+    ''', (route_id, passenger_id, datetime.now().isoformat()))
+    cursor.execute('''
+        SELECT COUNT(*) FROM waitlist
+        WHERE route_id = ? AND id <= (
+            SELECT id FROM waitlist WHERE route_id = ? AND passenger_id = ?
+        )
+    ''', (route_id, route_id, passenger_id))
+    position = cursor.fetchone()[0]
+    conn.commit()
+    conn.close()
+    return position
+
+def get_waitlist_size(route_id):
+    """Сколько пассажиров в листе ожидания маршрута"""
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('SELECT COUNT(*) FROM waitlist WHERE route_id = ?', (route_id,))
+    size = cursor.fetchone()[0]
+    conn.close()
+    return size
+
+def promote_waitlist(route_id):
+    """
+    Переводит пассажиров из листа ожидания в заявки, пока есть свободные места.
+    Свободно: seats минус ожидающие решения заявки. На маршруте с мгновенным
+    бронированием заявка сразу принята и занимает место, на обычном - ждёт
+    решения водителя. Одна транзакция; голова очереди берётся по индексу.
+    Возвращает (маршрут до перевода, [(request_id, passenger_id, status, seats_left), ...]);
+    seats_left - места после брони этого пассажира (для ожидающей заявки - мест не меняет).
+    """
+    conn = _connect()
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    cursor.execute('SELECT * FROM routes WHERE id = ? AND is_active = 1', (route_id,))
+    route = cursor.fetchone()
+    if route is None:
+        conn.rollback()
+        conn.close()
+        return None, []
+    route = dict(route)
+
+    cursor.execute("SELECT COUNT(*) FROM requests WHERE route_id = ? AND status = 'pending'", (route_id,))
+    free = (route['seats'] or 0) - cursor.fetchone()[0]
+    status = 'accepted' if route.get('instant_booking') else 'pending'
+    created_at = datetime.now().isoformat()
+
+    seats_left = route['seats'] or 0
+    promoted = []
+    while free > 0:
+        cursor.execute('SELECT id, passenger_id FROM waitlist WHERE route_id = ? ORDER BY id LIMIT 1',
+                       (route_id,))
+        head = cursor.fetchone()
+        if head is None:
+            break
+        cursor.execute('DELETE FROM waitlist WHERE id = ?', (head['id'],))
+        cursor.execute('''
+            INSERT OR IGNORE INTO requests (route_id, passenger_id, status, created_at)
+            VALUES (?, ?, ?, ?)
+        ''', (route_id, head['passenger_id'], status, created_at))
+        if cursor.rowcount != 1:
+            # У пассажира уже есть заявка на этот маршрут
+            continue
+        if status == 'accepted':
+            seats_left -= 1
+        promoted.append((cursor.lastrowid, head['passenger_id'], status, seats_left))
+        free -= 1
+
+    if promoted and status == 'accepted':
+        cursor.execute('UPDATE routes SET seats = seats - ?, version = version + 1 WHERE id = ?',
+                       (len(promoted), route_id))
+    conn.commit()
+    conn.close()
+
+    if promoted:
+        logging.info(f"Маршрут {route_id}: из листа ожидания переведено {len(promoted)}")
+        _notify_route_changed(route_id)
+    return route, promoted
+
 def cancel_route(route_id):
-    conn = sqlite3.connect(DATABASE_NAME)
+    """
+    Отменяет маршрут и очищает его лист ожидания (одна транзакция).
+    Возвращает id пассажиров, которые были в листе ожидания, - для уведомлений
+    """
+    conn = _connect()
     cursor = conn.cursor()
-    cursor.execute('UPDATE routes SET is_active = 0 WHERE id = ?', (route_id,))
+    cursor.execute('BEGIN IMMEDIATE')
+    cursor.execute('UPDATE routes SET is_active = 0, version = version + 1 WHERE id = ?', (route_id,))
+    cursor.execute('SELECT passenger_id FROM waitlist WHERE route_id = ? ORDER BY id', (route_id,))
+    waitlisted = [row[0] for row in cursor.fetchall()]
+    cursor.execute('DELETE FROM waitlist WHERE route_id = ?', (route_id,))
     conn.commit()
     conn.close()
-    logging.info(f"Маршрут {route_id} отменён")
+    logging.info(f"Маршрут {route_id} отменён, удалено из листа ожидания: {len(waitlisted)}")
+    _notify_route_changed(route_id)
+    return waitlisted
 
 def update_route(route_id, **kwargs):
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = _connect()
     cursor = conn.cursor()
     
     updates = []
@@ -324,6 +800,7 @@ def update_route(route_id, **kwargs):
         updates.append(f"{key} = ?")
         values.append(value)
     
+    updates.append("version = version + 1")
     values.append(route_id)
     query = f"UPDATE routes SET {', '.join(updates)} WHERE id = ?"
     
@@ -331,9 +808,10 @@ def update_route(route_id, **kwargs):
     conn.commit()
     conn.close()
     logging.info(f"Маршрут {route_id} обновлён")
+    _notify_route_changed(route_id)
 
 def create_chat(request_id, driver_id, passenger_id):
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = _connect()
     cursor = conn.cursor()
     created_at = datetime.now().isoformat()
     
@@ -357,7 +835,7 @@ def create_chat(request_id, driver_id, passenger_id):
     return chat_id
 
 def get_chat_by_request(request_id):
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = _connect()
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM chats WHERE request_id = ?', (request_id,))
@@ -366,7 +844,7 @@ def get_chat_by_request(request_id):
     return dict(chat) if chat else None
 
 def save_message(chat_id, sender_id, message_text):
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = _connect()
     cursor = conn.cursor()
     created_at = datetime.now().isoformat()
     cursor.execute('''
@@ -377,7 +855,7 @@ def save_message(chat_id, sender_id, message_text):
     conn.close()
 
 def get_chat_messages(chat_id):
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = _connect()
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     cursor.execute('''
@@ -394,7 +872,7 @@ def get_user_profile(user_id):
     if not user:
         return None
     
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = _connect()
     cursor = conn.cursor()
     
     cursor.execute('SELECT COUNT(*) FROM routes WHERE user_id = ? AND is_active = 1', (user_id,))
@@ -410,12 +888,13 @@ def get_user_profile(user_id):
         'display_name': user['display_name'],
         'bio': user['bio'],
         'photo_file_id': user['photo_file_id'],
+        'notify_digest': user['notify_digest'],
         'routes_count': routes_count,
         'trips_count': trips_count
     }
 
 def update_user_profile(user_id, **kwargs):
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = _connect()
     cursor = conn.cursor()
     
     updates = []
@@ -428,23 +907,54 @@ def update_user_profile(user_id, **kwargs):
     query = f"UPDATE users SET {', '.join(updates)} WHERE user_id = ?"
     
     cursor.execute(query, values)
+    changed_routes = []
+    if 'display_name' in kwargs or 'bio' in kwargs:
+        # Имя и описание водителя показываются в карточках его маршрутов
+        changed_routes = _bump_driver_routes(cursor, user_id)
     conn.commit()
     conn.close()
     logging.info(f"Профиль {user_id} обновлён")
+    for route_id in changed_routes:
+        _notify_route_changed(route_id)
 
 def delete_user(user_id):
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = _connect()
     cursor = conn.cursor()
     
+    cursor.execute('SELECT id FROM routes WHERE user_id = ?', (user_id,))
+    route_ids = [row[0] for row in cursor.fetchall()]
     cursor.execute('UPDATE users SET is_active = 0 WHERE user_id = ?', (user_id,))
     cursor.execute('DELETE FROM routes WHERE user_id = ?', (user_id,))
     
     conn.commit()
     conn.close()
     logging.info(f"Пользователь {user_id} деактивирован, маршруты удалены")
+    for route_id in route_ids:
+        _notify_route_changed(route_id)
+
+def get_digest_requests(request_ids):
+    """Заявки для сводки водителя: статус, пассажир и маршрут"""
+    if not request_ids:
+        return []
+    conn = _connect()
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    placeholders = ', '.join('?' * len(request_ids))
+    cursor.execute(f'''
+        SELECT req.id, req.status, req.passenger_id, u.tg_username,
+               r.from_location, r.to_location, r.date_dmy, r.time_hm, r.seats
+        FROM requests req
+        JOIN routes r ON req.route_id = r.id
+        LEFT JOIN users u ON u.user_id = req.passenger_id
+        WHERE req.id IN ({placeholders})
+        ORDER BY req.id
+    ''', list(request_ids))
+    rows = cursor.fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
 
 def get_passenger_request_status(route_id, passenger_id):
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = _connect()
     cursor = conn.cursor()
     cursor.execute('''
         SELECT status FROM requests 
@@ -457,7 +967,7 @@ def get_passenger_request_status(route_id, passenger_id):
     return result[0] if result else None
 
 def update_request_card_info(request_id, card_chat_id, card_message_id):
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = _connect()
     cursor = conn.cursor()
     cursor.execute('''
         UPDATE requests 
@@ -465,4 +975,304 @@ def update_request_card_info(request_id, card_chat_id, card_message_id):
         WHERE id = ?
     ''', (card_chat_id, card_message_id, request_id))
     conn.commit()
-    conn.close()
\ No newline at end of file
+    conn.close()
+
+def register_displayed_cards(cards):
+    """cards - список (route_id, chat_id, message_id, viewer_id, variant, content_hash)"""
+    if not cards:
+        return
+    conn = _connect()
+    cursor = conn.cursor()
+    shown_at = datetime.now().isoformat()
+    cursor.executemany('''
+        INSERT OR REPLACE INTO displayed_cards
+            (route_id, chat_id, message_id, viewer_id, variant, content_hash, shown_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [tuple(card) + (shown_at,) for card in cards])
+    conn.commit()
+    conn.close()
+
+def get_displayed_cards(route_id, shown_after):
+    """Карточки маршрута, показанные не раньше shown_after (ISO-строка)"""
+    conn = _connect()
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT * FROM displayed_cards
+        WHERE route_id = ? AND shown_at >= ?
+    ''', (route_id, shown_after))
+    cards = cursor.fetchall()
+    conn.close()
+    return [dict(row) for row in cards]
+
+def update_displayed_card_hash(chat_id, message_id, content_hash):
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE displayed_cards SET content_hash = ?
+        WHERE chat_id = ? AND message_id = ?
+    ''', (content_hash, chat_id, message_id))
+    conn.commit()
+    conn.close()
+
+def delete_displayed_card(chat_id, message_id):
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM displayed_cards WHERE chat_id = ? AND message_id = ?', (chat_id, message_id))
+    conn.commit()
+    conn.close()
+
+def delete_expired_displayed_cards(shown_before):
+    """Удаляет карточки, показанные раньше shown_before. Возвращает количество"""
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM displayed_cards WHERE shown_at < ?', (shown_before,))
+    deleted = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return deleted
+
+def get_card_requests_after(last_request_id, limit):
+    """Следующая порция заявок с сохранённой карточкой (по возрастанию id)"""
+    conn = _connect()
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT id, route_id, passenger_id, status, card_chat_id, card_message_id
+        FROM requests
+        WHERE id > ? AND card_chat_id IS NOT NULL AND card_message_id IS NOT NULL
+        ORDER BY id
+        LIMIT ?
+    ''', (last_request_id, limit))
+    rows = cursor.fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def get_card_job(job_id):
+    conn = _connect()
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM card_jobs WHERE job_id = ?', (job_id,))
+    job = cursor.fetchone()
+    conn.close()
+    return dict(job) if job else None
+
+def start_card_job(job_id, restart=False):
+    """Создаёт задание или продолжает незавершённое. Возвращает его состояние"""
+    conn = _connect()
+    cursor = conn.cursor()
+    now = datetime.now().isoformat()
+    if restart:
+        cursor.execute('DELETE FROM card_jobs WHERE job_id = ?', (job_id,))
+    cursor.execute('''
+        INSERT OR IGNORE INTO card_jobs (job_id, started_at, updated_at)
+        VALUES (?, ?, ?)
+    ''', (job_id, now, now))
+    conn.commit()
+    conn.close()
+    return get_card_job(job_id)
+
+def save_card_job_progress(job_id, last_request_id, updated, unchanged, failed, finished=False):
+    """Контрольная точка: всё до last_request_id включительно обработано"""
+    conn = _connect()
+    cursor = conn.cursor()
+    now = datetime.now().isoformat()
+    cursor.execute('''
+        UPDATE card_jobs
+        SET last_request_id = ?, updated = ?, unchanged = ?, failed = ?,
+            updated_at = ?, finished_at = ?
+        WHERE job_id = ?
+    ''', (last_request_id, updated, unchanged, failed, now, now if finished else None, job_id))
+    conn.commit()
+    conn.close()
+
+# Дата и время отправления маршрута в сортируемом виде "YYYY-MM-DD HH:MM"
+_DEPARTURE_SQL = (
+    "substr(date_dmy, 7, 4) || '-' || substr(date_dmy, 4, 2) || '-' || substr(date_dmy, 1, 2)"
+    " || ' ' || time_hm"
+)
+
+def add_scheduled_job(job_type, run_at, payload=None, job_key=None):
+    """Новое задание планировщика. Задание с уже существующим job_key не создаётся.
+    Возвращает (id, run_at) созданного или существующего задания"""
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT OR IGNORE INTO scheduled_jobs (job_type, job_key, payload, run_at, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (job_type, job_key, json.dumps(payload or {}, ensure_ascii=False), run_at,
+          datetime.now().isoformat()))
+    if cursor.rowcount:
+        job = (cursor.lastrowid, run_at)
+    else:
+        cursor.execute('SELECT id, run_at FROM scheduled_jobs WHERE job_key = ?', (job_key,))
+        job = tuple(cursor.fetchone())
+    conn.commit()
+    conn.close()
+    return job
+
+def get_due_jobs(before, now):
+    """Задания, которые нужно выполнить до before: ожидающие и зависшие
+    (выполнявшиеся процессом, который упал, - locked_until в прошлом)"""
+    conn = _connect()
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT id, job_type, run_at FROM scheduled_jobs
+        WHERE (status = 'pending' AND run_at <= ?) OR (status = 'running' AND locked_until < ?)
+        ORDER BY run_at
+    ''', (before, now))
+    jobs = cursor.fetchall()
+    conn.close()
+    return [dict(row) for row in jobs]
+
+def claim_scheduled_job(job_id, now, lock_sec):
+    """Забирает задание на выполнение. None - его уже забрал другой процесс или оно выполнено"""
+    conn = _connect()
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE scheduled_jobs
+        SET status = 'running', attempts = attempts + 1, locked_until = ?
+        WHERE id = ? AND ((status = 'pending' AND run_at <= ?) OR (status = 'running' AND locked_until < ?))
+    ''', (now + lock_sec, job_id, now, now))
+    job = None
+    if cursor.rowcount:
+        cursor.execute('SELECT * FROM scheduled_jobs WHERE id = ?', (job_id,))
+        job = dict(cursor.fetchone())
+        job["payload"] = json.loads(job["payload"] or "{}")
+    conn.commit()
+    conn.close()
+    return job
+
+def finish_scheduled_job(job_id, next_run_at=None):
+    """Задание выполнено. next_run_at - следующий запуск повторяющегося задания"""
+    conn = _connect()
+    cursor = conn.cursor()
+    if next_run_at is None:
+        cursor.execute('''
+            UPDATE scheduled_jobs SET status = 'done', locked_until = NULL, last_error = NULL, finished_at = ?
+            WHERE id = ?
+        ''', (datetime.now().isoformat(), job_id))
+    else:
+        cursor.execute('''
+            UPDATE scheduled_jobs
+            SET status = 'pending', run_at = ?, attempts = 0, locked_until = NULL, finished_at = ?
+            WHERE id = ?
+        ''', (next_run_at, datetime.now().isoformat(), job_id))
+    conn.commit()
+    conn.close()
+
+def retry_scheduled_job(job_id, run_at, error, failed=False):
+    """Ошибка задания: повтор в run_at или (failed) окончательная неудача"""
+    conn = _connect()
+    cursor = conn.cursor()
+    # finished_at неудавшегося задания - по нему delete_finished_jobs удаляет старые строки
+    finished_at = datetime.now().isoformat() if failed else None
+    cursor.execute('''
+        UPDATE scheduled_jobs
+        SET status = ?, run_at = ?, locked_until = NULL, last_error = ?, finished_at = COALESCE(?, finished_at)
+        WHERE id = ?
+    ''', ('failed' if failed else 'pending', run_at, error, finished_at, job_id))
+    conn.commit()
+    conn.close()
+
+def release_scheduled_job(job_id):
+    """Задание прервано остановкой бота - вернуть в очередь без учёта попытки"""
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE scheduled_jobs SET status = 'pending', attempts = attempts - 1, locked_until = NULL
+        WHERE id = ? AND status = 'running'
+    ''', (job_id,))
+    conn.commit()
+    conn.close()
+
+def count_scheduled_jobs():
+    """{статус: количество заданий}"""
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('SELECT status, COUNT(*) FROM scheduled_jobs GROUP BY status')
+    counts = dict(cursor.fetchall())
+    conn.close()
+    return counts
+
+def delete_finished_jobs(finished_before):
+    """Удаляет выполненные и неудавшиеся задания, завершённые раньше finished_before"""
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('''
+        DELETE FROM scheduled_jobs
+        WHERE status IN ('done', 'failed') AND finished_at < ?
+    ''', (finished_before,))
+    deleted = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return deleted
+
+def expire_routes(departed_before):
+    """Снимает с публикации маршруты, отправившиеся раньше departed_before (datetime).
+    Возвращает их id"""
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT id FROM routes
+        WHERE is_active = 1 AND {_DEPARTURE_SQL} < ?
+    ''', (departed_before.strftime('%Y-%m-%d %H:%M'),))
+    route_ids = [row[0] for row in cursor.fetchall()]
+    cursor.executemany(
+        'UPDATE routes SET is_active = 0, version = version + 1 WHERE id = ? AND is_active = 1',
+        [(route_id,) for route_id in route_ids],
+    )
+    conn.commit()
+    conn.close()
+    if route_ids:
+        logging.info(f"Завершено маршрутов по времени отправления: {len(route_ids)}")
+    return route_ids
+
+def get_departing_routes(departs_after, departs_before):
+    """Активные маршруты с отправлением в (departs_after, departs_before]
+    и принятые пассажиры каждого: [{..., "passenger_ids": [...]}]"""
+    conn = _connect()
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    # status != 'cancelled' - чтобы пассажиры искались по индексу idx_requests_live
+    cursor.execute(f'''
+        SELECT id, user_id, from_location, to_location, date_dmy, time_hm,
+               (SELECT GROUP_CONCAT(q.passenger_id) FROM requests q
+                WHERE q.route_id = routes.id AND q.status != 'cancelled' AND q.status = 'accepted') AS passengers
+        FROM routes
+        WHERE is_active = 1 AND {_DEPARTURE_SQL} > ? AND {_DEPARTURE_SQL} <= ?
+    ''', (departs_after.strftime('%Y-%m-%d %H:%M'), departs_before.strftime('%Y-%m-%d %H:%M')))
+    routes = []
+    for row in cursor.fetchall():
+        route = dict(row)
+        passengers = route.pop("passengers")
+        route["passenger_ids"] = [int(p) for p in passengers.split(",")] if passengers else []
+        routes.append(route)
+    conn.close()
+    return routes
+
+def optimize_database(vacuum_free_ratio):
+    """PRAGMA optimize, сброс WAL и VACUUM, если свободных страниц больше vacuum_free_ratio"""
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('PRAGMA optimize')
+    page_count = cursor.execute('PRAGMA page_count').fetchone()[0]
+    free_pages = cursor.execute('PRAGMA freelist_count').fetchone()[0]
+    vacuumed = bool(page_count) and free_pages / page_count > vacuum_free_ratio
+    if vacuumed:
+        cursor.execute('VACUUM')
+    cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+    return {"pages": page_count, "free_pages": free_pages, "vacuumed": vacuumed}
+
+def backup_database(path, pages_per_step=1000):
+    """Копия БД в path через sqlite3 backup: порциями, не останавливая запись"""
+    source = _connect()
+    target = sqlite3.connect(path)
+    try:
+        source.backup(target, pages=pages_per_step)
+    finally:
+        target.close()
+        source.close()
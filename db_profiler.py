@@ -0,0 +1,207 @@
+# coding: utf-8
+"""
+Профилирование запросов database.py.
+Соединения открываются через database._connect() с factory=ProfiledConnection,
+поэтому каждый execute/executemany:
+- замеряется (вместе с последующим fetch*);
+- если дольше DB_SLOW_QUERY_MS - пишется в лог вместе с параметрами;
+- при первом выполнении каждого нового SQL получает EXPLAIN QUERY PLAN;
+  полный просмотр (SCAN без индекса) таблицы из DB_HOT_TABLES - предупреждение.
+count_queries() считает запросы внутри блока (бенчмарки по сценариям).
+"""
+import contextvars
+import logging
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import config
+
+# Сколько разных SQL помнить с планами (динамические IN (?, ?, ...) и SET дают варианты)
+MAX_PLANS = 500
+
+_SPACES = re.compile(r"\s+")
+_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?(.*)$")
+# "FROM routes r", "JOIN users AS u" - в плане SQLite пишет псевдоним, а не таблицу
+_TABLE_ALIAS = re.compile(r"\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+_NOT_ALIASES = {"WHERE", "JOIN", "LEFT", "INNER", "CROSS", "ON", "SET", "ORDER", "GROUP", "LIMIT", "VALUES",
+                "SELECT", "USING", "AS", "NATURAL", "DEFAULT"}
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE", "WITH")
+
+# Счётчик запросов текущего контекста (count_queries) - для бенчмарков по сценариям
+_query_counter: "contextvars.ContextVar[Optional[List[int]]]" = contextvars.ContextVar(
+    "poputchik_query_counter", default=None)
+
+@contextmanager
+def count_queries() -> Iterator[List[int]]:
+    """Считает запросы внутри блока, включая задачи, созданные в нём: counter[0]"""
+    counter = [0]
+    token = _query_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _query_counter.reset(token)
+
+def normalize_sql(sql: str) -> str:
+    return _SPACES.sub(" ", sql).strip()
+
+def _aliases(sql: str) -> Dict[str, str]:
+    """Имя в плане -> таблица"""
+    names = {}
+    for table, alias in _TABLE_ALIAS.findall(sql):
+        names[table] = table
+        if alias and alias.upper() not in _NOT_ALIASES:
+            names[alias] = table
+    return names
+
+def scanned_tables(sql: str, plan: List[str]) -> List[str]:
+    """Таблицы, которые план просматривает целиком (SCAN без индекса)"""
+    names = _aliases(sql)
+    tables = []
+    for line in plan:
+        match = _SCAN.match(line)
+        if match and "USING" not in match.group(2):
+            table = names.get(match.group(1), match.group(1))
+            if table not in tables:
+                tables.append(table)
+    return tables
+
+class QueryProfiler:
+    """Счётчики запросов, медленные запросы и планы выполнения"""
+
+    def __init__(self, slow_ms: float = 50.0, hot_tables: Tuple[str, ...] = (), explain: bool = True) -> None:
+        self.slow_sec = slow_ms / 1000
+        self.hot_tables = set(hot_tables)
+        self.explain = explain
+        # нормализованный SQL -> строки плана
+        self.plans: "OrderedDict[str, List[str]]" = OrderedDict()
+        self.statements = 0
+        self.total_seconds = 0.0
+        self.slow = 0
+        self.hot_scans = 0
+
+    def observe(self, sql: str, params: Any, seconds: float, before: float = 0.0) -> None:
+        """Время выполнения; before - уже учтённое время того же запроса (до fetch*)"""
+        if not before:
+            self.statements += 1
+            counter = _query_counter.get()
+            if counter is not None:
+                counter[0] += 1
+        self.total_seconds += seconds
+        total = before + seconds
+        if total >= self.slow_sec and not (before and before >= self.slow_sec):
+            self.slow += 1
+            logging.warning(
+                f"🐢 Медленный запрос {total * 1000:.1f} мс: {normalize_sql(sql)[:300]} | "
+                f"параметры: {repr(params)[:200]}"
+            )
+
+    def needs_plan(self, sql: str) -> Optional[str]:
+        """Нормализованный SQL, если план для него ещё не снимался"""
+        if not self.explain:
+            return None
+        key = normalize_sql(sql)
+        if key in self.plans or not key.upper().startswith(_EXPLAINABLE):
+            return None
+        return key
+
+    def capture_plan(self, connection: sqlite3.Connection, key: str, sql: str, params: Any) -> None:
+        try:
+            rows = sqlite3.Cursor(connection).execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        except sqlite3.Error as e:
+            logging.debug(f"EXPLAIN QUERY PLAN не выполнен: {e}")
+            rows = []
+        plan = [row[3] for row in rows]
+        self.plans[key] = plan
+        while len(self.plans) > MAX_PLANS:
+            self.plans.popitem(last=False)
+
+        hot = [table for table in scanned_tables(sql, plan) if table in self.hot_tables]
+        if hot:
+            self.hot_scans += 1
+            logging.warning(f"⚠️ Полный просмотр таблиц {', '.join(hot)}: {key[:300]} | план: {plan}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "statements": self.statements,
+            "total_ms": round(self.total_seconds * 1000, 1),
+            "slow": self.slow,
+            "plans": len(self.plans),
+            "hot_scans": self.hot_scans,
+        }
+
+PROFILER = QueryProfiler(config.DB_SLOW_QUERY_MS, config.DB_HOT_TABLES, config.DB_EXPLAIN_QUERIES)
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Курсор с замером времени и снятием плана при первом выполнении SQL"""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._sql = ""
+        self._params: Any = ()
+        self._elapsed = 0.0
+
+    def execute(self, sql, parameters=()):
+        key = PROFILER.needs_plan(sql)
+        if key is not None:
+            PROFILER.capture_plan(self.connection, key, sql, parameters)
+        self._sql, self._params = sql, parameters
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._elapsed = time.perf_counter() - started
+            PROFILER.observe(sql, parameters, self._elapsed)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._sql, self._params = sql, "<executemany>"
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._elapsed = time.perf_counter() - started
+            PROFILER.observe(sql, self._params, self._elapsed)
+
+    def _fetched(self, started: float) -> None:
+        seconds = time.perf_counter() - started
+        PROFILER.observe(self._sql, self._params, seconds, before=self._elapsed)
+        self._elapsed += seconds
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._fetched(started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._fetched(started)
+
+    def fetchmany(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(*args, **kwargs)
+        finally:
+            self._fetched(started)
+
+class ProfiledConnection(sqlite3.Connection):
+    """Соединение, у которого все курсоры - ProfiledCursor"""
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or ProfiledCursor)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def stats() -> Dict[str, Any]:
+    return PROFILER.stats()
@@ -0,0 +1,195 @@
+# coding: utf-8
+"""
+Сводка новых заявок для водителя (users.notify_digest = 1).
+Вместо отдельного "🔔 Новая заявка" на каждый отклик водитель получает одно
+сообщение со списком пассажиров и кнопками "Принять"/"Отклонить" для каждого.
+Заявки, пришедшие в течение DIGEST_WINDOW_SEC после первой, добавляются в то
+же сообщение: оно редактируется (не чаще раза в DIGEST_EDIT_DELAY_SEC), а не
+отправляется заново. После решения водителя сводка перерисовывается.
+Сводка не растёт больше DIGEST_MAX_REQUESTS заявок и лимита Telegram на длину
+текста (MAX_TEXT_LENGTH): следующая заявка открывает новую сводку.
+Закрытые сводки (окно прошло) и их блокировки удаляются при открытии новых.
+
+Открытые сводки хранятся в памяти. После перезапуска бота кнопки старой
+сводки продолжают работать: из неё убирается только обработанная заявка.
+"""
+import asyncio
+import contextvars
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, Message
+
+import callbacks
+import config
+import database
+
+DIGEST_TITLE = "🔔 Новые заявки"
+# Лимит Telegram на текст сообщения (считаем с HTML-тегами - с запасом)
+MAX_TEXT_LENGTH = 4096
+
+_STATUS_LINES = {
+    "pending": "⏳ ждёт ответа",
+    "accepted": "✅ принята",
+    "rejected": "❌ отклонена",
+    "cancelled": "🚫 отменена пассажиром",
+}
+
+class _Digest:
+    """Одно сообщение-сводка"""
+    __slots__ = ("driver_id", "opened_at", "request_ids", "message_id", "edit_timer")
+
+    def __init__(self, driver_id: int, opened_at: float) -> None:
+        self.driver_id = driver_id
+        self.opened_at = opened_at
+        self.request_ids: List[int] = []
+        self.message_id: Optional[int] = None
+        self.edit_timer: Optional[asyncio.TimerHandle] = None
+
+def render_digest(request_ids: List[int]) -> Tuple[str, InlineKeyboardMarkup]:
+    """Текст и кнопки сводки по текущим статусам заявок"""
+    requests = database.get_digest_requests(request_ids)
+    lines = [f"<b>{DIGEST_TITLE}: {len(requests)}</b>", ""]
+    rows = []
+    for number, req in enumerate(requests, 1):
+        username = req.get("tg_username")
+        passenger = f"@{username}" if username else f"ID{req['passenger_id']}"
+        lines.append(f"{number}. 👤 {passenger} — {_STATUS_LINES.get(req['status'], req['status'])}")
+        lines.append(f"    📍 {req['from_location']} → {req['to_location']}, "
+                     f"{req['date_dmy']}г. {req['time_hm']} | мест: {req['seats']}")
+        if req["status"] == "pending":
+            rows.append([
+                InlineKeyboardButton(text=f"✅ {passenger}",
+                                     callback_data=callbacks.pack(callbacks.DRIVER_ACCEPT, req["id"])),
+                InlineKeyboardButton(text=f"❌ {passenger}",
+                                     callback_data=callbacks.pack(callbacks.DRIVER_REJECT, req["id"])),
+            ])
+    return "\n".join(lines), InlineKeyboardMarkup(inline_keyboard=rows)
+
+def is_digest(message: Optional[Message]) -> bool:
+    return bool(message and (message.text or "").startswith(DIGEST_TITLE))
+
+class DriverDigest:
+    """Открытые сводки водителей: отправка первой заявки, дописывание следующих"""
+
+    def __init__(self, window: float = 120.0, edit_delay: float = 1.0, max_requests: int = 20,
+                 max_messages: int = 10000) -> None:
+        self.window = window
+        self.edit_delay = edit_delay
+        self.max_requests = max_requests
+        self.max_messages = max_messages
+        self._open: Dict[int, _Digest] = {}
+        self._by_message: "OrderedDict[Tuple[int, int], _Digest]" = OrderedDict()
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self.sent = 0
+        self.merged = 0
+        self.edited = 0
+        self.split = 0
+
+    async def add(self, bot: Bot, driver_id: int, request_id: int) -> None:
+        """Новая заявка водителю. Ошибка отправки первого сообщения пробрасывается"""
+        lock = self._locks.get(driver_id)
+        if lock is None:
+            lock = self._locks[driver_id] = asyncio.Lock()
+        async with lock:
+            now = asyncio.get_running_loop().time()
+            digest = self._open.get(driver_id)
+            if digest is not None and now - digest.opened_at <= self.window:
+                if self._fits(digest.request_ids + [request_id]):
+                    digest.request_ids.append(request_id)
+                    self.merged += 1
+                    self._schedule_edit(bot, digest)
+                    return
+                # Сводка заполнена - заявка открывает следующую
+                self.split += 1
+
+            self._prune(now, driver_id)
+            digest = _Digest(driver_id, now)
+            digest.request_ids.append(request_id)
+            text, keyboard = render_digest(digest.request_ids)
+            message = await bot.send_message(driver_id, text, reply_markup=keyboard, parse_mode="HTML")
+            digest.message_id = message.message_id
+            self._open[driver_id] = digest
+            self._by_message[(driver_id, message.message_id)] = digest
+            while len(self._by_message) > self.max_messages:
+                self._by_message.popitem(last=False)
+            self.sent += 1
+
+    def _fits(self, request_ids: List[int]) -> bool:
+        """Поместятся ли заявки в одно сообщение"""
+        if len(request_ids) > self.max_requests:
+            return False
+        text, _ = render_digest(request_ids)
+        return len(text) <= MAX_TEXT_LENGTH
+
+    def _prune(self, now: float, current_driver: int) -> None:
+        """Убирает сводки, окно которых прошло, и свободные блокировки их водителей"""
+        for driver_id, digest in list(self._open.items()):
+            if now - digest.opened_at > self.window and digest.edit_timer is None:
+                del self._open[driver_id]
+        for driver_id, lock in list(self._locks.items()):
+            if driver_id != current_driver and driver_id not in self._open and not lock.locked():
+                del self._locks[driver_id]
+
+    def _schedule_edit(self, bot: Bot, digest: _Digest) -> None:
+        # Заявки, пришедшие за edit_delay, попадут в одно редактирование
+        if digest.edit_timer is None:
+            # В контексте заявки спаны редактирования попали бы в трассу первой заявки сводки
+            digest.edit_timer = asyncio.get_running_loop().call_later(
+                self.edit_delay, lambda: asyncio.ensure_future(self._edit(bot, digest)),
+                context=contextvars.Context(),
+            )
+
+    async def _edit(self, bot: Bot, digest: _Digest) -> None:
+        if digest.edit_timer is not None:
+            digest.edit_timer.cancel()
+            digest.edit_timer = None
+        text, keyboard = render_digest(digest.request_ids)
+        try:
+            await bot.edit_message_text(
+                chat_id=digest.driver_id,
+                message_id=digest.message_id,
+                text=text,
+                reply_markup=keyboard,
+                parse_mode="HTML",
+            )
+            self.edited += 1
+        except TelegramBadRequest as e:
+            if "not modified" not in str(e):
+                logging.warning(f"⚠️ Не удалось обновить сводку водителя {digest.driver_id}: {e}")
+        except Exception as e:
+            logging.warning(f"⚠️ Не удалось обновить сводку водителя {digest.driver_id}: {e}")
+
+    async def refresh(self, bot: Bot, message: Message, request_id: int) -> None:
+        """Водитель принял/отклонил заявку из сводки"""
+        digest = self._by_message.get((message.chat.id, message.message_id))
+        if digest is not None:
+            await self._edit(bot, digest)
+            return
+        # Сводка из прошлого запуска - убираем кнопки обработанной заявки
+        rows = [
+            row for row in (message.reply_markup.inline_keyboard if message.reply_markup else [])
+            if not any(callbacks.unpack_id(button.callback_data or "", callbacks.DRIVER_ACCEPT) == request_id
+                       for button in row)
+        ]
+        try:
+            await message.edit_reply_markup(reply_markup=InlineKeyboardMarkup(inline_keyboard=rows))
+        except Exception:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "open_digests": len(self._open),
+            "locks": len(self._locks),
+            "sent": self.sent,
+            "merged": self.merged,
+            "split": self.split,
+            "edited": self.edited,
+        }
+
+def create_driver_digest() -> DriverDigest:
+    """Сводки с настройками из config"""
+    return DriverDigest(config.DIGEST_WINDOW_SEC, config.DIGEST_EDIT_DELAY_SEC, config.DIGEST_MAX_REQUESTS)
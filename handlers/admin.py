@@ -0,0 +1,43 @@
+# coding: utf-8
+"""
+Команды администраторов (config.ADMIN_IDS).
+
+/profile                - состояние профайлера
+/profile window [сек]   - снять профиль за окно (по умолчанию PROFILE_WINDOW_SEC)
+/profile slow on|off    - профилировать самые медленные обновления
+/profile stop           - выключить всё и записать результат окна
+"""
+from aiogram import Router, F
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+
+import config
+from sampling_profiler import SamplingProfiler
+
+router = Router(name="admin")
+router.message.filter(F.from_user.id.in_(set(config.ADMIN_IDS)))
+
+@router.message(Command("profile"))
+async def cmd_profile(message: Message, command: CommandObject, sampling_profiler: SamplingProfiler):
+    """Управление сэмплирующим профайлером"""
+    args = (command.args or "").split()
+    action = args[0].lower() if args else ""
+
+    if action == "window":
+        try:
+            seconds = float(args[1]) if len(args) > 1 else config.PROFILE_WINDOW_SEC
+        except ValueError:
+            await message.answer("❌ Укажите длительность окна в секундах: /profile window 30")
+            return
+        sampling_profiler.start_window(seconds)
+        await message.answer(f"🔥 Профилирование {seconds:.0f} с, результат - в {config.PROFILE_DIR}/")
+    elif action == "slow" and len(args) > 1 and args[1].lower() in ("on", "off"):
+        sampling_profiler.set_slow_mode(args[1].lower() == "on")
+        await message.answer(f"🔥 Медленные обновления: {'включено' if sampling_profiler.slow_mode else 'выключено'}")
+    elif action == "stop":
+        directory = sampling_profiler.stop_all()
+        await message.answer("⏹ Профайлер выключен" + (f", окно записано в {directory}" if directory else ""))
+    elif action:
+        await message.answer(__doc__.split("\n\n", 1)[1].strip())
+    else:
+        await message.answer(f"🔥 Профайлер\n\n{sampling_profiler.status()}")
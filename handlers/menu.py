@@ -2,6 +2,7 @@ from aiogram import Router, F
 from aiogram.filters import CommandStart
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardRemove
 import database
+from middlewares.user_upsert import UserUpsertMiddleware
 
 router = Router()
 
@@ -30,13 +31,13 @@ def get_welcome_keyboard():
     return keyboard
 
 @router.message(CommandStart())
-async def cmd_start(message: Message):
+async def cmd_start(message: Message, seen_users: UserUpsertMiddleware):
     """Обработчик команды /start"""
     user_id = message.from_user.id
     username = message.from_user.username or None
     
-    # Создаём пользователя если его нет
-    database.create_user(user_id, username)
+    # Нового пользователя уже сохранил UserUpsertMiddleware - здесь восстанавливаем удалённый аккаунт
+    seen_users.activate(user_id, username)
     
     # Проверяем - первый раз пользователь запускает бота или нет
     user = database.get_user_by_id(user_id)
@@ -6,66 +6,30 @@
 from aiogram import F, Router
 from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from datetime import datetime
+import callbacks
+import cards
 import database
 import logging
 
 router = Router(name="my_routes_cancel")
 
-def _get_route_status(route_id: int, driver_id: int) -> str:
-    """Определяет статус маршрута на основе заявок"""
-    route = database.get_route_by_id(route_id)
-    if not route:
-        return "❌ Ошибка"
-    
-    # Проверяем is_active
-    is_active = route.get('is_active', 1)
-    if is_active == 0:
-        return "❌ Отменена"
-    
-    # Получаем заявки
-    requests = database.get_route_requests(route_id)
-    
-    # Проверяем есть ли принятые заявки
-    accepted = any(r.get('status') == 'accepted' for r in requests)
-    if accepted:
-        return "✅ Заявка принята!"
-    
-    # Проверяем есть ли отклоненные заявки (и нет принятых)
-    rejected = any(r.get('status') == 'rejected' for r in requests)
-    if rejected:
-        return "❌ Заявка отклонена"
-    
-    # По умолчанию - опубликована
-    return "✅ Опубликована"
-
-def _kb_route_actions_cancelled(route_id: int) -> InlineKeyboardMarkup:
-    """Кнопки для ОТМЕНЁННОГО маршрута"""
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(text="👁️ Детали", callback_data=f"myroutes:details:{route_id}"),
-            InlineKeyboardButton(text="🔄 Восстановить", callback_data=f"myroutes:restore:{route_id}")
-        ]
-    ])
-
 def _kb_confirm(route_id: int) -> InlineKeyboardMarkup:
     """Кнопки подтверждения отмены"""
     return InlineKeyboardMarkup(inline_keyboard=[
         [
-            InlineKeyboardButton(text="✅ Да, отменить", callback_data=f"myroutes:cancel_confirm:{route_id}"),
-            InlineKeyboardButton(text="❌ Нет, оставить", callback_data=f"myroutes:cancel_no:{route_id}")
+            InlineKeyboardButton(text="✅ Да, отменить", callback_data=callbacks.pack(callbacks.ROUTE_CANCEL_CONFIRM, route_id)),
+            InlineKeyboardButton(text="❌ Нет, оставить", callback_data=callbacks.pack(callbacks.ROUTE_CANCEL_NO, route_id))
         ]
     ])
 
-@router.callback_query(F.data.startswith("myroutes:cancel:"))
+@router.callback_query(F.data.startswith(callbacks.ROUTE_CANCEL + ":"))
 async def show_cancel_confirmation(call: CallbackQuery) -> None:
     """
     Показывает подтверждение отмены маршрута
     """
     # Получаем route_id из callback
-    route_id_str = call.data.split(":")[-1]
-    try:
-        route_id = int(route_id_str)
-    except ValueError:
+    route_id = callbacks.unpack_id(call.data, callbacks.ROUTE_CANCEL)
+    if route_id is None:
         await call.answer("❌ Ошибка: неверный ID маршрута", show_alert=True)
         return
 
@@ -118,17 +82,15 @@ async def show_cancel_confirmation(call: CallbackQuery) -> None:
     await call.answer()
 
 
-@router.callback_query(F.data.startswith("myroutes:cancel_confirm:"))
+@router.callback_query(F.data.startswith(callbacks.ROUTE_CANCEL_CONFIRM + ":"))
 async def cancel_route(call: CallbackQuery) -> None:
     """
     БАГ #7: Отменяет маршрут и отправляет уведомления ВСЕМ пассажирам (accepted + pending)
     Карточка ОСТАЁТСЯ с изменёнными кнопками
     """
     # Получаем route_id из callback
-    route_id_str = call.data.split(":")[-1]
-    try:
-        route_id = int(route_id_str)
-    except ValueError:
+    route_id = callbacks.unpack_id(call.data, callbacks.ROUTE_CANCEL_CONFIRM)
+    if route_id is None:
         await call.answer("❌ Ошибка", show_alert=True)
         return
 
@@ -149,16 +111,13 @@ async def cancel_route(call: CallbackQuery) -> None:
     to_location = route.get("to_location", "?")
     date_dmy = route.get("date_dmy", "?")
     time_hm = route.get("time_hm", "?")
-    price = route.get("price", 0)
-    seats = route.get("seats", 0)
-    comment = route.get("comment", "")
 
     # Получаем всех пассажиров с откликами (БАГ #7: ВКЛЮЧАЕМ И ПРИНЯТЫХ!)
     requests = database.get_route_requests(route_id)
     passengers_to_notify = [r for r in requests if r.get('status') in ['pending', 'accepted']]
 
-    # Отменяем маршрут В БАЗЕ
-    database.cancel_route(route_id)
+    # Отменяем маршрут В БАЗЕ (лист ожидания очищается там же)
+    waitlisted = database.cancel_route(route_id)
 
     # Формируем уведомление для пассажиров
     notification_text = (
@@ -168,15 +127,23 @@ async def cancel_route(call: CallbackQuery) -> None:
         f"К сожалению, водитель отменил этот маршрут.\n\n"
         f"📱 Попробуйте найти другой в разделе \"Найти маршрут\""
     )
+    waitlist_text = (
+        f"❌ <b>МАРШРУТ {from_location} → {to_location} ОТМЕНЁН!</b>\n\n"
+        f"Дата: {date_dmy}\n"
+        f"Время: {time_hm}\n\n"
+        f"Водитель отменил маршрут, вы удалены из листа ожидания.\n\n"
+        f"📱 Попробуйте найти другой в разделе \"Найти маршрут\""
+    )
+    recipients = [(req.get('passenger_id'), notification_text) for req in passengers_to_notify]
+    recipients += [(passenger_id, waitlist_text) for passenger_id in waitlisted]
 
-    # Отправляем уведомления каждому пассажиру
+    # Отправляем уведомления каждому пассажиру (с откликом и из листа ожидания)
     sent_count = 0
-    for req in passengers_to_notify:
-        passenger_id = req.get('passenger_id')
+    for passenger_id, text in recipients:
         try:
             await call.bot.send_message(
                 chat_id=passenger_id,
-                text=notification_text,
+                text=text,
                 parse_mode="HTML",
                 disable_notification=False  # Звук уведомления ВКЛЮЧЁН
             )
@@ -185,24 +152,9 @@ async def cancel_route(call: CallbackQuery) -> None:
         except Exception as e:
             logging.error(f"❌ Не удалось уведомить пассажира {passenger_id}: {e}")
 
-    # ВМЕСТО УДАЛЕНИЯ - ПОКАЗЫВАЕМ ОБНОВЛЁННУЮ КАРТОЧКУ
-    card = (
-        f"• {date_dmy}г. {time_hm} — {from_location} → {to_location} | "
-        f"цена: {price}₽ | мест: {seats}\n"
-    )
-
-    if comment:
-        card += f"💬 {comment}\n"
-
-    # Статус ОТМЕНЕНА
-    card += f"\n❌ Отменена"
-
-    # Редактируем карточку с новыми кнопками
-    await call.message.edit_text(
-        card,
-        reply_markup=_kb_route_actions_cancelled(route_id),
-        parse_mode="HTML"
-    )
+    # ВМЕСТО УДАЛЕНИЯ - ПОКАЗЫВАЕМ ОБНОВЛЁННУЮ КАРТОЧКУ (статус "Отменена" и кнопка "Восстановить")
+    card, kb = cards.owner_card(database.get_card_route(route_id))
+    await call.message.edit_text(card, reply_markup=kb, parse_mode="HTML")
 
     # Показываем уведомление водителю
     notification = f"✅ Маршрут отменен"
@@ -212,16 +164,14 @@ async def cancel_route(call: CallbackQuery) -> None:
     await call.answer(notification, show_alert=True)
 
 
-@router.callback_query(F.data.startswith("myroutes:restore:"))
+@router.callback_query(F.data.startswith(callbacks.ROUTE_RESTORE + ":"))
 async def restore_route(call: CallbackQuery) -> None:
     """
     Восстанавливает отменённый маршрут и уведомляет пассажиров
     """
     # Получаем route_id из callback
-    route_id_str = call.data.split(":")[-1]
-    try:
-        route_id = int(route_id_str)
-    except ValueError:
+    route_id = callbacks.unpack_id(call.data, callbacks.ROUTE_RESTORE)
+    if route_id is None:
         await call.answer("❌ Ошибка", show_alert=True)
         return
 
@@ -248,9 +198,6 @@ async def restore_route(call: CallbackQuery) -> None:
     to_location = route.get("to_location", "?")
     date_dmy = route.get("date_dmy", "?")
     time_hm = route.get("time_hm", "?")
-    price = route.get("price", 0)
-    seats = route.get("seats", 0)
-    comment = route.get("comment", "")
 
     # Восстанавливаем маршрут В БАЗЕ (is_active = 1)
     database.update_route(route_id, is_active=1)
@@ -283,28 +230,9 @@ async def restore_route(call: CallbackQuery) -> None:
             except Exception as e:
                 logging.error(f"❌ Не удалось уведомить пассажира {passenger_id}: {e}")
 
-    # Импортируем функцию с правильными кнопками для АКТИВНОГО маршрута
-    from handlers.my_routes.details_handler import _kb_route_actions
-
-    # Формируем карточку
-    card = (
-        f"• {date_dmy}г. {time_hm} — {from_location} → {to_location} | "
-        f"цена: {price}₽ | мест: {seats}\n"
-    )
-
-    if comment:
-        card += f"💬 {comment}\n"
-
-    # Статус
-    status = _get_route_status(route_id, driver_id)
-    card += f"\n{status}"
-
-    # Редактируем карточку с кнопками для АКТИВНОГО маршрута
-    await call.message.edit_text(
-        card,
-        reply_markup=_kb_route_actions(route_id, 1),  # is_active=1
-        parse_mode="HTML"
-    )
+    # Карточка АКТИВНОГО маршрута (статус по заявкам)
+    card, kb = cards.owner_card(database.get_card_route(route_id))
+    await call.message.edit_text(card, reply_markup=kb, parse_mode="HTML")
 
     # Показываем уведомление водителю
     notification = "✅ Маршрут восстановлен"
@@ -314,57 +242,24 @@ async def restore_route(call: CallbackQuery) -> None:
     await call.answer(notification, show_alert=True)
 
 
-@router.callback_query(F.data.startswith("myroutes:cancel_no:"))
+@router.callback_query(F.data.startswith(callbacks.ROUTE_CANCEL_NO + ":"))
 async def cancel_no(call: CallbackQuery) -> None:
     """
     Отказ от отмены - возвращает к карточке маршрута
     """
     # Получаем route_id из callback
-    route_id_str = call.data.split(":")[-1]
-    try:
-        route_id = int(route_id_str)
-    except ValueError:
+    route_id = callbacks.unpack_id(call.data, callbacks.ROUTE_CANCEL_NO)
+    if route_id is None:
         await call.answer("❌ Ошибка", show_alert=True)
         return
 
     # Получаем информацию о маршруте
-    route = database.get_route_by_id(route_id)
+    route = database.get_card_route(route_id)
     if not route:
         await call.answer("❌ Маршрут не найден", show_alert=True)
         return
 
-    driver_id = call.from_user.id
-
-    # Восстанавливаем карточку (импортируем функции из details_handler)
-    from handlers.my_routes.details_handler import _kb_route_actions
-
-    from_location = route.get("from_location", "?")
-    to_location = route.get("to_location", "?")
-    date_dmy = route.get("date_dmy", "?")
-    time_hm = route.get("time_hm", "?")
-    price = route.get("price", 0)
-    seats = route.get("seats", 0)
-    comment = route.get("comment", "")
-    is_active = route.get("is_active", 1)
-
-    # Карточка маршрута
-    card = (
-        f"• {date_dmy}г. {time_hm} — {from_location} → {to_location} | "
-        f"цена: {price}₽ | мест: {seats}\n"
-    )
-
-    # Добавляем комментарий если есть
-    if comment:
-        card += f"💬 {comment}\n"
-
-    # Статус
-    status = _get_route_status(route_id, driver_id)
-    card += f"\n{status}"
-
-    # Редактируем сообщение обратно в карточку (передаём is_active)
-    await call.message.edit_text(
-        card,
-        reply_markup=_kb_route_actions(route_id, is_active),
-        parse_mode="HTML"
-    )
+    # Восстанавливаем карточку
+    card, kb = cards.owner_card(route)
+    await call.message.edit_text(card, reply_markup=kb, parse_mode="HTML")
     await call.answer("Отмена отменена 😉")
\ No newline at end of file
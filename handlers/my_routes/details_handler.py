@@ -1,82 +1,69 @@
 # coding: utf-8
 """
-Показ деталей маршрута: список откликов от пассажиров
+Показ деталей маршрута: список откликов от пассажиров.
+Ожидающие заявки можно принять или отклонить все сразу: статусы и места
+меняются одной транзакцией (database.decide_pending_requests), а
+уведомления пассажирам уходят одной пачкой через RateLimitedSender.
 """
 
 from aiogram import F, Router
 from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from datetime import datetime
+import callbacks
+import cards
 import database
+from sender import RateLimitedSender
+from waitlist import WaitlistPromoter
 
 router = Router(name="my_routes_details")
 
-def _kb_route_actions(route_id: int, is_active: int) -> InlineKeyboardMarkup:
-    """
-    Кнопки для каждого маршрута - РАЗНЫЕ для активных и отменённых
-    """
-    if is_active == 1:
-        # Активный маршрут: [✏️ Изменить] [❌ Отменить] [👁️ Детали]
-        return InlineKeyboardMarkup(inline_keyboard=[
-            [
-                InlineKeyboardButton(text="✏️ Изменить", callback_data=f"myroutes:edit:{route_id}"),
-                InlineKeyboardButton(text="❌ Отменить", callback_data=f"myroutes:cancel:{route_id}"),
-                InlineKeyboardButton(text="👁️ Детали", callback_data=f"myroutes:details:{route_id}")
-            ]
-        ])
-    else:
-        # Отменённый маршрут: [👁️ Детали] [🔄 Восстановить]
-        return InlineKeyboardMarkup(inline_keyboard=[
-            [
-                InlineKeyboardButton(text="👁️ Детали", callback_data=f"myroutes:details:{route_id}"),
-                InlineKeyboardButton(text="🔄 Восстановить", callback_data=f"myroutes:restore:{route_id}")
-            ]
-        ])
+# Сколько кнопок "Принять N" показывать (кроме "Принять всех")
+MAX_PARTIAL_ACCEPT_BUTTONS = 4
 
 def _kb_back(route_id: int) -> InlineKeyboardMarkup:
     """Кнопка назад к маршрутам"""
     return InlineKeyboardMarkup(inline_keyboard=[
         [
-            InlineKeyboardButton(text="🏠 Назад к маршрутам", callback_data=f"myroutes:back:{route_id}")
+            InlineKeyboardButton(text="🏠 Назад к маршрутам", callback_data=callbacks.pack(callbacks.ROUTE_BACK, route_id))
         ]
     ])
 
-def _get_route_status(route_id: int, driver_id: int) -> str:
-    """Определяет статус маршрута на основе заявок"""
-    route = database.get_route_by_id(route_id)
-    if not route:
-        return "❌ Ошибка"
-    
-    # Проверяем is_active
-    is_active = route.get('is_active', 1)
-    if is_active == 0:
-        return "❌ Отменена"
-    
-    # Получаем заявки
-    requests = database.get_route_requests(route_id)
-    
-    # Проверяем есть ли принятые заявки
-    accepted = any(r.get('status') == 'accepted' for r in requests)
-    if accepted:
-        return "✅ Заявка принята!"
-    
-    # Проверяем есть ли отклоненные заявки (и нет принятых)
-    rejected = any(r.get('status') == 'rejected' for r in requests)
-    if rejected:
-        return "❌ Заявка отклонена"
-    
-    # По умолчанию - опубликована
-    return "✅ Опубликована"
-
-@router.callback_query(F.data.startswith("myroutes:details:"))
+def _kb_details(route: dict, pending: int) -> InlineKeyboardMarkup:
+    """Массовые решения по ожидающим заявкам + назад к маршрутам"""
+    route_id = route.get("id")
+    kb = _kb_back(route_id)
+    if not pending or route.get("is_active", 1) == 0:
+        return kb
+
+    rows = []
+    can_accept = min(pending, route.get("seats") or 0)
+    if can_accept > 0:
+        title = f"✅ Принять всех ({can_accept})" if can_accept == pending else f"✅ Принять первых {can_accept}"
+        rows.append([InlineKeyboardButton(
+            text=title, callback_data=callbacks.pack(callbacks.ROUTE_ACCEPT_PENDING, route_id, 0)
+        )])
+        partial = range(1, min(can_accept - 1, MAX_PARTIAL_ACCEPT_BUTTONS) + 1)
+        if partial:
+            rows.append([
+                InlineKeyboardButton(
+                    text=f"✅ {count}", callback_data=callbacks.pack(callbacks.ROUTE_ACCEPT_PENDING, route_id, count)
+                )
+                for count in partial
+            ])
+    rows.append([InlineKeyboardButton(
+        text=f"❌ Отклонить ожидающих ({pending})",
+        callback_data=callbacks.pack(callbacks.ROUTE_REJECT_PENDING, route_id)
+    )])
+    return InlineKeyboardMarkup(inline_keyboard=rows + kb.inline_keyboard)
+
+@router.callback_query(F.data.startswith(callbacks.ROUTE_DETAILS + ":"))
 async def show_route_details(call: CallbackQuery) -> None:
     """
     Показывает детали маршрута: список откликов
     """
     # Получаем route_id из callback
-    route_id_str = call.data.split(":")[-1]
-    try:
-        route_id = int(route_id_str)
-    except ValueError:
+    route_id = callbacks.unpack_id(call.data, callbacks.ROUTE_DETAILS)
+    if route_id is None:
         await call.answer("❌ Ошибка: неверный ID маршрута", show_alert=True)
         return
 
@@ -92,8 +79,16 @@ async def show_route_details(call: CallbackQuery) -> None:
         await call.answer("❌ Это не ваш маршрут", show_alert=True)
         return
 
+    await _show_details(call, route)
+    await call.answer()
+
+async def _show_details(call: CallbackQuery, route: dict) -> None:
+    """Список заявок маршрута в текущем сообщении"""
+    route_id = route.get("id")
+
     # Получаем все заявки на этот маршрут
     requests = database.get_route_requests(route_id)
+    pending = sum(1 for r in requests if r.get('status') == 'pending')
 
     # Формируем текст
     from_location = route.get("from_location", "?")
@@ -119,7 +114,6 @@ async def show_route_details(call: CallbackQuery) -> None:
         # Счётчики
         total = len(requests)
         accepted = sum(1 for r in requests if r.get('status') == 'accepted')
-        pending = sum(1 for r in requests if r.get('status') == 'pending')
         rejected = sum(1 for r in requests if r.get('status') == 'rejected')
 
         # Список заявок
@@ -153,61 +147,89 @@ async def show_route_details(call: CallbackQuery) -> None:
     # Отправляем
     await call.message.edit_text(
         text,
-        reply_markup=_kb_back(route_id),
+        reply_markup=_kb_details(route, pending),
         parse_mode="HTML"
     )
-    await call.answer()
 
+async def _notify_passengers(call: CallbackQuery, sender: RateLimitedSender, passenger_ids: list, text: str) -> None:
+    """Одно уведомление всем пассажирам - пачкой через общий лимит отправки"""
+    await sender.call_many([
+        (passenger_id, lambda passenger_id=passenger_id: call.bot.send_message(
+            chat_id=passenger_id, text=text, parse_mode="HTML"
+        ))
+        for passenger_id in passenger_ids
+    ])
+
+@router.callback_query(F.data.startswith(callbacks.ROUTE_ACCEPT_PENDING + ":"))
+async def accept_pending(call: CallbackQuery, sender: RateLimitedSender) -> None:
+    """
+    Принимает самые ранние ожидающие заявки: все, сколько позволяют места,
+    или не больше указанного в кнопке числа
+    """
+    values = callbacks.unpack(call.data, callbacks.ROUTE_ACCEPT_PENDING, 2)
+    if values is None:
+        await call.answer("❌ Ошибка: неверный ID маршрута", show_alert=True)
+        return
+    route_id, limit = values
+
+    route, accepted, _ = database.decide_pending_requests(route_id, call.from_user.id, limit or None)
+    if route is None:
+        await call.answer("❌ Маршрут не найден или отменён", show_alert=True)
+        return
+    if not accepted:
+        await call.answer("❌ Нет ожидающих заявок или свободных мест", show_alert=True)
+        return
+
+    await call.answer(f"✅ Принято заявок: {len(accepted)}. Пассажирам отправлены уведомления.")
+    await _show_details(call, database.get_route_by_id(route_id))
+
+    text = cards.request_accepted_text(route, route.get("seats"), call.from_user.username)
+    await _notify_passengers(call, sender, [passenger_id for _, passenger_id in accepted], text)
 
-@router.callback_query(F.data.startswith("myroutes:back:"))
+@router.callback_query(F.data.startswith(callbacks.ROUTE_REJECT_PENDING + ":"))
+async def reject_pending(call: CallbackQuery, sender: RateLimitedSender, waitlist: WaitlistPromoter) -> None:
+    """Отклоняет все ожидающие заявки маршрута"""
+    route_id = callbacks.unpack_id(call.data, callbacks.ROUTE_REJECT_PENDING)
+    if route_id is None:
+        await call.answer("❌ Ошибка: неверный ID маршрута", show_alert=True)
+        return
+
+    route, _, rejected = database.decide_pending_requests(route_id, call.from_user.id, 0, reject_rest=True)
+    if route is None:
+        await call.answer("❌ Маршрут не найден или отменён", show_alert=True)
+        return
+    if not rejected:
+        await call.answer("❌ Нет ожидающих заявок", show_alert=True)
+        return
+
+    await call.answer(f"❌ Отклонено заявок: {len(rejected)}. Пассажирам отправлены уведомления.")
+    await _show_details(call, route)
+
+    text = cards.request_rejected_text(route)
+    await _notify_passengers(call, sender, [passenger_id for _, passenger_id in rejected], text)
+
+    # Ожидающие заявки больше не держат места - очередь листа ожидания
+    await waitlist.promote(call.bot, route_id)
+
+
+@router.callback_query(F.data.startswith(callbacks.ROUTE_BACK + ":"))
 async def back_to_card(call: CallbackQuery) -> None:
     """
     Возврат к карточке маршрута (восстанавливает карточку)
     """
     # Получаем route_id из callback
-    route_id_str = call.data.split(":")[-1]
-    try:
-        route_id = int(route_id_str)
-    except ValueError:
+    route_id = callbacks.unpack_id(call.data, callbacks.ROUTE_BACK)
+    if route_id is None:
         await call.answer("❌ Ошибка", show_alert=True)
         return
 
     # Получаем информацию о маршруте
-    route = database.get_route_by_id(route_id)
+    route = database.get_card_route(route_id)
     if not route:
         await call.answer("❌ Маршрут не найден", show_alert=True)
         return
 
-    driver_id = call.from_user.id
-
     # Восстанавливаем карточку
-    from_location = route.get("from_location", "?")
-    to_location = route.get("to_location", "?")
-    date_dmy = route.get("date_dmy", "?")
-    time_hm = route.get("time_hm", "?")
-    price = route.get("price", 0)
-    seats = route.get("seats", 0)
-    comment = route.get("comment", "")
-    is_active = route.get("is_active", 1)
-
-    # Карточка маршрута
-    card = (
-        f"• {date_dmy}г. {time_hm} — {from_location} → {to_location} | "
-        f"цена: {price}₽ | мест: {seats}\n"
-    )
-
-    # Добавляем комментарий если есть
-    if comment:
-        card += f"💬 {comment}\n"
-
-    # Статус
-    status = _get_route_status(route_id, driver_id)
-    card += f"\n{status}"
-
-    # Редактируем сообщение обратно в карточку (передаём is_active)
-    await call.message.edit_text(
-        card,
-        reply_markup=_kb_route_actions(route_id, is_active),
-        parse_mode="HTML"
-    )
+    card, kb = cards.owner_card(route)
+    await call.message.edit_text(card, reply_markup=kb, parse_mode="HTML")
     await call.answer()
\ No newline at end of file
@@ -17,7 +17,10 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from datetime import datetime, date, time
 import calendar
+import callbacks
+import cards
 import database
+from waitlist import WaitlistPromoter
 import logging
 import asyncio
 
@@ -34,33 +37,6 @@ MONTH_NAMES = {
     9: "Сентябрь", 10: "Октябрь", 11: "Ноябрь", 12: "Декабрь"
 }
 
-def _get_route_status(route_id: int, driver_id: int) -> str:
-    """Определяет статус маршрута на основе заявок"""
-    route = database.get_route_by_id(route_id)
-    if not route:
-        return "❌ Ошибка"
-    
-    # Проверяем is_active
-    is_active = route.get('is_active', 1)
-    if is_active == 0:
-        return "❌ Отменена"
-    
-    # Получаем заявки
-    requests = database.get_route_requests(route_id)
-    
-    # Проверяем есть ли принятые заявки
-    accepted = any(r.get('status') == 'accepted' for r in requests)
-    if accepted:
-        return "✅ Заявка принята!"
-    
-    # Проверяем есть ли отклоненные заявки (и нет принятых)
-    rejected = any(r.get('status') == 'rejected' for r in requests)
-    if rejected:
-        return "❌ Заявка отклонена"
-    
-    # По умолчанию - опубликована
-    return "✅ Опубликована"
-
 def _parse_time(time_str: str) -> str:
     """
     БАГ #17 ИСПРАВЛЕН: Умный парсинг времени с поддержкой 1-2 цифр:
@@ -103,19 +79,19 @@ def _build_calendar(year: int, month: int, current_date, route_id: int) -> Inlin
                    "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь"]
     
     keyboard.append([
-        InlineKeyboardButton(text="◀️", callback_data=f"editcal:prev:{year}:{month}"),
-        InlineKeyboardButton(text=f"{month_names[month-1]} {year}", callback_data="editcal:ignore"),
-        InlineKeyboardButton(text="▶️", callback_data=f"editcal:next:{year}:{month}")
+        InlineKeyboardButton(text="◀️", callback_data=callbacks.pack(callbacks.EDIT_CALENDAR_PREV, year, month)),
+        InlineKeyboardButton(text=f"{month_names[month-1]} {year}", callback_data=callbacks.EDIT_CALENDAR_IGNORE),
+        InlineKeyboardButton(text="▶️", callback_data=callbacks.pack(callbacks.EDIT_CALENDAR_NEXT, year, month))
     ])
     
     keyboard.append([
-        InlineKeyboardButton(text="Пн", callback_data="editcal:ignore"),
-        InlineKeyboardButton(text="Вт", callback_data="editcal:ignore"),
-        InlineKeyboardButton(text="Ср", callback_data="editcal:ignore"),
-        InlineKeyboardButton(text="Чт", callback_data="editcal:ignore"),
-        InlineKeyboardButton(text="Пт", callback_data="editcal:ignore"),
-        InlineKeyboardButton(text="Сб", callback_data="editcal:ignore"),
-        InlineKeyboardButton(text="Вс", callback_data="editcal:ignore"),
+        InlineKeyboardButton(text="Пн", callback_data=callbacks.EDIT_CALENDAR_IGNORE),
+        InlineKeyboardButton(text="Вт", callback_data=callbacks.EDIT_CALENDAR_IGNORE),
+        InlineKeyboardButton(text="Ср", callback_data=callbacks.EDIT_CALENDAR_IGNORE),
+        InlineKeyboardButton(text="Чт", callback_data=callbacks.EDIT_CALENDAR_IGNORE),
+        InlineKeyboardButton(text="Пт", callback_data=callbacks.EDIT_CALENDAR_IGNORE),
+        InlineKeyboardButton(text="Сб", callback_data=callbacks.EDIT_CALENDAR_IGNORE),
+        InlineKeyboardButton(text="Вс", callback_data=callbacks.EDIT_CALENDAR_IGNORE),
     ])
     
     prev_month = month - 1 if month > 1 else 12
@@ -142,42 +118,42 @@ def _build_calendar(year: int, month: int, current_date, route_id: int) -> Inlin
             try:
                 day_date = datetime(prev_year, prev_month, day)
                 if day_date.date() < current_date.date():
-                    week.append(InlineKeyboardButton(text=f"·{day}", callback_data="editcal:ignore"))
+                    week.append(InlineKeyboardButton(text=f"·{day}", callback_data=callbacks.EDIT_CALENDAR_IGNORE))
                 else:
                     week.append(InlineKeyboardButton(
                         text=str(day),
-                        callback_data=f"editcal:day:{prev_year}:{prev_month}:{day}"
+                        callback_data=callbacks.pack(callbacks.EDIT_CALENDAR_DAY, prev_year, prev_month, day)
                     ))
             except:
-                week.append(InlineKeyboardButton(text=str(day), callback_data="editcal:ignore"))
+                week.append(InlineKeyboardButton(text=str(day), callback_data=callbacks.EDIT_CALENDAR_IGNORE))
         elif day_counter < days_in_current:
             day_counter += 1
             day = day_counter
             try:
                 day_date = datetime(year, month, day)
                 if day_date.date() < current_date.date():
-                    week.append(InlineKeyboardButton(text=f"·{day}", callback_data="editcal:ignore"))
+                    week.append(InlineKeyboardButton(text=f"·{day}", callback_data=callbacks.EDIT_CALENDAR_IGNORE))
                 else:
                     week.append(InlineKeyboardButton(
                         text=str(day),
-                        callback_data=f"editcal:day:{year}:{month}:{day}"
+                        callback_data=callbacks.pack(callbacks.EDIT_CALENDAR_DAY, year, month, day)
                     ))
             except:
-                week.append(InlineKeyboardButton(text=str(day), callback_data="editcal:ignore"))
+                week.append(InlineKeyboardButton(text=str(day), callback_data=callbacks.EDIT_CALENDAR_IGNORE))
         else:
             day = next_month_day
             next_month_day += 1
             try:
                 day_date = datetime(next_year, next_month, day)
                 if day_date.date() < current_date.date():
-                    week.append(InlineKeyboardButton(text=f"·{day}", callback_data="editcal:ignore"))
+                    week.append(InlineKeyboardButton(text=f"·{day}", callback_data=callbacks.EDIT_CALENDAR_IGNORE))
                 else:
                     week.append(InlineKeyboardButton(
                         text=str(day),
-                        callback_data=f"editcal:day:{next_year}:{next_month}:{day}"
+                        callback_data=callbacks.pack(callbacks.EDIT_CALENDAR_DAY, next_year, next_month, day)
                     ))
             except:
-                week.append(InlineKeyboardButton(text=str(day), callback_data="editcal:ignore"))
+                week.append(InlineKeyboardButton(text=str(day), callback_data=callbacks.EDIT_CALENDAR_IGNORE))
         
         if len(week) == 7:
             keyboard.append(week)
@@ -185,8 +161,8 @@ def _build_calendar(year: int, month: int, current_date, route_id: int) -> Inlin
     
     # БАГ #10: Добавляем кнопку "Назад" в календарь
     keyboard.append([
-        InlineKeyboardButton(text="🔙 Назад", callback_data=f"editcal:back:{route_id}"),
-        InlineKeyboardButton(text="❌ Отменить", callback_data=f"myroutes:edit_cancel:{route_id}")
+        InlineKeyboardButton(text="🔙 Назад", callback_data=callbacks.pack(callbacks.EDIT_CALENDAR_BACK, route_id)),
+        InlineKeyboardButton(text="❌ Отменить", callback_data=callbacks.pack(callbacks.ROUTE_EDIT_CANCEL, route_id))
     ])
     
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
@@ -201,6 +177,9 @@ async def _notify_passengers_about_change(route_id: int, bot, changed_fields: li
     - Формат для маршрута: "📍 Маршрут: A → B" и "📍 На: C → D"
     - Формат для других полей: "с X на Y" с эмодзи
     """
+    # Режим бронирования пассажиров, уже принятых водителем, не касается
+    changed_fields = [c for c in changed_fields if c['field'] != 'instant_booking']
+    
     requests = database.get_route_requests(route_id)
     accepted_requests = [r for r in requests if r.get('status') == 'accepted']
     
@@ -311,26 +290,60 @@ def _get_pending_value(changed_fields: list, field_name: str, original_value):
             return change['value']
     return original_value
 
-def _kb_edit_menu(route_id: int) -> InlineKeyboardMarkup:
+def _edit_menu_view(route_id: int, route: dict, changed_fields: list):
+    """БАГ #18: Меню редактирования с ВРЕМЕННЫМИ значениями из changed_fields"""
+    from_location = _get_pending_value(changed_fields, 'from_location', route.get("from_location", "?"))
+    to_location = _get_pending_value(changed_fields, 'to_location', route.get("to_location", "?"))
+    date_dmy = _get_pending_value(changed_fields, 'date', route.get("date_dmy", "?"))
+    time_hm = _get_pending_value(changed_fields, 'time', route.get("time_hm", "?"))
+    price = _get_pending_value(changed_fields, 'price', route.get("price", 0))
+    seats = _get_pending_value(changed_fields, 'seats', route.get("seats", 0))
+    comment = _get_pending_value(changed_fields, 'comment', route.get("comment", "Нет"))
+    if not comment:
+        comment = "Нет"
+    instant = _get_pending_value(changed_fields, 'instant_booking', route.get("instant_booking", 0))
+
+    text = (
+        f"✏️ <b>Изменение маршрута</b>\n\n"
+        f"<b>Текущие данные:</b>\n"
+        f"📍 Откуда: {from_location}\n"
+        f"📍 Куда: {to_location}\n"
+        f"📅 Дата: {date_dmy}\n"
+        f"🕐 Время: {time_hm}\n"
+        f"💰 Цена: {price}₽\n"
+        f"👥 Мест: {seats}\n"
+        f"💬 Комментарий: {comment}\n"
+        f"⚡ Мгновенное бронирование: {'вкл' if instant else 'выкл'}\n\n"
+        f"Выберите что хотите изменить:"
+    )
+    return text, _kb_edit_menu(route_id, instant)
+
+def _kb_edit_menu(route_id: int, instant_booking: int = 0) -> InlineKeyboardMarkup:
     """Меню выбора параметра для изменения"""
     return InlineKeyboardMarkup(inline_keyboard=[
         [
-            InlineKeyboardButton(text="📍 Откуда", callback_data=f"myroutes:edit_field:{route_id}:from_location"),
-            InlineKeyboardButton(text="📍 Куда", callback_data=f"myroutes:edit_field:{route_id}:to_location")
+            InlineKeyboardButton(text="📍 Откуда", callback_data=callbacks.pack_field(callbacks.ROUTE_EDIT_FIELD, route_id, "from_location")),
+            InlineKeyboardButton(text="📍 Куда", callback_data=callbacks.pack_field(callbacks.ROUTE_EDIT_FIELD, route_id, "to_location"))
         ],
         [
-            InlineKeyboardButton(text="📅 Дата", callback_data=f"myroutes:edit_field:{route_id}:date"),
-            InlineKeyboardButton(text="🕐 Время", callback_data=f"myroutes:edit_field:{route_id}:time")
+            InlineKeyboardButton(text="📅 Дата", callback_data=callbacks.pack_field(callbacks.ROUTE_EDIT_FIELD, route_id, "date")),
+            InlineKeyboardButton(text="🕐 Время", callback_data=callbacks.pack_field(callbacks.ROUTE_EDIT_FIELD, route_id, "time"))
         ],
         [
-            InlineKeyboardButton(text="💰 Цена", callback_data=f"myroutes:edit_field:{route_id}:price"),
-            InlineKeyboardButton(text="👥 Мест", callback_data=f"myroutes:edit_field:{route_id}:seats")
+            InlineKeyboardButton(text="💰 Цена", callback_data=callbacks.pack_field(callbacks.ROUTE_EDIT_FIELD, route_id, "price")),
+            InlineKeyboardButton(text="👥 Мест", callback_data=callbacks.pack_field(callbacks.ROUTE_EDIT_FIELD, route_id, "seats"))
         ],
         [
-            InlineKeyboardButton(text="💬 Комментарий", callback_data=f"myroutes:edit_field:{route_id}:comment")
+            InlineKeyboardButton(text="💬 Комментарий", callback_data=callbacks.pack_field(callbacks.ROUTE_EDIT_FIELD, route_id, "comment"))
         ],
         [
-            InlineKeyboardButton(text="✅ Готово", callback_data=f"myroutes:edit_done:{route_id}")
+            InlineKeyboardButton(
+                text="⚡ Мгновенное бронирование: " + ("выключить" if instant_booking else "включить"),
+                callback_data=callbacks.pack_field(callbacks.ROUTE_EDIT_FIELD, route_id, "instant_booking")
+            )
+        ],
+        [
+            InlineKeyboardButton(text="✅ Готово", callback_data=callbacks.pack(callbacks.ROUTE_EDIT_DONE, route_id))
         ]
     ])
 
@@ -338,34 +351,39 @@ def _kb_back_and_cancel(route_id: int) -> InlineKeyboardMarkup:
     """БАГ #10: Кнопки Назад и Отменить"""
     return InlineKeyboardMarkup(inline_keyboard=[
         [
-            InlineKeyboardButton(text="🔙 Назад", callback_data=f"myroutes:edit_back:{route_id}"),
-            InlineKeyboardButton(text="❌ Отменить", callback_data=f"myroutes:edit_cancel:{route_id}")
+            InlineKeyboardButton(text="🔙 Назад", callback_data=callbacks.pack(callbacks.ROUTE_EDIT_BACK, route_id)),
+            InlineKeyboardButton(text="❌ Отменить", callback_data=callbacks.pack(callbacks.ROUTE_EDIT_CANCEL, route_id))
         ]
     ])
 
+# Действие с комментарием -> префикс его кнопки
+_COMMENT_ACTIONS = {
+    "replace": callbacks.ROUTE_COMMENT_REPLACE,
+    "append": callbacks.ROUTE_COMMENT_APPEND,
+    "delete": callbacks.ROUTE_COMMENT_DELETE,
+}
+
 def _kb_comment_action(route_id: int) -> InlineKeyboardMarkup:
     """БАГ #10: Кнопки для комментария с Назад"""
     return InlineKeyboardMarkup(inline_keyboard=[
         [
-            InlineKeyboardButton(text="✏️ Заменить", callback_data=f"myroutes:comment_replace:{route_id}"),
-            InlineKeyboardButton(text="➕ Дописать", callback_data=f"myroutes:comment_append:{route_id}")
+            InlineKeyboardButton(text="✏️ Заменить", callback_data=callbacks.pack(callbacks.ROUTE_COMMENT_REPLACE, route_id)),
+            InlineKeyboardButton(text="➕ Дописать", callback_data=callbacks.pack(callbacks.ROUTE_COMMENT_APPEND, route_id))
         ],
         [
-            InlineKeyboardButton(text="🗑 Удалить", callback_data=f"myroutes:comment_delete:{route_id}")
+            InlineKeyboardButton(text="🗑 Удалить", callback_data=callbacks.pack(callbacks.ROUTE_COMMENT_DELETE, route_id))
         ],
         [
-            InlineKeyboardButton(text="🔙 Назад", callback_data=f"myroutes:edit_back:{route_id}"),
-            InlineKeyboardButton(text="❌ Отменить", callback_data=f"myroutes:edit_cancel:{route_id}")
+            InlineKeyboardButton(text="🔙 Назад", callback_data=callbacks.pack(callbacks.ROUTE_EDIT_BACK, route_id)),
+            InlineKeyboardButton(text="❌ Отменить", callback_data=callbacks.pack(callbacks.ROUTE_EDIT_CANCEL, route_id))
         ]
     ])
 
-@router.callback_query(F.data.startswith("myroutes:edit:"))
+@router.callback_query(F.data.startswith(callbacks.ROUTE_EDIT + ":"))
 async def show_edit_menu(call: CallbackQuery, state: FSMContext) -> None:
     """Показывает меню выбора параметра для изменения"""
-    route_id_str = call.data.split(":")[-1]
-    try:
-        route_id = int(route_id_str)
-    except ValueError:
+    route_id = callbacks.unpack_id(call.data, callbacks.ROUTE_EDIT)
+    if route_id is None:
         await call.answer("❌ Ошибка: неверный ID маршрута", show_alert=True)
         return
 
@@ -399,47 +417,24 @@ async def show_edit_menu(call: CallbackQuery, state: FSMContext) -> None:
         selected_date_iso=selected_date_iso  # БАГ #24: Сохраняем дату для проверки времени
     )
 
-    from_location = route.get("from_location", "?")
-    to_location = route.get("to_location", "?")
-    date_dmy = route.get("date_dmy", "?")
-    time_hm = route.get("time_hm", "?")
-    price = route.get("price", 0)
-    seats = route.get("seats", 0)
-    comment = route.get("comment", "Нет")
-
-    text = (
-        f"✏️ <b>Изменение маршрута</b>\n\n"
-        f"<b>Текущие данные:</b>\n"
-        f"📍 Откуда: {from_location}\n"
-        f"📍 Куда: {to_location}\n"
-        f"📅 Дата: {date_dmy}\n"
-        f"🕐 Время: {time_hm}\n"
-        f"💰 Цена: {price}₽\n"
-        f"👥 Мест: {seats}\n"
-        f"💬 Комментарий: {comment}\n\n"
-        f"Выберите что хотите изменить:"
-    )
+    text, kb = _edit_menu_view(route_id, route, [])
 
     await call.message.edit_text(
         text,
-        reply_markup=_kb_edit_menu(route_id),
+        reply_markup=kb,
         parse_mode="HTML"
     )
     await call.answer()
 
 
-@router.callback_query(F.data.startswith("myroutes:edit_field:"))
+@router.callback_query(F.data.startswith(callbacks.ROUTE_EDIT_FIELD + ":"))
 async def start_field_edit(call: CallbackQuery, state: FSMContext) -> None:
     """Начинает редактирование выбранного поля"""
-    parts = call.data.split(":")
-    route_id_str = parts[2]
-    field_name = parts[3]
-
-    try:
-        route_id = int(route_id_str)
-    except ValueError:
+    values = callbacks.unpack_field(call.data, callbacks.ROUTE_EDIT_FIELD)
+    if values is None:
         await call.answer("❌ Ошибка", show_alert=True)
         return
+    route_id, field_name = values
 
     data = await state.get_data()
     original_route = data.get('original_route', {})
@@ -471,6 +466,19 @@ async def start_field_edit(call: CallbackQuery, state: FSMContext) -> None:
         await call.answer()
         return
 
+    if field_name == "instant_booking":
+        # Переключатель - применяется вместе с остальными изменениями по "Готово"
+        changed_fields = data.get('changed_fields', [])
+        instant = _get_pending_value(changed_fields, 'instant_booking', route.get("instant_booking", 0))
+        changed_fields = [c for c in changed_fields if c['field'] != 'instant_booking']
+        changed_fields.append({'field': 'instant_booking', 'value': 0 if instant else 1})
+        await state.update_data(changed_fields=changed_fields)
+
+        text, kb = _edit_menu_view(route_id, route, changed_fields)
+        await call.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
+        await call.answer()
+        return
+
     if field_name == "comment":
         current_comment = route.get("comment", "")
 
@@ -534,10 +542,13 @@ async def start_field_edit(call: CallbackQuery, state: FSMContext) -> None:
     await call.answer()
 
 
-@router.callback_query(F.data.startswith("myroutes:edit_back:"))
+@router.callback_query(F.data.startswith(callbacks.ROUTE_EDIT_BACK + ":"))
 async def back_to_edit_menu(call: CallbackQuery, state: FSMContext) -> None:
     """БАГ #18 + БАГ #19 ИСПРАВЛЕН: Возврат в меню редактирования или меню комментария"""
-    route_id = int(call.data.split(":")[-1])
+    # Сюда же ведёт "Назад" из календаря даты
+    route_id = callbacks.unpack_id(call.data, callbacks.ROUTE_EDIT_BACK)
+    if route_id is None:
+        route_id = callbacks.unpack_id(call.data, callbacks.EDIT_CALENDAR_BACK)
     
     data = await state.get_data()
     changed_fields = data.get('changed_fields', [])
@@ -607,60 +618,38 @@ async def back_to_edit_menu(call: CallbackQuery, state: FSMContext) -> None:
         await call.answer("❌ Это не ваш маршрут", show_alert=True)
         return
 
-    # БАГ #18: Показываем ВРЕМЕННЫЕ значения из changed_fields
-    from_location = _get_pending_value(changed_fields, 'from_location', route.get("from_location", "?"))
-    to_location = _get_pending_value(changed_fields, 'to_location', route.get("to_location", "?"))
-    date_dmy = _get_pending_value(changed_fields, 'date', route.get("date_dmy", "?"))
-    time_hm = _get_pending_value(changed_fields, 'time', route.get("time_hm", "?"))
-    price = _get_pending_value(changed_fields, 'price', route.get("price", 0))
-    seats = _get_pending_value(changed_fields, 'seats', route.get("seats", 0))
-    comment = _get_pending_value(changed_fields, 'comment', route.get("comment", "Нет"))
-    if comment == "":
-        comment = "Нет"
-
-    text = (
-        f"✏️ <b>Изменение маршрута</b>\n\n"
-        f"<b>Текущие данные:</b>\n"
-        f"📍 Откуда: {from_location}\n"
-        f"📍 Куда: {to_location}\n"
-        f"📅 Дата: {date_dmy}\n"
-        f"🕐 Время: {time_hm}\n"
-        f"💰 Цена: {price}₽\n"
-        f"👥 Мест: {seats}\n"
-        f"💬 Комментарий: {comment}\n\n"
-        f"Выберите что хотите изменить:"
-    )
+    text, kb = _edit_menu_view(route_id, route, changed_fields)
 
     await call.message.edit_text(
         text,
-        reply_markup=_kb_edit_menu(route_id),
+        reply_markup=kb,
         parse_mode="HTML"
     )
     await call.answer()
 
 
-@router.callback_query(F.data.startswith("editcal:"))
+@router.callback_query(F.data.startswith(callbacks.EDIT_CALENDAR + ":"))
 async def process_calendar(call: CallbackQuery, state: FSMContext) -> None:
     """Обрабатывает клики по календарю"""
     data = await state.get_data()
     route_id = data.get("route_id")
     edit_message_id = data.get("edit_message_id")
 
-    action = call.data.split(":")[1]
+    prev_month = callbacks.unpack(call.data, callbacks.EDIT_CALENDAR_PREV, 2)
+    next_month = callbacks.unpack(call.data, callbacks.EDIT_CALENDAR_NEXT, 2)
+    day_values = callbacks.unpack(call.data, callbacks.EDIT_CALENDAR_DAY, 3)
 
-    if action == "ignore":
+    if call.data == callbacks.EDIT_CALENDAR_IGNORE:
         await call.answer()
         return
     
     # БАГ #10: Обработка кнопки "Назад" в календаре
-    elif action == "back":
-        route_id = int(call.data.split(":")[-1])
+    elif callbacks.unpack_id(call.data, callbacks.EDIT_CALENDAR_BACK) is not None:
         await back_to_edit_menu(call, state)
         return
 
-    elif action == "prev":
-        year = int(call.data.split(":")[2])
-        month = int(call.data.split(":")[3])
+    elif prev_month:
+        year, month = prev_month
 
         month -= 1
         if month < 1:
@@ -672,9 +661,8 @@ async def process_calendar(call: CallbackQuery, state: FSMContext) -> None:
         await call.message.edit_reply_markup(reply_markup=calendar_kb)
         await call.answer()
 
-    elif action == "next":
-        year = int(call.data.split(":")[2])
-        month = int(call.data.split(":")[3])
+    elif next_month:
+        year, month = next_month
 
         month += 1
         if month > 12:
@@ -686,10 +674,8 @@ async def process_calendar(call: CallbackQuery, state: FSMContext) -> None:
         await call.message.edit_reply_markup(reply_markup=calendar_kb)
         await call.answer()
 
-    elif action == "day":
-        year = int(call.data.split(":")[2])
-        month = int(call.data.split(":")[3])
-        day = int(call.data.split(":")[4])
+    elif day_values:
+        year, month, day = day_values
 
         selected_date = date(year, month, day)
         new_date_dmy = selected_date.strftime('%d.%m.%Y')
@@ -715,11 +701,18 @@ async def process_calendar(call: CallbackQuery, state: FSMContext) -> None:
         await call.answer(f"✅ Дата: {new_date_dmy}")
 
 
-@router.callback_query(F.data.startswith("myroutes:comment_"))
+@router.callback_query(F.data.startswith(callbacks.ROUTE_COMMENT_REPLACE + ":"))
+@router.callback_query(F.data.startswith(callbacks.ROUTE_COMMENT_APPEND + ":"))
+@router.callback_query(F.data.startswith(callbacks.ROUTE_COMMENT_DELETE + ":"))
 async def handle_comment_action(call: CallbackQuery, state: FSMContext) -> None:
     """Обрабатывает действия с комментарием"""
-    action = call.data.split(":")[1].replace("comment_", "")
-    route_id = int(call.data.split(":")[-1])
+    for action, prefix in _COMMENT_ACTIONS.items():
+        route_id = callbacks.unpack_id(call.data, prefix)
+        if route_id is not None:
+            break
+    else:
+        await call.answer("❌ Ошибка", show_alert=True)
+        return
 
     data = await state.get_data()
     original_route = data.get('original_route', {})
@@ -1018,46 +1011,24 @@ async def show_edit_menu_after_update(message: Message, route_id: int, state: FS
     if not route:
         return
 
-    # БАГ #18: Показываем ВРЕМЕННЫЕ значения из changed_fields
-    from_location = _get_pending_value(changed_fields, 'from_location', route.get("from_location", "?"))
-    to_location = _get_pending_value(changed_fields, 'to_location', route.get("to_location", "?"))
-    date_dmy = _get_pending_value(changed_fields, 'date', route.get("date_dmy", "?"))
-    time_hm = _get_pending_value(changed_fields, 'time', route.get("time_hm", "?"))
-    price = _get_pending_value(changed_fields, 'price', route.get("price", 0))
-    seats = _get_pending_value(changed_fields, 'seats', route.get("seats", 0))
-    comment = _get_pending_value(changed_fields, 'comment', route.get("comment", "Нет"))
-    if comment == "":
-        comment = "Нет"
-
-    text = (
-        f"✏️ <b>Изменение маршрута</b>\n\n"
-        f"<b>Текущие данные:</b>\n"
-        f"📍 Откуда: {from_location}\n"
-        f"📍 Куда: {to_location}\n"
-        f"📅 Дата: {date_dmy}\n"
-        f"🕐 Время: {time_hm}\n"
-        f"💰 Цена: {price}₽\n"
-        f"👥 Мест: {seats}\n"
-        f"💬 Комментарий: {comment}\n\n"
-        f"Выберите что хотите изменить:"
-    )
+    text, kb = _edit_menu_view(route_id, route, changed_fields)
 
     try:
         await message.bot.edit_message_text(
             text,
             chat_id=message.chat.id,
             message_id=edit_message_id,
-            reply_markup=_kb_edit_menu(route_id),
+            reply_markup=kb,
             parse_mode="HTML"
         )
     except:
         pass
 
 
-@router.callback_query(F.data.startswith("myroutes:edit_done:"))
-async def finish_edit(call: CallbackQuery, state: FSMContext) -> None:
+@router.callback_query(F.data.startswith(callbacks.ROUTE_EDIT_DONE + ":"))
+async def finish_edit(call: CallbackQuery, state: FSMContext, waitlist: WaitlistPromoter) -> None:
     """БАГ #18 + БАГ #24 + БАГ #27 ИСПРАВЛЕН: Завершает редактирование - ПРИМЕНЯЕТ ВСЕ ИЗМЕНЕНИЯ + проверка прошедшего времени"""
-    route_id = int(call.data.split(":")[-1])
+    route_id = callbacks.unpack_id(call.data, callbacks.ROUTE_EDIT_DONE)
     
     data = await state.get_data()
     changed_fields = data.get('changed_fields', [])
@@ -1134,6 +1105,8 @@ async def finish_edit(call: CallbackQuery, state: FSMContext) -> None:
                 updates['seats'] = value
             elif field == 'comment':
                 updates['comment'] = value
+            elif field == 'instant_booking':
+                updates['instant_booking'] = value
         
         # ОДИН РАЗ сохраняем ВСЕ изменения
         if updates:
@@ -1143,89 +1116,39 @@ async def finish_edit(call: CallbackQuery, state: FSMContext) -> None:
     # БАГ #27: Отправляем уведомления ПОСЛЕ сохранения с передачей original_route
     await _notify_passengers_about_change(route_id, call.bot, changed_fields, original_route)
     
+    # Мест стало больше - переводим пассажиров из листа ожидания
+    if any(change['field'] == 'seats' for change in changed_fields):
+        await waitlist.promote(call.bot, route_id)
+    
     await state.clear()
 
-    route = database.get_route_by_id(route_id)
+    route = database.get_card_route(route_id)
 
     if not route:
         await call.answer("❌ Маршрут не найден", show_alert=True)
         return
 
-    driver_id = call.from_user.id
-    is_active = route.get('is_active', 1)
-
-    from handlers.my_routes.details_handler import _kb_route_actions
-
-    from_location = route.get("from_location", "?")
-    to_location = route.get("to_location", "?")
-    date_dmy = route.get("date_dmy", "?")
-    time_hm = route.get("time_hm", "?")
-    price = route.get("price", 0)
-    seats = route.get("seats", 0)
-    comment = route.get("comment", "")
-
-    card = (
-        f"• {date_dmy}г. {time_hm} — {from_location} → {to_location} | "
-        f"цена: {price}₽ | мест: {seats}\n"
-    )
-
-    if comment:
-        card += f"💬 {comment}\n"
-
-    status = _get_route_status(route_id, driver_id)
-    card += f"\n{status}"
-
-    await call.message.edit_text(
-        card,
-        reply_markup=_kb_route_actions(route_id, is_active),
-        parse_mode="HTML"
-    )
+    card, kb = cards.owner_card(route)
+    await call.message.edit_text(card, reply_markup=kb, parse_mode="HTML")
     await call.answer("Изменения сохранены ✅")
 
 
-@router.callback_query(F.data.startswith("myroutes:edit_cancel:"))
+@router.callback_query(F.data.startswith(callbacks.ROUTE_EDIT_CANCEL + ":"))
 async def cancel_edit(call: CallbackQuery, state: FSMContext) -> None:
     """БАГ #18 ИСПРАВЛЕН: Отмена редактирования - БЕЗ сохранения изменений"""
-    route_id = int(call.data.split(":")[-1])
+    route_id = callbacks.unpack_id(call.data, callbacks.ROUTE_EDIT_CANCEL)
     
     # БАГ #18: Очищаем state - изменения НЕ сохранятся!
     await state.clear()
     
     logging.info(f"БАГ #18: Отмена редактирования маршрута {route_id} - изменения НЕ сохранены")
 
-    route = database.get_route_by_id(route_id)
+    route = database.get_card_route(route_id)
 
     if not route:
         await call.answer("❌ Маршрут не найден", show_alert=True)
         return
 
-    driver_id = call.from_user.id
-    is_active = route.get('is_active', 1)
-
-    from handlers.my_routes.details_handler import _kb_route_actions
-
-    from_location = route.get("from_location", "?")
-    to_location = route.get("to_location", "?")
-    date_dmy = route.get("date_dmy", "?")
-    time_hm = route.get("time_hm", "?")
-    price = route.get("price", 0)
-    seats = route.get("seats", 0)
-    comment = route.get("comment", "")
-
-    card = (
-        f"• {date_dmy}г. {time_hm} — {from_location} → {to_location} | "
-        f"цена: {price}₽ | мест: {seats}\n"
-    )
-
-    if comment:
-        card += f"💬 {comment}\n"
-
-    status = _get_route_status(route_id, driver_id)
-    card += f"\n{status}"
-
-    await call.message.edit_text(
-        card,
-        reply_markup=_kb_route_actions(route_id, is_active),
-        parse_mode="HTML"
-    )
+    card, kb = cards.owner_card(route)
+    await call.message.edit_text(card, reply_markup=kb, parse_mode="HTML")
     await call.answer("Отменено")
\ No newline at end of file
@@ -7,6 +7,7 @@ from aiogram import Router, F
 from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from datetime import datetime
+import callbacks
 import database
 
 router = Router(name="my_trips")
@@ -49,7 +50,7 @@ def _make_trip_keyboard(req_id: int, route_id: int, driver_id: int, status: str)
     if status in ["pending", "accepted"]:
         buttons.append(InlineKeyboardButton(
             text="❌ Отменить",
-            callback_data=f"mytrips:cancel:{req_id}"
+            callback_data=callbacks.pack(callbacks.TRIP_CANCEL, req_id)
         ))
     
     return InlineKeyboardMarkup(inline_keyboard=[buttons] if buttons else [])
@@ -63,12 +64,12 @@ def _make_pagination_keyboard(page: int, total_pages: int) -> InlineKeyboardMark
     if page > 1:
         nav_buttons.append(InlineKeyboardButton(
             text="← Назад",
-            callback_data=f"mytrips:page:{page-1}"
+            callback_data=callbacks.pack(callbacks.TRIPS_PAGE, page-1)
         ))
     if page < total_pages:
         nav_buttons.append(InlineKeyboardButton(
             text="Вперёд →",
-            callback_data=f"mytrips:page:{page+1}"
+            callback_data=callbacks.pack(callbacks.TRIPS_PAGE, page+1)
         ))
     
     if nav_buttons:
@@ -160,27 +161,23 @@ async def show_my_trips(call: CallbackQuery, state: FSMContext) -> None:
     await _show_trips_page(call, page=1)
     await call.answer()
 
-@router.callback_query(F.data.startswith("mytrips:page:"))
+@router.callback_query(F.data.startswith(callbacks.TRIPS_PAGE + ":"))
 async def show_trips_page(call: CallbackQuery, state: FSMContext) -> None:
     """Показать конкретную страницу поездок"""
-    page_str = call.data.split(":")[-1]
-    try:
-        page = int(page_str)
-    except ValueError:
+    page = callbacks.unpack_id(call.data, callbacks.TRIPS_PAGE)
+    if page is None:
         await call.answer("❌ Ошибка: неверный номер страницы", show_alert=True)
         return
     
     await _show_trips_page(call, page=page)
     await call.answer()
 
-@router.callback_query(F.data.startswith("mytrips:cancel:"))
+@router.callback_query(F.data.startswith(callbacks.TRIP_CANCEL + ":"))
 async def cancel_trip(call: CallbackQuery, state: FSMContext) -> None:
     """Отменить поездку"""
     # Получаем req_id
-    req_id_str = call.data.split(":")[-1]
-    try:
-        req_id = int(req_id_str)
-    except ValueError:
+    req_id = callbacks.unpack_id(call.data, callbacks.TRIP_CANCEL)
+    if req_id is None:
         await call.answer("❌ Ошибка: неверный ID заявки", show_alert=True)
         return
     
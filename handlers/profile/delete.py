@@ -8,6 +8,7 @@ from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardBut
 from aiogram.fsm.context import FSMContext
 import database
 import logging
+from middlewares.user_upsert import UserUpsertMiddleware
 
 router = Router(name="profile_delete")
 logger = logging.getLogger(__name__)
@@ -64,7 +65,7 @@ async def delete_account_confirm(call: CallbackQuery, state: FSMContext) -> None
 
 
 @router.callback_query(F.data == "profile:delete:confirm")
-async def delete_account_execute(call: CallbackQuery, state: FSMContext) -> None:
+async def delete_account_execute(call: CallbackQuery, state: FSMContext, seen_users: UserUpsertMiddleware) -> None:
     """БАГ #9 ИСПРАВЛЕН: Выполнить удаление аккаунта с уведомлениями пассажирам"""
     user_id = call.from_user.id
     
@@ -144,6 +145,7 @@ async def delete_account_execute(call: CallbackQuery, state: FSMContext) -> None
     
     # Деактивируем пользователя
     database.delete_user(user_id)
+    seen_users.forget(user_id)
     
     # Очищаем состояние
     await state.clear()
@@ -19,11 +19,13 @@ class EditProfileStates(StatesGroup):
     waiting_for_photo = State()
 
 
-def _make_edit_menu_keyboard(is_registered: bool = True, has_photo: bool = False) -> InlineKeyboardMarkup:
+def _make_edit_menu_keyboard(is_registered: bool = True, has_photo: bool = False,
+                             notify_digest: bool = False) -> InlineKeyboardMarkup:
     """
     БАГ #10 ИСПРАВЛЕН: Меню редактирования с динамическими кнопками
     - has_photo = True → "Изменить фото" + кнопка "Удалить"
     - has_photo = False → "Добавить фото" (БЕЗ кнопки "Удалить")
+    - notify_digest - как водитель получает заявки: по одной или сводкой
     """
     if is_registered:
         # ЗАРЕГИСТРИРОВАННЫЙ - кнопки "Изменить"
@@ -44,6 +46,10 @@ def _make_edit_menu_keyboard(is_registered: bool = True, has_photo: bool = False
             [InlineKeyboardButton(text="✏️ Изменить имя", callback_data="profile:edit:name")],
             [InlineKeyboardButton(text="📝 Изменить описание", callback_data="profile:edit:bio")],
             photo_row,
+            [InlineKeyboardButton(
+                text="🗂 Заявки: сводкой" if notify_digest else "🔔 Заявки: по одной",
+                callback_data="profile:edit:digest"
+            )],
             [InlineKeyboardButton(text="✅ Готово", callback_data="profile")]
         ]
     else:
@@ -102,6 +108,7 @@ async def show_edit_menu(call: CallbackQuery, state: FSMContext) -> None:
     
     # БАГ #10: Проверяем есть ли фото
     has_photo = profile.get('photo_file_id') is not None
+    notify_digest = bool(profile.get('notify_digest'))
     
     if is_registered:
         # ЗАРЕГИСТРИРОВАННЫЙ
@@ -114,7 +121,7 @@ async def show_edit_menu(call: CallbackQuery, state: FSMContext) -> None:
     try:
         msg = await call.message.edit_text(
             text,
-            reply_markup=_make_edit_menu_keyboard(is_registered=is_registered, has_photo=has_photo),
+            reply_markup=_make_edit_menu_keyboard(is_registered=is_registered, has_photo=has_photo, notify_digest=notify_digest),
             parse_mode="HTML"
         )
         # БАГ #15: Сохраняем message_id
@@ -128,7 +135,7 @@ async def show_edit_menu(call: CallbackQuery, state: FSMContext) -> None:
         msg = await call.bot.send_message(
             chat_id=call.message.chat.id,
             text=text,
-            reply_markup=_make_edit_menu_keyboard(is_registered=is_registered, has_photo=has_photo),
+            reply_markup=_make_edit_menu_keyboard(is_registered=is_registered, has_photo=has_photo, notify_digest=notify_digest),
             parse_mode="HTML"
         )
         # БАГ #15: Сохраняем message_id
@@ -234,6 +241,7 @@ async def edit_name_process(message: Message, state: FSMContext) -> None:
     profile = database.get_user_profile(message.from_user.id)
     is_registered = profile.get('display_name') is not None
     has_photo = profile.get('photo_file_id') is not None
+    notify_digest = bool(profile.get('notify_digest'))
     
     # Возвращаемся в меню редактирования
     if is_registered:
@@ -247,7 +255,7 @@ async def edit_name_process(message: Message, state: FSMContext) -> None:
             chat_id=message.chat.id,
             message_id=bot_msg_id,
             text=text,
-            reply_markup=_make_edit_menu_keyboard(is_registered=is_registered, has_photo=has_photo),
+            reply_markup=_make_edit_menu_keyboard(is_registered=is_registered, has_photo=has_photo, notify_digest=notify_digest),
             parse_mode="HTML"
         )
     except:
@@ -338,6 +346,7 @@ async def edit_bio_process(message: Message, state: FSMContext) -> None:
     profile = database.get_user_profile(message.from_user.id)
     is_registered = profile.get('display_name') is not None
     has_photo = profile.get('photo_file_id') is not None
+    notify_digest = bool(profile.get('notify_digest'))
     
     # Возвращаемся в меню редактирования
     if is_registered:
@@ -351,7 +360,7 @@ async def edit_bio_process(message: Message, state: FSMContext) -> None:
             chat_id=message.chat.id,
             message_id=bot_msg_id,
             text=text,
-            reply_markup=_make_edit_menu_keyboard(is_registered=is_registered, has_photo=has_photo),
+            reply_markup=_make_edit_menu_keyboard(is_registered=is_registered, has_photo=has_photo, notify_digest=notify_digest),
             parse_mode="HTML"
         )
     except:
@@ -421,6 +430,7 @@ async def edit_photo_process(message: Message, state: FSMContext) -> None:
     profile = database.get_user_profile(message.from_user.id)
     is_registered = profile.get('display_name') is not None
     has_photo = profile.get('photo_file_id') is not None
+    notify_digest = bool(profile.get('notify_digest'))
     
     # Возвращаемся в меню редактирования
     if is_registered:
@@ -434,7 +444,7 @@ async def edit_photo_process(message: Message, state: FSMContext) -> None:
             chat_id=message.chat.id,
             message_id=bot_msg_id,
             text=text,
-            reply_markup=_make_edit_menu_keyboard(is_registered=is_registered, has_photo=has_photo),
+            reply_markup=_make_edit_menu_keyboard(is_registered=is_registered, has_photo=has_photo, notify_digest=notify_digest),
             parse_mode="HTML"
         )
     except:
@@ -502,6 +512,27 @@ async def delete_photo_execute(call: CallbackQuery, state: FSMContext) -> None:
     await show_edit_menu(call, state)
 
 
+@router.callback_query(F.data == "profile:edit:digest")
+async def toggle_digest(call: CallbackQuery, state: FSMContext) -> None:
+    """Новые заявки водителю: по одной или сводкой (driver_digest.py)"""
+    user_id = call.from_user.id
+    profile = database.get_user_profile(user_id)
+    
+    if not profile:
+        await call.answer("❌ Профиль не найден", show_alert=True)
+        return
+    
+    notify_digest = 0 if profile.get('notify_digest') else 1
+    database.update_user_profile(user_id, notify_digest=notify_digest)
+    
+    if notify_digest:
+        await call.answer("🗂 Новые заявки будут собираться в одно сообщение")
+    else:
+        await call.answer("🔔 Каждая заявка - отдельным сообщением")
+    
+    await show_edit_menu(call, state)
+
+
 @router.callback_query(F.data == "profile:edit:cancel")
 async def edit_cancel(call: CallbackQuery, state: FSMContext) -> None:
     """Отменить редактирование"""
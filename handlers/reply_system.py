@@ -15,96 +15,23 @@ from aiogram import F, Router
 from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from datetime import datetime
+import callbacks
+import card_refresher
+import cards
 import database
+from driver_digest import DriverDigest, is_digest
+from waitlist import WaitlistPromoter
 
 router = Router(name="reply_system")
 
-# ==== Вспомогательные функции ================================================
-
-def _format_route_card(route: dict, passenger_id: int = None) -> str:
-    """Форматирование карточки маршрута"""
-    from_location = route.get('from_location', '—')
-    to_location = route.get('to_location', '—')
-    date_dmy = route.get('date_dmy', '—')
-    time_hm = route.get('time_hm', '—')
-    price = route.get('price', 0)
-    seats = route.get('seats', 0)
-    comment = route.get('comment', '')
-
-    # Формируем карточку
-    card = f"• {date_dmy}г. {time_hm} — {from_location} → {to_location} | цена: {price}₽ | мест: {seats}"
-
-    if comment:
-        card += f"\n💬 {comment}"
-
-    # Проверяем статус заявки пассажира
-    if passenger_id:
-        route_id = route.get('id')
-        if route_id:
-            status = database.get_passenger_request_status(route_id, passenger_id)
-            if status == 'pending':
-                card += "\n\n⏳ <b>Заявка отправлена</b>"
-            elif status == 'rejected':
-                card += "\n\n❌ <b>Заявка отклонена</b>"
-            elif status == 'accepted':
-                card += "\n\n✅ <b>Заявка принята!</b>"
-
-    return card
-
-def _make_route_card_keyboard(route_id: int, driver_id: int = None) -> InlineKeyboardMarkup:
-    """
-    БАГ #18: Клавиатура карточки маршрута с кнопками Профиль/Откликнуться/Чат
-    """
-    buttons = []
-    
-    # Кнопка "Профиль водителя" - ТОЛЬКО если есть driver_id
-    if driver_id:
-        buttons.append(InlineKeyboardButton(
-            text="👤 Профиль",
-            callback_data=f"driver:profile:{driver_id}"
-        ))
-    
-    # Кнопка "Откликнуться"
-    buttons.append(InlineKeyboardButton(
-        text="👋 Откликнуться",
-        callback_data=f"rs:card:reply:{route_id}"
-    ))
-    
-    # Кнопка "Чат" - получаем username из БД
-    if driver_id:
-        driver = database.get_user_by_id(driver_id)
-        driver_username = driver.get('tg_username') if driver else None
-        
-        # Строгая проверка username
-        if database.is_valid_telegram_username(driver_username):
-            # URL-кнопка - сразу открывает чат
-            buttons.append(InlineKeyboardButton(
-                text="💬 Чат",
-                url=f"https://t.me/{driver_username.strip()}"
-            ))
-        else:
-            # Если нет username - показываем инструкцию
-            buttons.append(InlineKeyboardButton(
-                text="💬 Чат",
-                callback_data=f"route:chat:open:{route_id}"
-            ))
-    else:
-        # Если нет driver_id - показываем инструкцию
-        buttons.append(InlineKeyboardButton(
-            text="💬 Чат",
-            callback_data=f"route:chat:open:{route_id}"
-        ))
-    
-    return InlineKeyboardMarkup(inline_keyboard=[buttons])
-
 # ==== Клавиатуры =============================================================
 
 def _kb_driver_decision(req_id: int) -> InlineKeyboardMarkup:
     """Кнопки для водителя: Принять/Отклонить."""
     return InlineKeyboardMarkup(inline_keyboard=[
         [
-            InlineKeyboardButton(text="✅ Принять", callback_data=f"reply:accept:{req_id}"),
-            InlineKeyboardButton(text="❌ Отклонить", callback_data=f"reply:reject:{req_id}")
+            InlineKeyboardButton(text="✅ Принять", callback_data=callbacks.pack(callbacks.DRIVER_ACCEPT, req_id)),
+            InlineKeyboardButton(text="❌ Отклонить", callback_data=callbacks.pack(callbacks.DRIVER_REJECT, req_id))
         ]
     ])
 
@@ -119,8 +46,8 @@ def _footer_keyboard() -> InlineKeyboardMarkup:
 
 # ==== Обработчики ============================================================
 
-@router.callback_query(F.data.startswith("rs:card:reply:"))
-async def on_passenger_reply(call: CallbackQuery, state: FSMContext) -> None:
+@router.callback_query(F.data.startswith(callbacks.ROUTE_REPLY + ":"))
+async def on_passenger_reply(call: CallbackQuery, state: FSMContext, driver_digest: DriverDigest) -> None:
     """
     Пассажир нажал "Откликнуться".
     1. Создаём заявку в БД
@@ -129,15 +56,13 @@ async def on_passenger_reply(call: CallbackQuery, state: FSMContext) -> None:
     4. СОХРАНЯЕМ message_id карточки в БД
     """
     # Получаем route_id из callback
-    route_id_str = call.data.split(":")[-1]
-    try:
-        route_id = int(route_id_str)
-    except ValueError:
+    route_id = callbacks.unpack_id(call.data, callbacks.ROUTE_REPLY)
+    if route_id is None:
         await call.answer("❌ Ошибка: неверный ID маршрута", show_alert=True)
         return
 
-    # Получаем информацию о маршруте
-    route = database.get_route_by_id(route_id)
+    # Получаем информацию о маршруте (вместе с настройками водителя)
+    route = database.get_card_route(route_id)
     if not route:
         await call.answer("❌ Маршрут не найден", show_alert=True)
         return
@@ -147,10 +72,10 @@ async def on_passenger_reply(call: CallbackQuery, state: FSMContext) -> None:
         await call.answer("❌ Маршрут неактивен", show_alert=True)
         return
 
-    # Проверяем, есть ли свободные места
+    # Мест нет или уже есть очередь - в лист ожидания (места достаются по порядку очереди)
     seats = route.get("seats", 0)
-    if seats <= 0:
-        await call.answer("❌ Мест больше нет", show_alert=True)
+    if seats <= 0 or database.get_waitlist_size(route_id):
+        await _join_waitlist(call, route_id)
         return
 
     # ID пассажира
@@ -170,8 +95,10 @@ async def on_passenger_reply(call: CallbackQuery, state: FSMContext) -> None:
     #     await call.answer("❌ Вы не можете откликнуться на свой маршрут", show_alert=True)
     #     return
 
-    # Сохраняем пользователя в БД
-    database.create_user(passenger_id, passenger_username)
+    # Мгновенное бронирование - место занимается сразу, без решения водителя
+    if route.get("instant_booking"):
+        await _book_instantly(call, route, driver_digest)
+        return
 
     # Создаём заявку в БД
     req_id = database.create_request(route_id, passenger_id)
@@ -197,14 +124,17 @@ async def on_passenger_reply(call: CallbackQuery, state: FSMContext) -> None:
         f"Принять заявку?"
     )
 
-    # Отправляем уведомление водителю
+    # Отправляем уведомление водителю (или добавляем заявку в его сводку)
     try:
-        await call.bot.send_message(
-            chat_id=driver_id,
-            text=driver_text,
-            reply_markup=_kb_driver_decision(req_id),
-            parse_mode="HTML"
-        )
+        if route.get("driver_notify_digest"):
+            await driver_digest.add(call.bot, driver_id, req_id)
+        else:
+            await call.bot.send_message(
+                chat_id=driver_id,
+                text=driver_text,
+                reply_markup=_kb_driver_decision(req_id),
+                parse_mode="HTML"
+            )
     except Exception as e:
         await call.answer("❌ Не удалось отправить уведомление водителю", show_alert=True)
         return
@@ -212,38 +142,110 @@ async def on_passenger_reply(call: CallbackQuery, state: FSMContext) -> None:
     await call.answer("✅ Заявка отправлена водителю!")
 
     # РЕДАКТИРУЕМ текущую карточку
+    await _update_reply_card(call, route_id, req_id)
+
+
+async def _book_instantly(call: CallbackQuery, route: dict, driver_digest: DriverDigest) -> None:
+    """
+    Отклик на маршрут с мгновенным бронированием.
+    Заявка сразу принята, водитель получает уведомление без кнопок решения.
+    """
+    route_id = route.get("id")
+    passenger_id = call.from_user.id
+    driver_id = route.get("user_id")
+
+    # Заявка и списание места - одной транзакцией (одновременные брони не займут лишних мест)
+    req_id, result, seats_left = database.book_seat(route_id, passenger_id)
+    if result == "exists":
+        await call.answer("⚠️ Вы уже откликались на этот маршрут", show_alert=True)
+        return
+    if result == "full":
+        await _join_waitlist(call, route_id)
+        return
+
+    await call.answer("✅ Место забронировано!")
+
+    try:
+        await call.bot.send_message(
+            chat_id=passenger_id,
+            text=cards.instant_booking_text(route, seats_left, route.get("driver_username")),
+            parse_mode="HTML"
+        )
+    except Exception:
+        pass
+
+    driver_text = (
+        f"⚡ <b>Новое бронирование!</b>\n\n"
+        f"📍 Маршрут: {route.get('from_location', '?')} → {route.get('to_location', '?')}\n"
+        f"📅 Дата: {route.get('date_dmy', '?')}г.\n"
+        f"🕐 Время: {route.get('time_hm', '?')}\n"
+        f"👤 Пассажир: @{call.from_user.username or 'Пассажир'}\n"
+        f"👥 Осталось мест: {seats_left}\n\n"
+        f"Место забронировано автоматически (мгновенное бронирование)."
+    )
+
+    # Водителю - уведомление (или строка в сводке заявок)
+    try:
+        if route.get("driver_notify_digest"):
+            await driver_digest.add(call.bot, driver_id, req_id)
+        else:
+            await call.bot.send_message(chat_id=driver_id, text=driver_text, parse_mode="HTML")
+    except Exception:
+        pass
+
+    await _update_reply_card(call, route_id, req_id)
+
+
+async def _join_waitlist(call: CallbackQuery, route_id: int) -> None:
+    """Мест нет - пассажир встаёт в лист ожидания (waitlist.py переведёт его в заявку)"""
+    passenger_id = call.from_user.id
+    if database.get_passenger_request_status(route_id, passenger_id) in ("pending", "accepted", "rejected"):
+        await call.answer("⚠️ Вы уже откликались на этот маршрут", show_alert=True)
+        return
+    position = database.join_waitlist(route_id, passenger_id)
+    await call.answer(
+        f"⏳ Мест больше нет. Вы в листе ожидания: №{position}.\n"
+        f"Мы сообщим, когда место освободится.",
+        show_alert=True
+    )
+
+
+async def _update_reply_card(call: CallbackQuery, route_id: int, req_id: int) -> None:
+    """Карточка, на которой нажали кнопку, показывает статус заявки пассажира"""
+    passenger_id = call.from_user.id
     try:
-        # Получаем обновленные данные маршрута
-        route_updated = database.get_route_by_id(route_id)
+        # Получаем обновленные данные маршрута (вместе со статусом заявки пассажира)
+        route_updated = database.get_card_route(route_id, viewer_id=passenger_id)
         
         # Формируем карточку с новым статусом
-        card_text = _format_route_card(route_updated, passenger_id=passenger_id)
-        kb = _make_route_card_keyboard(route_id, driver_id)
+        card_text, kb = cards.route_card(route_updated, cards.VARIANT_REPLY, route_updated.get('viewer_status'))
         
         # РЕДАКТИРУЕМ текущее сообщение
         edited_msg = await call.message.edit_text(card_text, reply_markup=kb, parse_mode="HTML")
         
         # СОХРАНЯЕМ message_id в БД для последующего обновления
         database.update_request_card_info(req_id, edited_msg.chat.id, edited_msg.message_id)
+        database.register_displayed_cards([(
+            route_id, edited_msg.chat.id, edited_msg.message_id, passenger_id,
+            cards.VARIANT_REPLY, card_refresher.card_hash(card_text, kb),
+        )])
     except Exception as e:
         # Если редактирование не удалось
         pass
 
 
-@router.callback_query(F.data.startswith("reply:accept:"))
-async def on_driver_accept(call: CallbackQuery, state: FSMContext) -> None:
+@router.callback_query(F.data.startswith(callbacks.DRIVER_ACCEPT + ":"))
+async def on_driver_accept(call: CallbackQuery, state: FSMContext, driver_digest: DriverDigest) -> None:
     """
     Водитель принял заявку.
     1. Обновляем статус заявки
     2. Уменьшаем количество мест
     3. Уведомляем пассажира
-    4. АВТОМАТИЧЕСКИ ОБНОВЛЯЕМ карточку у пассажира
+    4. Карточки пассажира обновляет card_refresher (после записи в БД)
     """
     # Получаем req_id
-    req_id_str = call.data.split(":")[-1]
-    try:
-        req_id = int(req_id_str)
-    except ValueError:
+    req_id = callbacks.unpack_id(call.data, callbacks.DRIVER_ACCEPT)
+    if req_id is None:
         await call.answer("❌ Ошибка: неверный ID заявки", show_alert=True)
         return
 
@@ -273,39 +275,14 @@ async def on_driver_accept(call: CallbackQuery, state: FSMContext) -> None:
         await call.answer("❌ Мест больше нет", show_alert=True)
         return
 
-    # Обновляем статус заявки
-    database.update_request_status(req_id, "accepted")
-
-    # Уменьшаем количество мест
-    new_seats = seats - 1
-    database.update_route(route_id, seats=new_seats)
-
-    # Формируем текст уведомления для пассажира
-    from_location = route.get("from_location", "?")
-    to_location = route.get("to_location", "?")
-    date_dmy = route.get("date_dmy", "?")
-    time_hm = route.get("time_hm", "?")
-    price = route.get("price", "?")
-
-    # Получаем username водителя (тот кто нажал "Принять")
-    driver_username = call.from_user.username
+    # Обновляем статус заявки и уменьшаем количество мест (одной транзакцией)
+    new_seats = database.accept_request(req_id)
+    if new_seats is None:
+        await call.answer("❌ Заявка уже обработана или мест больше нет", show_alert=True)
+        return
 
-    # Добавляем строку с водителем
-    driver_contact = ""
-    if driver_username:
-        driver_contact = f"👤 Водитель: @{driver_username}\n"
-
-    passenger_text = (
-        f"🎉 <b>Ваша заявка принята!</b>\n\n"
-        f"📍 Маршрут: {from_location} → {to_location}\n"
-        f"📅 Дата: {date_dmy}г.\n"
-        f"🕐 Время: {time_hm}\n"
-        f"💰 Цена: {price}₽\n"
-        f"👥 Количество мест: {seats}\n"
-        f"{driver_contact}\n"
-        f"Водитель подтвердил вашу поездку. "
-        f"Свяжитесь с ним для уточнения деталей."
-    )
+    # Формируем текст уведомления для пассажира (username водителя - тот кто нажал "Принять")
+    passenger_text = cards.request_accepted_text(route, seats, call.from_user.username)
 
     # Отправляем уведомление пассажиру
     try:
@@ -317,33 +294,10 @@ async def on_driver_accept(call: CallbackQuery, state: FSMContext) -> None:
     except Exception:
         pass
 
-    # АВТОМАТИЧЕСКИ ОБНОВЛЯЕМ карточку у пассажира
-    try:
-        card_chat_id = request.get("card_chat_id")
-        card_message_id = request.get("card_message_id")
-        
-        if card_chat_id and card_message_id:
-            # Получаем обновленные данные маршрута
-            route_updated = database.get_route_by_id(route_id)
-            
-            # Формируем карточку с новым статусом
-            card_text = _format_route_card(route_updated, passenger_id=passenger_id)
-            driver_id = route.get("user_id")
-            kb = _make_route_card_keyboard(route_id, driver_id)
-            
-            # РЕДАКТИРУЕМ карточку у пассажира
-            await call.bot.edit_message_text(
-                chat_id=card_chat_id,
-                message_id=card_message_id,
-                text=card_text,
-                reply_markup=kb,
-                parse_mode="HTML"
-            )
-    except Exception:
-        pass
-
     # Обновляем сообщение водителя
-    if call.message:
+    if is_digest(call.message):
+        await driver_digest.refresh(call.bot, call.message, req_id)
+    elif call.message:
         try:
             await call.message.edit_text(
                 f"{call.message.text}\n\n✅ <b>Заявка принята!</b>\n"
@@ -356,19 +310,18 @@ async def on_driver_accept(call: CallbackQuery, state: FSMContext) -> None:
     await call.answer("✅ Заявка принята! Пассажиру отправлено уведомление.")
 
 
-@router.callback_query(F.data.startswith("reply:reject:"))
-async def on_driver_reject(call: CallbackQuery, state: FSMContext) -> None:
+@router.callback_query(F.data.startswith(callbacks.DRIVER_REJECT + ":"))
+async def on_driver_reject(call: CallbackQuery, state: FSMContext, driver_digest: DriverDigest,
+                           waitlist: WaitlistPromoter) -> None:
     """
     БАГ #18: Водитель отклонил заявку - передаём driver_id в клавиатуру!
     1. Обновляем статус заявки
     2. Уведомляем пассажира
-    3. АВТОМАТИЧЕСКИ ОБНОВЛЯЕМ карточку у пассажира
+    3. Карточки пассажира обновляет card_refresher (после записи в БД)
     """
     # Получаем req_id
-    req_id_str = call.data.split(":")[-1]
-    try:
-        req_id = int(req_id_str)
-    except ValueError:
+    req_id = callbacks.unpack_id(call.data, callbacks.DRIVER_REJECT)
+    if req_id is None:
         await call.answer("❌ Ошибка: неверный ID заявки", show_alert=True)
         return
 
@@ -389,18 +342,8 @@ async def on_driver_reject(call: CallbackQuery, state: FSMContext) -> None:
     # Обновляем статус заявки
     database.update_request_status(req_id, "rejected")
 
-    # Получаем информацию о маршруте для уведомления
-    route = database.get_route_by_id(route_id)
-    from_location = route.get("from_location", "?") if route else "?"
-    to_location = route.get("to_location", "?") if route else "?"
-
     # Формируем текст уведомления для пассажира
-    passenger_text = (
-        f"😔 <b>Ваша заявка отклонена</b>\n\n"
-        f"📍 Маршрут: {from_location} → {to_location}\n\n"
-        f"К сожалению, водитель не смог принять вашу заявку. "
-        f"Попробуйте найти другой маршрут."
-    )
+    passenger_text = cards.request_rejected_text(database.get_route_by_id(route_id))
 
     # Отправляем уведомление пассажиру
     try:
@@ -412,33 +355,10 @@ async def on_driver_reject(call: CallbackQuery, state: FSMContext) -> None:
     except Exception:
         pass
 
-    # АВТОМАТИЧЕСКИ ОБНОВЛЯЕМ карточку у пассажира
-    try:
-        card_chat_id = request.get("card_chat_id")
-        card_message_id = request.get("card_message_id")
-        
-        if card_chat_id and card_message_id:
-            # Получаем обновленные данные маршрута
-            route_updated = database.get_route_by_id(route_id)
-            
-            # Формируем карточку с новым статусом
-            card_text = _format_route_card(route_updated, passenger_id=passenger_id)
-            driver_id = route.get("user_id") if route else None
-            kb = _make_route_card_keyboard(route_id, driver_id)
-            
-            # РЕДАКТИРУЕМ карточку у пассажира
-            await call.bot.edit_message_text(
-                chat_id=card_chat_id,
-                message_id=card_message_id,
-                text=card_text,
-                reply_markup=kb,
-                parse_mode="HTML"
-            )
-    except Exception:
-        pass
-
     # Обновляем сообщение водителя
-    if call.message:
+    if is_digest(call.message):
+        await driver_digest.refresh(call.bot, call.message, req_id)
+    elif call.message:
         try:
             await call.message.edit_text(
                 f"{call.message.text}\n\n❌ <b>Заявка отклонена</b>",
@@ -449,17 +369,18 @@ async def on_driver_reject(call: CallbackQuery, state: FSMContext) -> None:
 
     await call.answer("❌ Заявка отклонена. Пассажиру отправлено уведомление.")
 
+    # Отклонённая заявка больше не держит место - первому из листа ожидания
+    await waitlist.promote(call.bot, route_id)
 
-@router.callback_query(F.data.startswith("route:chat:open:"))
+
+@router.callback_query(F.data.startswith(callbacks.ROUTE_CHAT_OPEN + ":"))
 async def on_open_chat(call: CallbackQuery) -> None:
     """
     БАГ #11-12: Показывает инструкцию по открытию чата с водителем.
     Работает и на телефоне, и на компьютере!
     """
-    route_id_str = call.data.split(":")[-1]
-    try:
-        route_id = int(route_id_str)
-    except ValueError:
+    route_id = callbacks.unpack_id(call.data, callbacks.ROUTE_CHAT_OPEN)
+    if route_id is None:
         await call.answer("❌ Ошибка", show_alert=True)
         return
     
@@ -505,7 +426,7 @@ async def on_open_chat(call: CallbackQuery) -> None:
     )
 
 
-@router.callback_query(F.data.startswith("route:chat:error:"))
+@router.callback_query(F.data.startswith(callbacks.ROUTE_CHAT_ERROR + ":"))
 async def on_chat_error(call: CallbackQuery, state: FSMContext) -> None:
     """
     Обработчик ошибки - у водителя нет username.
@@ -517,7 +438,7 @@ async def on_chat_error(call: CallbackQuery, state: FSMContext) -> None:
     )
 
 
-@router.callback_query(F.data == "driver:profile:close")
+@router.callback_query(F.data == callbacks.DRIVER_PROFILE_CLOSE)
 async def close_driver_profile(callback: CallbackQuery):
     """БАГ #18: Закрыть профиль водителя - ПЕРВЫЙ обработчик (точное совпадение)"""
     try:
@@ -527,7 +448,7 @@ async def close_driver_profile(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("driver:profile:"))
+@router.callback_query(F.data.startswith(callbacks.DRIVER_PROFILE + ":"))
 async def show_driver_profile(callback: CallbackQuery):
     """БАГ #18: Показать ПОЛНЫЙ профиль водителя - ВТОРОЙ обработчик (начинается с)"""
     driver_id_str = callback.data.split(":")[-1]
@@ -536,9 +457,8 @@ async def show_driver_profile(callback: CallbackQuery):
         await callback.answer("❌ Ошибка: водитель не найден", show_alert=True)
         return
     
-    try:
-        driver_id = int(driver_id_str)
-    except (ValueError, TypeError):
+    driver_id = callbacks.unpack_id(callback.data, callbacks.DRIVER_PROFILE)
+    if driver_id is None:
         await callback.answer("❌ Ошибка: неверный ID водителя", show_alert=True)
         return
     
@@ -565,7 +485,7 @@ async def show_driver_profile(callback: CallbackQuery):
     
     # Клавиатура
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🔙 Закрыть", callback_data="driver:profile:close")]
+        [InlineKeyboardButton(text="🔙 Закрыть", callback_data=callbacks.DRIVER_PROFILE_CLOSE)]
     ])
     
     # Отправляем профиль
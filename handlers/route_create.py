@@ -540,6 +540,19 @@ async def process_comment(message: Message, state: FSMContext):
     await state.update_data(comment=final_comment)
     data = await state.get_data()
     
+    text, keyboard = _confirm_view(data)
+    
+    await message.bot.edit_message_text(
+        chat_id=message.chat.id,
+        message_id=bot_msg_id,
+        text=text,
+        reply_markup=keyboard,
+        parse_mode='HTML'
+    )
+    await state.set_state(RouteCreate.confirm)
+
+def _confirm_view(data):
+    """Экран подтверждения: сводка маршрута и кнопки публикации"""
     # БАГ #9: Формируем текст подтверждения
     text = (
         f"✅ <b>ПОДТВЕРЖДЕНИЕ</b>\n\n"
@@ -555,24 +568,43 @@ async def process_comment(message: Message, state: FSMContext):
     if saved_comment:
         text += f"💬 Комментарий: {saved_comment}\n"
     
+    # Мгновенное бронирование: пассажир занимает место без подтверждения водителя
+    instant = data.get('instant_booking')
+    if instant:
+        text += "⚡ Мгновенное бронирование: пассажиры бронируют места без вашего подтверждения\n"
+    
     text = pad_text(text)
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(
+                text="⚡ Мгновенное бронирование: вкл" if instant else "⚡ Мгновенное бронирование: выкл",
+                callback_data="route_instant"
+            )
+        ],
         [
             InlineKeyboardButton(text="🔙 Назад     ", callback_data="route_back"),
             InlineKeyboardButton(text="✅ Опубликовать     ", callback_data="route_publish"),
             InlineKeyboardButton(text="❌ Отмена     ", callback_data="route_cancel")
         ]
     ])
+    return text, keyboard
+
+@router.callback_query(F.data == "route_instant")
+async def toggle_instant_booking(callback: CallbackQuery, state: FSMContext):
+    """Включение/выключение мгновенного бронирования на экране подтверждения"""
+    # Состояние проверяется здесь, а не фильтром: кнопка остаётся в дереве маршрутизации
+    if await state.get_state() != RouteCreate.confirm.state:
+        # Кнопка со старого экрана подтверждения - мастер уже завершён
+        await callback.answer()
+        return
+    data = await state.get_data()
+    await state.update_data(instant_booking=0 if data.get('instant_booking') else 1)
+    data = await state.get_data()
     
-    await message.bot.edit_message_text(
-        chat_id=message.chat.id,
-        message_id=bot_msg_id,
-        text=text,
-        reply_markup=keyboard,
-        parse_mode='HTML'
-    )
-    await state.set_state(RouteCreate.confirm)
+    text, keyboard = _confirm_view(data)
+    await callback.message.edit_text(text, reply_markup=keyboard, parse_mode='HTML')
+    await callback.answer()
 
 @router.callback_query(F.data == "route_publish_now")
 async def publish_without_comment(callback: CallbackQuery, state: FSMContext):
@@ -591,7 +623,8 @@ async def publish_without_comment(callback: CallbackQuery, state: FSMContext):
         time_hm=data['time_hm'],
         price=data['price'],
         seats=data['seats'],
-        comment=""
+        comment="",
+        instant_booking=data.get('instant_booking', 0)
     )
     
     await state.clear()
@@ -633,7 +666,8 @@ async def publish_route(callback: CallbackQuery, state: FSMContext):
         time_hm=data['time_hm'],
         price=data['price'],
         seats=data['seats'],
-        comment=data.get('comment', '')
+        comment=data.get('comment', ''),
+        instant_booking=data.get('instant_booking', 0)
     )
     
     await state.clear()
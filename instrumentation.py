@@ -0,0 +1,35 @@
+# coding: utf-8
+"""
+Общее для metrics.py и tracing.py: обёртки функций database.py
+и middleware сессии бота, которое ставится один раз на сессию.
+"""
+import inspect
+from typing import Any, Callable, Set
+
+from aiogram import Bot
+
+# Функции database.py, которые не ходят в БД
+NOT_QUERIES = {"add_route_listener", "is_valid_telegram_username"}
+
+def wrap_database_functions(module: Any, decorator: Callable[[str, Callable], Callable], marker: str) -> int:
+    """
+    Заменяет функции модуля БД на decorator(имя, функция). marker - атрибут
+    обёртки: уже обёрнутая этим декоратором функция второй раз не оборачивается.
+    Возвращает число обёрнутых
+    """
+    wrapped = 0
+    for name, function in list(vars(module).items()):
+        if (name.startswith("_") or name in NOT_QUERIES or not inspect.isfunction(function)
+                or function.__module__ != module.__name__ or getattr(function, marker, False)):
+            continue
+        wrapper = decorator(name, function)
+        setattr(wrapper, marker, True)
+        setattr(module, name, wrapper)
+        wrapped += 1
+    return wrapped
+
+def install_session_middleware(sessions: Set[int], bot: Bot, middleware: Callable) -> None:
+    """middleware в сессию бота, если его там ещё нет (sessions - id сессий с ним)"""
+    if id(bot.session) not in sessions:
+        sessions.add(id(bot.session))
+        bot.session.middleware(middleware)
@@ -0,0 +1,162 @@
+# coding: utf-8
+"""
+Сторож цикла событий: находит синхронные вызовы, которые останавливают бота
+для всех пользователей (медленный запрос SQLite, большой fetchall и т.п.).
+
+Задача в цикле каждые interval просыпается и замеряет задержку пробуждения
+(гистограмма poputchik_loop_lag_seconds на /metrics). Отдельный поток следит
+за тем, когда цикл должен был проснуться: если он опаздывает больше чем на
+threshold - цикл заблокирован, и поток снимает стек потока цикла. По стеку
+задержка приписывается обработчику (модуль handlers.*, а вне обработчиков -
+middlewares.*) и функции database.py.
+
+Строгий режим (strict_ms, для тестов и бенчмарков): каждая блокировка дольше
+strict_ms запоминается, check() и stop() выбрасывают LoopBlockedError.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Optional, Tuple
+
+import config
+from metrics import Counter, Histogram
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+# Код, которому приписывается блокировка: обработчики, а вне их - middleware
+_HANDLERS = (os.path.join(_ROOT, "handlers") + os.sep, os.path.join(_ROOT, "middlewares") + os.sep)
+_DATABASE = os.path.join(_ROOT, "database.py")
+
+# Сколько последних кадров стека писать в лог
+STACK_LIMIT = 15
+
+class LoopBlockedError(AssertionError):
+    """Строгий режим: цикл событий был заблокирован дольше strict_ms"""
+
+def _module(filename: str) -> str:
+    path = os.path.relpath(filename, _ROOT)
+    return os.path.splitext(path)[0].replace(os.sep, ".")
+
+def attribute(stack: List[traceback.FrameSummary]) -> Tuple[str, str]:
+    """(обработчик или middleware, функция database.py) по стеку; внешние кадры - в начале.
+    Обработчик - самый внешний кадр handlers.* (зарегистрированная функция),
+    middleware - самый внутренний (та, что делала работу)"""
+    handler = middleware = db_function = "-"
+    for frame in stack:
+        if handler == "-" and frame.filename.startswith(_HANDLERS[0]):
+            handler = f"{_module(frame.filename)}.{frame.name}"
+        if frame.filename.startswith(_HANDLERS[1]):
+            middleware = f"{_module(frame.filename)}.{frame.name}"
+        if db_function == "-" and frame.filename == _DATABASE:
+            db_function = frame.name
+    return (handler if handler != "-" else middleware), db_function
+
+class _Stall:
+    """Стек, снятый во время блокировки"""
+    __slots__ = ("stack", "handler", "db_function")
+
+    def __init__(self, stack: List[traceback.FrameSummary]) -> None:
+        self.stack = stack
+        self.handler, self.db_function = attribute(stack)
+
+class LoopWatchdog:
+    """Замер задержки цикла событий и поиск блокирующего кода"""
+
+    def __init__(self, threshold_ms: float = 100.0, interval_ms: float = 50.0, strict_ms: float = 0) -> None:
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.strict = strict_ms / 1000
+        self.lag = Histogram("poputchik_loop_lag_seconds", "Задержка пробуждения цикла событий")
+        self.stalls = Counter(
+            "poputchik_loop_stalls_total", "Блокировки цикла событий дольше порога", ("handler", "db_function"))
+        self.violations: List[str] = []
+        self.max_lag = 0.0
+        self._deadline = 0.0
+        self._stall: Optional[_Stall] = None
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    async def start(self) -> None:
+        """Запуск вместе с ботом (dp.startup)"""
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._deadline = time.monotonic() + self.interval
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._tick())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._stopping.set()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._thread.join(timeout=1)
+            self._thread = None
+        self.check()
+
+    def check(self) -> None:
+        """Строгий режим: ошибка, если были блокировки дольше strict_ms"""
+        if self.violations:
+            raise LoopBlockedError(
+                f"Цикл событий блокировался дольше {self.strict * 1000:.0f} мс:\n" + "\n\n".join(self.violations)
+            )
+
+    async def _tick(self) -> None:
+        while True:
+            self._deadline = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - self._deadline)
+            self.lag.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.threshold or (self.strict and lag >= self.strict):
+                self._report(lag)
+
+    def _watch(self) -> None:
+        # Поток проверяет чаще порога, чтобы застать блокировку и снять стек
+        limit = min(self.threshold, self.strict) if self.strict else self.threshold
+        poll = max(limit / 4, 0.005)
+        captured_for = None
+        while not self._stopping.wait(poll):
+            deadline = self._deadline
+            if captured_for == deadline or time.monotonic() - deadline < limit:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is not None:
+                self._stall = _Stall(traceback.extract_stack(frame))
+                captured_for = deadline
+
+    def _report(self, lag: float) -> None:
+        stall, self._stall = self._stall, None
+        handler, db_function = (stall.handler, stall.db_function) if stall else ("-", "-")
+        stack = "".join(traceback.format_list(stall.stack[-STACK_LIMIT:])) if stall else "  (стек не снят)\n"
+        message = (
+            f"⏱️ Цикл событий заблокирован на {lag * 1000:.0f} мс "
+            f"(обработчик: {handler}, БД: {db_function}):\n{stack}"
+        )
+        if lag >= self.threshold:
+            self.stalls.inc(handler, db_function)
+            logging.warning(message.rstrip())
+        if self.strict and lag >= self.strict:
+            self.violations.append(message.rstrip())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ticks": self.lag.count(),
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "stalls": self.stalls.total(),
+        }
+
+def create_loop_watchdog() -> LoopWatchdog:
+    """Сторож с порогами из config"""
+    return LoopWatchdog(config.LOOP_LAG_WARN_MS, config.LOOP_WATCHDOG_INTERVAL_MS, config.LOOP_STRICT_MS)
@@ -1,16 +1,35 @@
 ﻿import asyncio
 import logging
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.fsm.storage.memory import MemoryStorage
+import card_refresher
+import cluster
+import config
 import database
-from dotenv import load_dotenv
-import os
-
-# Загружаем переменные из .env
-load_dotenv()
+import driver_digest
+import loop_watchdog
+import maintenance
+import metrics
+import sampling_profiler
+import scheduler
+import sender
+import tracing
+import update_recorder
+import waitlist
+import webhook
+from middlewares.callback_ack import CallbackAckMiddleware
+from middlewares.callback_dedup import CallbackDedupMiddleware
+from middlewares.callback_router import CallbackTrieMiddleware
+from middlewares.edit_dedup import EditDedupMiddleware
+from middlewares.handler_metrics import HandlerMetricsMiddleware
+from middlewares.tracing import HandlerTracingMiddleware, UpdateTracingMiddleware
+from middlewares.chat_order import ChatOrderMiddleware
+from middlewares.user_upsert import UserUpsertMiddleware
 
 # Импортируем обработчики
-from handlers import menu, navigation, route_create, reply_system
+from handlers import admin, menu, navigation, route_create, reply_system
 from handlers.routes_list import search_handler
 from handlers.my_routes import list_handler as my_routes_list
 from handlers.my_routes import details_handler, cancel_handler, edit_handler
@@ -22,23 +41,51 @@ from handlers.profile import delete as profile_delete
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 
-async def main():
-    # Инициализация бота
-    TOKEN = "8270928147:AAEz1zbYarSM_PFe7v3V6gmZ2-6TBjkh8lA"
-    bot = Bot(token=TOKEN)
+def create_bot() -> Bot:
+    """Инициализация бота (TELEGRAM_API_URL - свой сервер Bot API)"""
+    session = None
+    if config.TELEGRAM_API_URL:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(config.TELEGRAM_API_URL))
+    return Bot(token=config.BOT_TOKEN, session=session)
+
+def create_dispatcher() -> Dispatcher:
+    """Диспетчер со всеми роутерами"""
     storage = MemoryStorage()
     dp = Dispatcher(storage=storage)
     
-    # Инициализация БД
-    database.init_db()
+    # Обезличенный журнал входящих обновлений - первым, до любой обработки
+    if config.UPDATE_RECORD_FILE:
+        dp["update_recorder"] = update_recorder.create_update_recorder()
+        dp.update.outer_middleware(dp["update_recorder"])
+        dp.startup.register(dp["update_recorder"].start)
+        dp.shutdown.register(dp["update_recorder"].stop)
+    
+    # Повторная доставка нажатия кнопки отбрасывается до любой работы
+    dp["callback_dedup"] = CallbackDedupMiddleware(config.CALLBACK_DEDUP_CACHE_SIZE)
+    dp.update.outer_middleware(dp["callback_dedup"])
+    
+    # Ответ на нажатие кнопки, не дожидаясь БД, отправки сообщений и очереди чата
+    dp["callback_ack"] = CallbackAckMiddleware(config.CALLBACK_ACK_DEADLINE_MS / 1000)
+    dp.update.outer_middleware(dp["callback_ack"])
+    
+    # Обновления одного чата - строго по очереди, разных чатов - параллельно
+    dp["chat_order"] = ChatOrderMiddleware(config.MAX_IN_FLIGHT_UPDATES)
+    dp.update.outer_middleware(dp["chat_order"])
+    
+    # Пользователь записывается в БД, только если он новый или сменил username
+    dp["seen_users"] = UserUpsertMiddleware(config.USER_FLUSH_INTERVAL_SEC, config.USER_CACHE_SIZE)
+    dp.update.outer_middleware(dp["seen_users"])
+    dp.shutdown.register(dp["seen_users"].stop)
     
     # Регистрация роутеров
+    # Команды администраторов - первыми, чтобы их не перехватили состояния FSM
+    dp.include_router(admin.router)
     dp.include_router(menu.router)
     dp.include_router(navigation.router)
     dp.include_router(route_create.router)
     dp.include_router(reply_system.router)
     
-    # Мои поездки - ПЕРЕМЕСТИЛИ ВЫШЕ search_handler!
+    # Мои поездки
     dp.include_router(my_trips_handler.router)
     
     # Поиск маршрутов
@@ -55,8 +102,91 @@ async def main():
     dp.include_router(profile_edit.router)
     dp.include_router(profile_delete.router)
     
+    # Кнопки - по дереву префиксов, собранному из фильтров всех роутеров
+    dp["callback_router"] = CallbackTrieMiddleware.build(dp)
+    dp["callback_router"].report()
+    dp.callback_query.outer_middleware(dp["callback_router"])
+    
+    # Редактирования, которые ничего не меняют, не отправляются в Telegram
+    dp["edit_dedup"] = EditDedupMiddleware(config.EDIT_DEDUP_CACHE_SIZE)
+    dp.startup.register(dp["edit_dedup"].install)
+    
+    # Показанные карточки маршрутов обновляются после изменений в БД
+    dp["sender"] = sender.create_sender()
+    dp["card_refresher"] = card_refresher.create_card_refresher(dp["sender"])
+    database.add_route_listener(dp["card_refresher"].mark_changed)
+    dp.startup.register(dp["card_refresher"].start)
+    dp.shutdown.register(dp["card_refresher"].stop)
+    
+    # Сводки заявок для водителей, включивших их в профиле
+    dp["driver_digest"] = driver_digest.create_driver_digest()
+    
+    # Лист ожидания: перевод в заявки, когда освобождаются места
+    dp["waitlist"] = waitlist.WaitlistPromoter(dp["sender"], dp["driver_digest"])
+    
+    # Фоновые задания: снятие прошедших маршрутов, напоминания, обслуживание и копии БД
+    # (в кластере - только в воркере 0)
+    if config.SCHEDULER_ENABLED and config.BOT_WORKER_INDEX == 0:
+        dp["scheduler"] = scheduler.create_scheduler()
+        dp["maintenance"] = maintenance.MaintenanceJobs(dp["sender"], dp["card_refresher"])
+        dp["maintenance"].install(dp["scheduler"])
+        dp.startup.register(dp["scheduler"].start)
+        dp.shutdown.register(dp["scheduler"].stop)
+    
+    # Метрики на /metrics: обработчики, функции БД, запросы к Bot API, состояния FSM
+    dp["metrics"] = metrics.create_metrics()
+    dp["metrics"].instrument_database(database)
+    handler_metrics = HandlerMetricsMiddleware(dp["metrics"])
+    dp.message.middleware(handler_metrics)
+    dp.callback_query.middleware(handler_metrics)
+    dp.startup.register(dp["metrics"].install)
+    dp.startup.register(dp["metrics"].start)
+    dp.shutdown.register(dp["metrics"].stop)
+    
+    # Задержка цикла событий и стек кода, который его блокирует
+    dp["loop_watchdog"] = loop_watchdog.create_loop_watchdog()
+    dp["metrics"].register(dp["loop_watchdog"].lag, dp["loop_watchdog"].stalls)
+    dp.startup.register(dp["loop_watchdog"].start)
+    dp.shutdown.register(dp["loop_watchdog"].stop)
+    
+    # Сэмплирующий профайлер (включается командой /profile)
+    dp["sampling_profiler"] = sampling_profiler.create_sampling_profiler()
+    dp.update.outer_middleware(dp["sampling_profiler"])
+    dp.startup.register(dp["sampling_profiler"].start)
+    dp.shutdown.register(dp["sampling_profiler"].stop)
+    
+    # Трассировка: обновление -> обработчик -> БД / Bot API, спаны в TRACE_FILE
+    if config.TRACE_FILE:
+        dp["tracer"] = tracing.create_tracer()
+        dp["tracer"].instrument_database(database)
+        dp.update.outer_middleware(UpdateTracingMiddleware(dp["tracer"]))
+        handler_tracing = HandlerTracingMiddleware(dp["tracer"])
+        dp.message.middleware(handler_tracing)
+        dp.callback_query.middleware(handler_tracing)
+        dp.startup.register(dp["tracer"].install)
+        dp.startup.register(dp["tracer"].start)
+        dp.shutdown.register(dp["tracer"].stop)
+    
+    return dp
+
+async def main():
+    # Инициализация БД
+    database.init_db()
+    
+    bot = create_bot()
+    dp = create_dispatcher()
+    
+    # Запрашиваем у Telegram только те типы обновлений, которые обрабатывают роутеры
+    allowed_updates = dp.resolve_used_update_types()
+    
     # Запуск бота
-    await dp.start_polling(bot)
+    if config.BOT_MODE == "webhook":
+        await webhook.run_webhook(dp, bot, allowed_updates=allowed_updates)
+    elif config.BOT_MODE == "cluster":
+        # Фронт раздаёт обновления процессам-воркерам по chat_id
+        await cluster.run_cluster(bot, allowed_updates)
+    else:
+        await dp.start_polling(bot, allowed_updates=allowed_updates)
 
 if __name__ == '__main__':
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,147 @@
+# coding: utf-8
+"""
+Фоновые задания обслуживания (выполняет scheduler.py):
+- expire_routes: маршруты, отправившиеся больше ROUTE_EXPIRY_GRACE_MIN назад,
+  снимаются с публикации; их показанные карточки обновляются (card_refresher.py);
+- schedule_reminders: для маршрутов, отправляющихся в ближайшее время, ставит
+  разовые задания route_reminder на момент "за REMINDER_BEFORE_MIN до отправления";
+- route_reminder: напоминание водителю и принятым пассажирам
+  (job_key с датой и временем - после переноса маршрута напоминание будет новым);
+- optimize_db: PRAGMA optimize, VACUUM при большой доле свободных страниц,
+  удаление старых выполненных заданий;
+- backup_db: копия БД в BACKUP_DIR, хранятся BACKUP_KEEP последних.
+Тяжёлая работа с БД идёт в потоке (asyncio.to_thread).
+"""
+import asyncio
+import glob
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot
+
+import config
+import database
+from card_refresher import CardRefresher
+from scheduler import Scheduler
+from sender import RateLimitedSender
+
+def _departure(route: Dict[str, Any]) -> datetime:
+    return datetime.strptime(f"{route['date_dmy']} {route['time_hm']}", "%d.%m.%Y %H:%M")
+
+def _reminder_text(route: Dict[str, Any], minutes: int) -> str:
+    return (
+        f"⏰ <b>Поездка через {minutes} мин.</b>\n\n"
+        f"📍 Маршрут: {route.get('from_location', '?')} → {route.get('to_location', '?')}\n"
+        f"📅 Дата: {route.get('date_dmy', '?')}г.\n"
+        f"🕐 Время: {route.get('time_hm', '?')}"
+    )
+
+class MaintenanceJobs:
+    """Обработчики фоновых заданий и их регистрация в планировщике"""
+
+    def __init__(self, sender: RateLimitedSender, card_refresher: CardRefresher) -> None:
+        self.sender = sender
+        self.card_refresher = card_refresher
+        self.scheduler: Optional[Scheduler] = None
+        self.expired_routes = 0
+        self.reminders_sent = 0
+        self.backups = 0
+        self.vacuums = 0
+
+    def install(self, scheduler: Scheduler) -> None:
+        """Регистрирует задания, включённые в config"""
+        self.scheduler = scheduler
+        if config.ROUTE_EXPIRY_INTERVAL_MIN > 0:
+            scheduler.register("expire_routes", self.expire_routes)
+            scheduler.every("expire_routes", interval=config.ROUTE_EXPIRY_INTERVAL_MIN * 60,
+                            jitter=config.SCHEDULER_JITTER_SEC)
+        if config.REMINDER_BEFORE_MIN > 0:
+            scheduler.register("schedule_reminders", self.schedule_reminders)
+            scheduler.every("schedule_reminders", interval=config.REMINDER_SCAN_MIN * 60,
+                            jitter=config.SCHEDULER_JITTER_SEC)
+            scheduler.register("route_reminder", self.route_reminder, concurrency=config.REMINDER_CONCURRENCY)
+        if config.VACUUM_AT:
+            scheduler.register("optimize_db", self.optimize_db, timeout=3600)
+            scheduler.every("optimize_db", at=config.VACUUM_AT, jitter=config.SCHEDULER_JITTER_SEC)
+        if config.BACKUP_DIR and config.BACKUP_AT:
+            scheduler.register("backup_db", self.backup_db, timeout=3600)
+            scheduler.every("backup_db", at=config.BACKUP_AT, jitter=config.SCHEDULER_JITTER_SEC)
+
+    # ---- Маршруты ------------------------------------------------------------
+
+    async def expire_routes(self, bot: Bot, payload: Dict[str, Any]) -> None:
+        departed_before = datetime.now() - timedelta(minutes=config.ROUTE_EXPIRY_GRACE_MIN)
+        route_ids = await asyncio.to_thread(database.expire_routes, departed_before)
+        self.expired_routes += len(route_ids)
+        for route_id in route_ids:
+            self.card_refresher.mark_changed(route_id)
+
+    async def schedule_reminders(self, bot: Bot, payload: Dict[str, Any]) -> None:
+        before = timedelta(minutes=config.REMINDER_BEFORE_MIN)
+        now = datetime.now()
+        # Окно с запасом на интервал сканирования и сдвиг запуска
+        horizon = now + before + timedelta(minutes=config.REMINDER_SCAN_MIN * 2)
+        routes = await asyncio.to_thread(database.get_departing_routes, now, horizon)
+        for route in routes:
+            try:
+                departure = _departure(route)
+            except ValueError:
+                continue
+            await self.scheduler.schedule(
+                "route_reminder",
+                max((departure - before).timestamp(), time.time()),
+                {"route_id": route["id"], "departure": departure.isoformat()},
+                job_key=f"reminder:{route['id']}:{departure:%Y-%m-%d %H:%M}",
+            )
+
+    async def route_reminder(self, bot: Bot, payload: Dict[str, Any]) -> None:
+        departure = datetime.fromisoformat(payload["departure"])
+        window = (departure - timedelta(minutes=1), departure)
+        routes = await asyncio.to_thread(database.get_departing_routes, *window)
+        route = next((route for route in routes if route["id"] == payload["route_id"]), None)
+        if route is None:
+            # Маршрут отменён или перенесён - для нового времени будет своё напоминание
+            return
+        minutes = max(1, round((departure - datetime.now()).total_seconds() / 60))
+        text = _reminder_text(route, minutes)
+        recipients = [route["user_id"]] + route["passenger_ids"]
+        results = await self.sender.call_many([
+            (chat_id, lambda chat_id=chat_id: bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML"))
+            for chat_id in recipients
+        ])
+        self.reminders_sent += sum(1 for result in results if not isinstance(result, Exception))
+
+    # ---- База данных ---------------------------------------------------------
+
+    async def optimize_db(self, bot: Bot, payload: Dict[str, Any]) -> None:
+        finished_before = (datetime.now() - timedelta(days=config.SCHEDULER_KEEP_DAYS)).isoformat()
+        deleted = await asyncio.to_thread(database.delete_finished_jobs, finished_before)
+        result = await asyncio.to_thread(database.optimize_database, config.VACUUM_FREE_RATIO)
+        self.vacuums += result["vacuumed"]
+        logging.info(f"🧹 Обслуживание БД: {result}, удалено заданий: {deleted}")
+
+    async def backup_db(self, bot: Bot, payload: Dict[str, Any]) -> None:
+        os.makedirs(config.BACKUP_DIR, exist_ok=True)
+        path = os.path.join(config.BACKUP_DIR, f"poputchik-{datetime.now():%Y%m%d-%H%M%S}.db")
+        await asyncio.to_thread(database.backup_database, path + ".part")
+        os.replace(path + ".part", path)
+        self.backups += 1
+        for old in self._backups()[config.BACKUP_KEEP:]:
+            os.remove(old)
+        logging.info(f"💾 Резервная копия БД: {path}")
+
+    @staticmethod
+    def _backups() -> List[str]:
+        """Копии БД, новые первыми"""
+        return sorted(glob.glob(os.path.join(config.BACKUP_DIR, "poputchik-*.db")), reverse=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "expired_routes": self.expired_routes,
+            "reminders_sent": self.reminders_sent,
+            "vacuums": self.vacuums,
+            "backups": self.backups,
+        }
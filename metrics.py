@@ -0,0 +1,270 @@
+# coding: utf-8
+"""
+Метрики в текстовом формате Prometheus: GET /metrics на METRICS_HOST:METRICS_PORT.
+
+Что собирается:
+- время обработчиков по роутеру, обработчику и префиксу callback_data / команде
+  (middlewares/handler_metrics.py) и их ошибки
+- время функций database.py (обёртки ставятся в instrument_database)
+- время запросов Bot API по методам, ошибки и ответы 429 (flood wait)
+- FSM: сколько пользователей сейчас в каждом состоянии
+- stats() компонентов из dp (sender, card_refresher, callback_ack, ...) и db_profiler
+
+Своя реализация вместо prometheus_client: нужно несколько счётчиков и
+гистограмм, а формат вывода простой.
+"""
+import functools
+import logging
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+
+import cards
+import config
+import db_profiler
+import instrumentation
+
+# Границы корзин гистограмм, секунды
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _labels(names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# ==== Типы метрик ============================================================
+
+class Counter:
+    """Счётчик с метками"""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.label_names = labels
+        self._values: Dict[Tuple[Any, ...], float] = defaultdict(int)
+
+    def inc(self, *labels: Any, amount: float = 1) -> None:
+        self._values[labels] += amount
+
+    def value(self, *labels: Any) -> float:
+        return self._values.get(labels, 0)
+
+    def total(self) -> float:
+        return sum(self._values.values())
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+class Histogram:
+    """Гистограмма длительностей с метками (накопительные корзины, как в Prometheus)"""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                 buckets: Iterable[float] = BUCKETS) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.label_names = labels
+        self.buckets = tuple(sorted(buckets))
+        # метки -> [счётчики корзин..., сумма, количество]
+        self._series: Dict[Tuple[Any, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: Any) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+                break
+        series[-2] += value
+        series[-1] += 1
+
+    def count(self, *labels: Any) -> int:
+        series = self._series.get(labels)
+        return series[-1] if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, hits in zip(self.buckets, series):
+                cumulative += hits
+                le = _labels(self.label_names, labels, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _labels(self.label_names, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {series[-2]!r}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {series[-1]}")
+        return lines
+
+# ==== Метрики бота ===========================================================
+
+class Metrics:
+    """Все метрики процесса + HTTP-сервер /metrics"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.host = host
+        self.port = port
+        self.handler_seconds = Histogram(
+            "poputchik_handler_seconds", "Время обработчика", ("router", "handler", "prefix"))
+        self.handler_errors = Counter(
+            "poputchik_handler_errors_total", "Исключения в обработчиках", ("router", "handler", "error"))
+        self.db_seconds = Histogram(
+            "poputchik_db_seconds", "Время функции database.py", ("function",))
+        self.db_errors = Counter(
+            "poputchik_db_errors_total", "Исключения в функциях database.py", ("function", "error"))
+        self.api_seconds = Histogram(
+            "poputchik_bot_api_seconds", "Время запроса к Bot API", ("method",))
+        self.api_errors = Counter(
+            "poputchik_bot_api_errors_total", "Ошибки запросов к Bot API", ("method", "error"))
+        self.flood_waits = Counter(
+            "poputchik_bot_api_flood_wait_total", "Ответы 429 (TelegramRetryAfter)", ("method",))
+        self.flood_wait_seconds = Counter(
+            "poputchik_bot_api_flood_wait_seconds_total", "Сумма retry_after из ответов 429", ("method",))
+        self._own = [
+            self.handler_seconds, self.handler_errors,
+            self.db_seconds, self.db_errors,
+            self.api_seconds, self.api_errors, self.flood_waits, self.flood_wait_seconds,
+        ]
+        self._sessions = set()
+        self._dispatcher: Optional[Dispatcher] = None
+        self._runner: Optional[web.AppRunner] = None
+
+    def register(self, *metrics: Any) -> None:
+        """Метрики других модулей (Counter/Histogram) в общий вывод"""
+        self._own.extend(metrics)
+
+    # ---- База данных --------------------------------------------------------
+
+    def instrument_database(self, module: Any) -> int:
+        """Оборачивает функции модуля БД замером времени. Возвращает число обёрнутых"""
+        return instrumentation.wrap_database_functions(module, self._timed, "_metrics_wrapped")
+
+    def _timed(self, name: str, function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            except Exception as e:
+                self.db_errors.inc(name, type(e).__name__)
+                raise
+            finally:
+                self.db_seconds.observe(time.perf_counter() - started, name)
+        return wrapper
+
+    # ---- Bot API ------------------------------------------------------------
+
+    async def install(self, bot: Bot) -> None:
+        """Middleware сессии бота (подходит для dp.startup). Регистрировать после
+        EditDedupMiddleware - тогда замеряются только реальные запросы"""
+        instrumentation.install_session_middleware(self._sessions, bot, self._intercept)
+
+    async def _intercept(self, make_request, bot: Bot, method: TelegramMethod) -> Any:
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter as e:
+            self.flood_waits.inc(name)
+            self.flood_wait_seconds.inc(name, amount=e.retry_after)
+            raise
+        except Exception as e:
+            self.api_errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            self.api_seconds.observe(time.perf_counter() - started, name)
+
+    # ---- Вывод --------------------------------------------------------------
+
+    def _fsm_lines(self) -> List[str]:
+        storage = getattr(self._dispatcher, "storage", None)
+        records = getattr(storage, "storage", None)
+        if records is None:
+            return []
+        states: Dict[str, int] = defaultdict(int)
+        for record in list(records.values()):
+            if getattr(record, "state", None):
+                states[record.state] += 1
+        lines = ["# HELP poputchik_fsm_states Пользователи в состоянии FSM",
+                 "# TYPE poputchik_fsm_states gauge"]
+        for state, count in sorted(states.items()):
+            lines.append(f"poputchik_fsm_states{_labels(('state',), (state,))} {count}")
+        return lines
+
+    def _component_lines(self) -> List[str]:
+        components: Dict[str, Any] = {"cards_cache": cards.cache_stats(), "db_queries": db_profiler.stats()}
+        for key, value in (self._dispatcher.workflow_data.items() if self._dispatcher else []):
+            stats = getattr(value, "stats", None)
+            if value is not self and callable(stats):
+                try:
+                    components[key] = stats()
+                except Exception as e:
+                    logging.warning(f"⚠️ stats() компонента {key}: {e}")
+        lines = ["# HELP poputchik_component_stat Показатели stats() компонентов из dp",
+                 "# TYPE poputchik_component_stat gauge"]
+        for component, stats in sorted(components.items()):
+            for stat, value in _flatten(stats):
+                lines.append(
+                    f"poputchik_component_stat{_labels(('component', 'stat'), (component, stat))} {_number(value)}"
+                )
+        return lines
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._own:
+            lines += metric.render()
+        lines += self._fsm_lines()
+        lines += self._component_lines()
+        return "\n".join(lines) + "\n"
+
+    # ---- HTTP ---------------------------------------------------------------
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Prometheus-Format": "0.0.4"})
+
+    async def start(self, dispatcher: Dispatcher) -> None:
+        """Запуск /metrics вместе с ботом (dp.startup). Порт 0 - без HTTP-сервера"""
+        self._dispatcher = dispatcher
+        if not self.port or self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logging.info(f"📈 Метрики: http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+def _flatten(stats: Any, prefix: str = "") -> List[Tuple[str, float]]:
+    """{"a": 1, "b": {"c": 2}} -> [("a", 1), ("b.c", 2)] - только числа"""
+    items = []
+    if isinstance(stats, dict):
+        for key, value in stats.items():
+            items += _flatten(value, f"{prefix}.{key}" if prefix else str(key))
+    elif isinstance(stats, (int, float)) and not isinstance(stats, bool):
+        items.append((prefix, stats))
+    return items
+
+def create_metrics() -> Metrics:
+    """Метрики с адресом из config"""
+    return Metrics(config.METRICS_HOST, config.METRICS_PORT)
@@ -0,0 +1,137 @@
+# coding: utf-8
+"""
+Быстрый ответ на нажатие inline-кнопки.
+Большинство обработчиков вызывают callback.answer() только после всех
+запросов к БД и отправки сообщений - всё это время у кнопки крутятся часики.
+
+Если обработчик не ответил сам за CALLBACK_ACK_DEADLINE_MS, middleware
+отвечает пустым answerCallbackQuery. Поздний ответ обработчика
+перехватывается на уровне сессии бота:
+- алерт (show_alert=True) приходит пользователю отдельным сообщением
+- короткое всплывающее уведомление пропускается (кнопка уже "отпущена")
+
+Middleware стоит на dp.update до ChatOrderMiddleware: срок отсчитывается
+с получения обновления, поэтому нажатие, ждущее в очереди чата медленное
+обновление, тоже подтверждается вовремя, а время до ответа включает ожидание.
+"""
+import asyncio
+import logging
+from collections import defaultdict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.methods import AnswerCallbackQuery, TelegramMethod
+from aiogram.types import TelegramObject, Update
+
+from callbacks import callback_prefix
+
+class _AckState:
+    """Состояние ответа на одно нажатие"""
+    __slots__ = ("started", "prefix", "chat_id", "answered", "early_method")
+
+    def __init__(self, started: float, prefix: str, chat_id: int) -> None:
+        self.started = started
+        self.prefix = prefix
+        self.chat_id = chat_id
+        self.answered = False
+        self.early_method = None
+
+class CallbackAckMiddleware(BaseMiddleware):
+    """Outer middleware на dp.update + перехват answerCallbackQuery в сессии бота"""
+
+    def __init__(self, deadline: float = 0.3, samples: int = 1000) -> None:
+        self.deadline = deadline
+        self._pending: Dict[str, _AckState] = {}
+        self._sessions = set()
+        self._ack_times: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=samples))
+        self.early_acks = 0
+        self.deferred_alerts = 0
+        self.dropped_toasts = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        callback = event.callback_query if isinstance(event, Update) else None
+        if callback is None:
+            return await handler(event, data)
+        bot: Bot = data["bot"]
+        self._ensure_session_middleware(bot)
+
+        loop = asyncio.get_running_loop()
+        state = _AckState(loop.time(), callback_prefix(callback.data), callback.from_user.id)
+        self._pending[callback.id] = state
+        timer = loop.call_later(self.deadline, lambda: asyncio.ensure_future(self._ack(bot, callback.id, state)))
+
+        try:
+            return await handler(event, data)
+        finally:
+            timer.cancel()
+            # Обработчик не ответил вовсе - убираем часики
+            if not state.answered:
+                await self._ack(bot, callback.id, state)
+            self._pending.pop(callback.id, None)
+
+    def _ensure_session_middleware(self, bot: Bot) -> None:
+        """Перехватчик запросов регистрируется в сессии бота один раз"""
+        if id(bot.session) not in self._sessions:
+            self._sessions.add(id(bot.session))
+            bot.session.middleware(self._intercept)
+
+    async def _ack(self, bot: Bot, callback_query_id: str, state: _AckState) -> None:
+        """Ранний пустой ответ от имени обработчика"""
+        if state.answered:
+            return
+        state.answered = True
+        state.early_method = AnswerCallbackQuery(callback_query_id=callback_query_id)
+        self.early_acks += 1
+        self._record(state)
+        try:
+            await bot(state.early_method)
+        except Exception as e:
+            logging.warning(f"⚠️ Не удалось ответить на callback {callback_query_id}: {e}")
+
+    def _record(self, state: _AckState) -> None:
+        self._ack_times[state.prefix].append(asyncio.get_running_loop().time() - state.started)
+
+    async def _intercept(self, make_request, bot: Bot, method: TelegramMethod) -> Any:
+        if isinstance(method, AnswerCallbackQuery):
+            state = self._pending.get(method.callback_query_id)
+            if state is not None and method is not state.early_method:
+                if state.answered:
+                    return await self._late_answer(bot, method, state)
+                state.answered = True
+                self._record(state)
+        return await make_request(bot, method)
+
+    async def _late_answer(self, bot: Bot, method: AnswerCallbackQuery, state: _AckState) -> Any:
+        """Ответ после раннего подтверждения: алерт - сообщением, тост - пропускаем"""
+        if method.text and method.show_alert:
+            self.deferred_alerts += 1
+            try:
+                await bot.send_message(chat_id=state.chat_id, text=method.text)
+            except Exception as e:
+                logging.warning(f"⚠️ Не удалось доставить отложенный алерт: {e}")
+        elif method.text:
+            self.dropped_toasts += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Время до ответа на нажатие по префиксам callback_data (мс)"""
+        per_prefix = {}
+        for prefix, times in self._ack_times.items():
+            ordered = sorted(times)
+            per_prefix[prefix] = {
+                "count": len(ordered),
+                "p50_ms": round(ordered[len(ordered) // 2] * 1000, 1),
+                "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 1),
+                "max_ms": round(ordered[-1] * 1000, 1),
+            }
+        return {
+            "early_acks": self.early_acks,
+            "deferred_alerts": self.deferred_alerts,
+            "dropped_toasts": self.dropped_toasts,
+            "time_to_ack": per_prefix,
+        }
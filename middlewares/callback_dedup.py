@@ -0,0 +1,51 @@
+# coding: utf-8
+"""
+Повторная доставка одного и того же нажатия кнопки.
+Telegram повторяет обновление, если не получил ответ на webhook вовремя,
+а после перезапуска polling может отдать уже обработанное обновление.
+Обработчик отклика при этом второй раз пишет в БД и шлёт водителю
+уведомление.
+
+Middleware помнит id последних обработанных callback_query (LRU) и
+пропускает повторы до любых запросов к БД и Bot API - в том числе до
+CallbackAckMiddleware и очереди чата, поэтому стоит на dp.update раньше них.
+Двойное нажатие пользователя - это два разных callback_query; от него
+защищает уникальный индекс заявок (database.create_or_get_request).
+"""
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+class CallbackDedupMiddleware(BaseMiddleware):
+    """Outer middleware на dp.update: пропуск уже виденных callback_query.id"""
+
+    def __init__(self, max_size: int = 10000) -> None:
+        self.max_size = max_size
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self.duplicates = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        callback = event.callback_query if isinstance(event, Update) else None
+        if callback is None:
+            return await handler(event, data)
+        if callback.id in self._seen:
+            self.duplicates += 1
+            self._seen.move_to_end(callback.id)
+            logging.info(f"Повторное нажатие {callback.id} ({callback.data}) пропущено")
+            return None
+
+        self._seen[callback.id] = None
+        while len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+        return await handler(event, data)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"remembered": len(self._seen), "duplicates": self.duplicates}
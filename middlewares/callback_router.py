@@ -0,0 +1,230 @@
+# coding: utf-8
+"""
+Маршрутизация нажатий inline-кнопок по префиксному дереву.
+Обычно aiogram проверяет фильтры F.data == ... / F.data.startswith(...)
+всех роутеров по очереди, пока какой-то не подойдёт. Здесь при старте
+из этих фильтров строится одно дерево, и обработчик находится за один
+проход по callback_data - с тем же результатом, что и перебор роутеров
+в порядке include_router.
+
+При сборке в лог пишется отчёт о дублях (один и тот же фильтр в
+нескольких роутерах) и затенённых обработчиках (до них никогда не дойдёт
+очередь, потому что раньше стоит более общий префикс).
+
+Обработчик, у которого кроме F.data есть другие фильтры (состояние FSM и т.п.)
+или фильтры на роутере, лежит в дереве со всеми фильтрами: при совпадении
+callback_data они проверяются, и если не прошли - берётся следующий по порядку.
+Обработчики без разбираемого фильтра F.data ("вне дерева") проверяются
+фильтрами в своей позиции для каждого нажатия - в отчёте они выводятся
+предупреждением, чтобы такой обработчик не появился незаметно.
+"""
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware, Dispatcher, Router
+from aiogram.dispatcher.event.bases import UNHANDLED, SkipHandler
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.dispatcher.event.telegram import TelegramEventObserver
+from aiogram.types import CallbackQuery
+from magic_filter.operations import CallOperation, ComparatorOperation, GetAttributeOperation
+
+EXACT = "=="
+PREFIX = "startswith"
+
+class _Entry:
+    """Обработчик в дереве (kind = None - вне дерева)"""
+    __slots__ = ("order", "kind", "literal", "router", "observer", "handler", "checked")
+
+    def __init__(self, order: int, kind: Optional[str], literal: Optional[str], router: Router,
+                 observer: TelegramEventObserver, handler: HandlerObject, checked: bool) -> None:
+        self.order = order
+        self.kind = kind
+        self.literal = literal
+        self.router = router
+        self.observer = observer
+        self.handler = handler
+        # Кроме F.data есть другие фильтры обработчика или роутера - проверяются при совпадении
+        self.checked = checked
+
+    def describe(self) -> str:
+        callback = self.handler.callback
+        name = f"{callback.__module__}.{callback.__name__}"
+        return f"{name} (F.data {self.kind} {self.literal!r})" if self.kind else name
+
+    async def check(self, event: CallbackQuery, data: Dict[str, Any]) -> Tuple[bool, Dict[str, Any]]:
+        """Фильтры роутера и обработчика, как в Router.propagate_event и TelegramEventObserver.trigger"""
+        passed, kwargs = await self.observer._handler.check(event, **data)
+        if not passed:
+            return False, data
+        return await self.handler.check(event, **kwargs)
+
+class _Node:
+    __slots__ = ("children", "exact", "prefix")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "_Node"] = {}
+        # Обработчики с одним и тем же фильтром F.data - по порядку (различаются другими фильтрами)
+        self.exact: List[_Entry] = []
+        self.prefix: List[_Entry] = []
+
+def _parse_magic(event_filter: Any) -> Optional[Tuple[str, str]]:
+    magic = getattr(event_filter, "magic", None)
+    if magic is None:
+        return None
+    ops = magic._operations
+    if not ops or not isinstance(ops[0], GetAttributeOperation) or ops[0].name != "data":
+        return None
+    if len(ops) == 2 and isinstance(ops[1], ComparatorOperation) and ops[1].comparator.__name__ == "eq":
+        if isinstance(ops[1].right, str):
+            return EXACT, ops[1].right
+    if (len(ops) == 3 and isinstance(ops[1], GetAttributeOperation) and ops[1].name == "startswith"
+            and isinstance(ops[2], CallOperation) and len(ops[2].args) == 1 and not ops[2].kwargs
+            and isinstance(ops[2].args[0], str)):
+        return PREFIX, ops[2].args[0]
+    return None
+
+def parse_data_filter(handler: HandlerObject) -> Optional[Tuple[str, str, bool]]:
+    """(вид, строка, есть ли другие фильтры) для обработчика с фильтром
+    F.data == "..." или F.data.startswith("...")"""
+    filters = handler.filters or ()
+    for event_filter in filters:
+        parsed = _parse_magic(event_filter)
+        if parsed is not None:
+            return parsed[0], parsed[1], len(filters) > 1
+    return None
+
+class CallbackTrieMiddleware(BaseMiddleware):
+    """Outer middleware на dp.callback_query: находит обработчик по дереву префиксов"""
+
+    def __init__(self) -> None:
+        self._root = _Node()
+        self.entries: List[_Entry] = []
+        self.opaque: List[_Entry] = []
+        self.duplicates: List[Tuple[_Entry, _Entry]] = []
+        self.shadowed: List[Tuple[_Entry, _Entry]] = []
+        self.resolved = 0
+        self.fallbacks = 0
+        self.filter_checks = 0
+
+    # ==== Сборка =============================================================
+
+    @classmethod
+    def build(cls, dp: Dispatcher) -> "CallbackTrieMiddleware":
+        """Дерево по всем роутерам диспетчера (вызывать после include_router)"""
+        trie = cls()
+        order = 0
+        # chain_tail обходит роутеры в том же порядке, в каком их проверяет aiogram
+        for router in dp.chain_tail:
+            observer = router.callback_query
+            root_filtered = bool(observer._handler.filters)
+            for handler in observer.handlers:
+                parsed = parse_data_filter(handler)
+                if parsed is None:
+                    trie.opaque.append(_Entry(order, None, None, router, observer, handler, True))
+                else:
+                    kind, literal, extra = parsed
+                    trie._add(_Entry(order, kind, literal, router, observer, handler, extra or root_filtered))
+                order += 1
+        trie._find_shadowed()
+        return trie
+
+    def _add(self, entry: _Entry) -> None:
+        self.entries.append(entry)
+        node = self._root
+        for char in entry.literal:
+            node = node.children.setdefault(char, _Node())
+        slot = node.exact if entry.kind == EXACT else node.prefix
+        # До обработчика не дойдёт очередь, если раньше стоит такой же фильтр без других условий
+        existing = next((other for other in slot if not other.checked), None)
+        if existing is not None:
+            self.duplicates.append((existing, entry))
+            return
+        slot.append(entry)
+
+    def _find_shadowed(self) -> None:
+        """Обработчик затенён, если раньше него стоит префикс, который его покрывает"""
+        for entry in self.entries:
+            for candidate in self._candidates(entry.literal):
+                if candidate.kind != PREFIX or candidate.order >= entry.order or candidate.checked:
+                    continue
+                if candidate.kind == entry.kind and candidate.literal == entry.literal:
+                    continue  # тот же фильтр - дубль уже в self.duplicates
+                self.shadowed.append((candidate, entry))
+                break
+
+    def report(self) -> None:
+        checked = sum(1 for entry in self.entries if entry.checked)
+        logging.info(
+            f"Маршрутизация кнопок: обработчиков в дереве - {len(self.entries)}"
+            f" (с дополнительными фильтрами - {checked}), вне дерева - {len(self.opaque)}"
+        )
+        for entry in self.opaque:
+            later = sum(1 for other in self.entries if other.order > entry.order)
+            logging.warning(
+                f"⚠️ Обработчик кнопки вне дерева: {entry.describe()} - нет фильтра F.data == / startswith, "
+                f"его фильтры проверяются при каждом нажатии, ведущем к одному из {later} обработчиков после него"
+            )
+        for first, later in self.duplicates:
+            logging.warning(f"⚠️ Дубль обработчика кнопки: {later.describe()} повторяет {first.describe()} и не вызывается")
+        for first, later in self.shadowed:
+            logging.warning(f"⚠️ Затенённый обработчик кнопки: {later.describe()} перекрыт {first.describe()}")
+
+    # ==== Поиск ==============================================================
+
+    def _candidates(self, data: str):
+        """Все обработчики, подходящие к data: префиксы по пути и точное совпадение в конце"""
+        node = self._root
+        yield from node.prefix
+        for char in data:
+            node = node.children.get(char)
+            if node is None:
+                return
+            yield from node.prefix
+        yield from node.exact
+
+    def plan(self, data: str) -> List[_Entry]:
+        """Обработчики, которые aiogram проверил бы для data, в его порядке"""
+        return sorted([*self._candidates(data), *self.opaque], key=lambda entry: entry.order)
+
+    async def __call__(
+        self,
+        handler: Callable[[CallbackQuery, Dict[str, Any]], Awaitable[Any]],
+        event: CallbackQuery,
+        data: Dict[str, Any],
+    ) -> Any:
+        if event.data is None:
+            self.fallbacks += 1
+            return await handler(event, data)
+
+        # Первый подходящий обработчик; без дополнительных фильтров подходит сразу
+        for entry in self.plan(event.data):
+            kwargs = dict(data, event_router=entry.router, handler=entry.handler)
+            if entry.checked:
+                self.filter_checks += 1
+                passed, kwargs = await entry.check(event, kwargs)
+                if not passed:
+                    continue
+            # Внутренние middleware роутеров - как в TelegramEventObserver.trigger
+            wrapped = entry.observer.outer_middleware.wrap_middlewares(
+                entry.observer._resolve_middlewares(),
+                entry.handler.call,
+            )
+            try:
+                result = await wrapped(event, kwargs)
+            except SkipHandler:
+                continue
+            self.resolved += 1
+            return result
+        self.resolved += 1
+        return UNHANDLED
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "handlers": len(self.entries),
+            "duplicates": len(self.duplicates),
+            "shadowed": len(self.shadowed),
+            "outside_trie": len(self.opaque),
+            "resolved": self.resolved,
+            "fallbacks": self.fallbacks,
+            "filter_checks": self.filter_checks,
+        }
@@ -0,0 +1,90 @@
+# coding: utf-8
+"""
+Последовательная обработка обновлений одного чата.
+Обработчики вида state.get_data() -> update_data() не защищены от гонок:
+два быстрых сообщения одного пользователя выполнялись параллельно.
+Middleware держит очередь на каждый чат: обновления одного чата идут
+строго по порядку, разные чаты - параллельно.
+Общее число одновременно обрабатываемых обновлений ограничено.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+class ChatOrderMiddleware(BaseMiddleware):
+    """Outer middleware на dp.update: очередь на чат + лимит одновременных обновлений"""
+
+    def __init__(self, max_in_flight: int = 100, warn_depth: int = 10) -> None:
+        self.max_in_flight = max_in_flight
+        self.warn_depth = warn_depth
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._depth: Dict[int, int] = {}
+        # Семафор создаётся в работающем event loop (Python 3.9 привязывает его к loop)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.max_depth_seen = 0
+        self.waited = 0
+        self.processed = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        chat = data.get("event_chat")
+        user = data.get("event_from_user")
+        key = chat.id if chat else (user.id if user else None)
+        if key is None:
+            # Обновления без чата и пользователя - без очереди
+            return await self._run(handler, event, data)
+
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        depth = self._depth[key] = self._depth.get(key, 0) + 1
+        if depth > 1:
+            self.waited += 1
+        if depth > self.max_depth_seen:
+            self.max_depth_seen = depth
+        if depth == self.warn_depth:
+            logging.warning(f"⚠️ Очередь чата {key}: {depth} обновлений")
+
+        try:
+            async with lock:
+                return await self._run(handler, event, data)
+        finally:
+            self._depth[key] -= 1
+            if not self._depth[key]:
+                # Очередь пуста - освобождаем память
+                del self._depth[key]
+                del self._locks[key]
+
+    async def _run(self, handler, event, data) -> Any:
+        # Слот берём уже после своей очереди - ожидающий чат не занимает слот
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                return await handler(event, data)
+            finally:
+                self.in_flight -= 1
+                self.processed += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Метрики очередей"""
+        return {
+            "chats_queued": len(self._depth),
+            "updates_queued": sum(self._depth.values()),
+            "max_chat_depth": max(self._depth.values(), default=0),
+            "max_chat_depth_seen": self.max_depth_seen,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "waited": self.waited,
+            "processed": self.processed,
+        }
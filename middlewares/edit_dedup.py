@@ -0,0 +1,126 @@
+# coding: utf-8
+"""
+Пропуск редактирований, которые ничего не меняют.
+Многие обработчики перерисовывают сообщение тем же текстом (навигация по
+календарю, повторное открытие профиля, обновление карточки) - Telegram
+отвечает "message is not modified", а обработчик глотает исключение.
+
+Middleware сессии бота запоминает для (chat_id, message_id) хеш текста
+(или подписи) и кнопок последнего отправленного/отредактированного
+сообщения. Если редактирование повторяет показанное, запрос в Telegram
+не отправляется, а обработчик получает сохранённый Message.
+"""
+import hashlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import (
+    DeleteMessage,
+    EditMessageCaption,
+    EditMessageReplyMarkup,
+    EditMessageText,
+    SendMessage,
+    SendPhoto,
+    TelegramMethod,
+)
+from aiogram.types import Message
+
+def _digest(*parts: Any) -> str:
+    digest = hashlib.sha1()
+    for part in parts:
+        if hasattr(part, "model_dump_json"):
+            part = part.model_dump_json(exclude_none=True)
+        digest.update(repr(part).encode("utf-8"))
+    return digest.hexdigest()
+
+class _Shown:
+    """Что сейчас показано в сообщении"""
+    __slots__ = ("content", "markup", "result")
+
+    def __init__(self, content: Optional[str], markup: str, result: Any) -> None:
+        self.content = content
+        self.markup = markup
+        self.result = result
+
+class EditDedupMiddleware:
+    """Middleware сессии бота: кеш показанных сообщений по (chat_id, message_id)"""
+
+    def __init__(self, max_size: int = 10000) -> None:
+        self.max_size = max_size
+        self._shown: "OrderedDict[Tuple[Any, int], _Shown]" = OrderedDict()
+        self._sessions = set()
+        self.saved_calls = 0
+        self.not_modified = 0
+
+    async def install(self, bot: Bot) -> None:
+        """Регистрирует middleware в сессии бота (один раз; подходит для dp.startup)"""
+        if id(bot.session) not in self._sessions:
+            self._sessions.add(id(bot.session))
+            bot.session.middleware(self)
+
+    @staticmethod
+    def _content(method: TelegramMethod) -> Optional[str]:
+        """Хеш текста/подписи запроса; None - запрос не меняет текст"""
+        if isinstance(method, (SendMessage, EditMessageText)):
+            return _digest("text", method.text, method.parse_mode, method.entities)
+        if isinstance(method, (SendPhoto, EditMessageCaption)):
+            return _digest("caption", method.caption, method.parse_mode, method.caption_entities)
+        return None
+
+    def _remember(self, key: Tuple[Any, int], content: Optional[str], markup: str, result: Any) -> None:
+        shown = self._shown.get(key)
+        if shown is not None and content is None:
+            content = shown.content
+        self._shown[key] = _Shown(content, markup, result)
+        self._shown.move_to_end(key)
+        while len(self._shown) > self.max_size:
+            self._shown.popitem(last=False)
+
+    async def __call__(self, make_request, bot: Bot, method: TelegramMethod) -> Any:
+        if isinstance(method, DeleteMessage):
+            self._shown.pop((method.chat_id, method.message_id), None)
+            return await make_request(bot, method)
+
+        if isinstance(method, (SendMessage, SendPhoto)):
+            result = await make_request(bot, method)
+            if isinstance(result, Message):
+                self._remember((method.chat_id, result.message_id), self._content(method),
+                               _digest(method.reply_markup), result)
+            return result
+
+        if not isinstance(method, (EditMessageText, EditMessageCaption, EditMessageReplyMarkup)):
+            return await make_request(bot, method)
+        if method.inline_message_id or method.chat_id is None or method.message_id is None:
+            return await make_request(bot, method)
+
+        key = (method.chat_id, method.message_id)
+        content = self._content(method)
+        markup = _digest(method.reply_markup)
+        shown = self._shown.get(key)
+        if shown is not None and shown.markup == markup and (content is None or shown.content == content):
+            self.saved_calls += 1
+            self._shown.move_to_end(key)
+            if isinstance(shown.result, Message):
+                return shown.result
+            # Сообщения нет в кеше - отвечаем так же, как ответил бы Telegram
+            raise TelegramBadRequest(method=method, message="Bad Request: message is not modified")
+
+        try:
+            result = await make_request(bot, method)
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                # Telegram подтвердил, что показано именно это - запомним
+                self.not_modified += 1
+                self._remember(key, content, markup, None)
+            raise
+        self._remember(key, content, markup, result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cached_messages": len(self._shown),
+            "saved_calls": self.saved_calls,
+            "not_modified_errors": self.not_modified,
+        }
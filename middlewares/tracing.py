@@ -0,0 +1,57 @@
+# coding: utf-8
+"""
+Спаны трассировки (tracing.py) на уровне обновлений и обработчиков.
+UpdateTracingMiddleware - outer middleware dp.update: корневой спан "update".
+HandlerTracingMiddleware - inner middleware dp.message / dp.callback_query:
+спан handler.<функция> с роутером и префиксом callback_data.
+"""
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, TelegramObject, Update
+
+from callbacks import callback_prefix
+from tracing import Tracer
+
+class UpdateTracingMiddleware(BaseMiddleware):
+    """Outer middleware: трасса на обновление"""
+
+    def __init__(self, tracer: Tracer) -> None:
+        self.tracer = tracer
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+        user = data.get("event_from_user")
+        with self.tracer.trace("update", **{
+            "telegram.update_id": event.update_id,
+            "telegram.update_type": event.event_type,
+            "telegram.user_id": user.id if user else None,
+        }):
+            return await handler(event, data)
+
+class HandlerTracingMiddleware(BaseMiddleware):
+    """Inner middleware: спан выбранного обработчика"""
+
+    def __init__(self, tracer: Tracer) -> None:
+        self.tracer = tracer
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        callback = getattr(data.get("handler"), "callback", None)
+        router = data.get("event_router")
+        with self.tracer.span(f"handler.{getattr(callback, '__name__', '-')}", **{
+            "code.namespace": getattr(callback, "__module__", None),
+            "aiogram.router": router.name if router is not None else None,
+            "telegram.callback_prefix": callback_prefix(event.data) if isinstance(event, CallbackQuery) else None,
+        }):
+            return await handler(event, data)
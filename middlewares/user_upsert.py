@@ -0,0 +1,137 @@
+# coding: utf-8
+"""
+Сохранение пользователей без записи в БД на каждое обновление.
+Раньше database.create_user (SELECT, затем UPDATE или INSERT и commit)
+выполнялся на каждый /start и каждый отклик, даже если ничего не менялось.
+
+Middleware помнит для user_id его username и is_active:
+- новый пользователь записывается сразу (на него ссылаются заявки и JOIN users)
+- смена username откладывается и записывается пачкой раз в flush_interval
+- остальные обновления в БД не пишут
+
+Удалённый аккаунт (is_active = 0) не восстанавливается сам - только /start
+(см. activate). После delete_user нужно вызвать forget.
+"""
+import asyncio
+import contextvars
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+import database
+
+class UserUpsertMiddleware(BaseMiddleware):
+    """Outer middleware на dp.update: кеш (username, is_active) + отложенная запись username"""
+
+    def __init__(self, flush_interval: float = 5.0, max_size: int = 100000) -> None:
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self._seen: "OrderedDict[int, tuple]" = OrderedDict()  # user_id -> (username, is_active)
+        self._pending: Dict[int, Optional[str]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.created = 0
+        self.loaded = 0
+        self.renamed = 0
+        self.flushes = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is not None and not user.is_bot:
+            self.touch(user.id, user.username)
+        return await handler(event, data)
+
+    def _remember(self, user_id: int, username: Optional[str], is_active: int) -> None:
+        self._seen[user_id] = (username, is_active)
+        self._seen.move_to_end(user_id)
+        while len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+
+    def touch(self, user_id: int, username: Optional[str]) -> None:
+        """Пользователь прислал обновление - при необходимости сохраняем его"""
+        cached = self._seen.get(user_id)
+        if cached is None:
+            user = database.get_user_by_id(user_id)
+            if user is None:
+                database.create_user(user_id, username)
+                self.created += 1
+                self._remember(user_id, username, 1)
+                return
+            self.loaded += 1
+            cached = (user["tg_username"], user["is_active"])
+
+        known_username, is_active = cached
+        if is_active and known_username != username:
+            self._pending[user_id] = username
+            self._schedule_flush()
+        self._remember(user_id, username if is_active else known_username, is_active)
+
+    def activate(self, user_id: int, username: Optional[str]) -> bool:
+        """/start: восстанавливает удалённый аккаунт. True - аккаунт был удалён"""
+        cached = self._seen.get(user_id)
+        if cached is not None and cached[1]:
+            return False
+        user = database.get_user_by_id(user_id)
+        if user is not None and user["is_active"]:
+            self._remember(user_id, user["tg_username"], 1)
+            return False
+        database.create_user(user_id, username)
+        self._pending.pop(user_id, None)
+        self._remember(user_id, username, 1)
+        return True
+
+    def forget(self, user_id: int) -> None:
+        """Аккаунт удалён - следующее обновление перечитает пользователя из БД"""
+        self._seen.pop(user_id, None)
+        self._pending.pop(user_id, None)
+
+    def _schedule_flush(self) -> None:
+        if self._timer is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        # Без контекста обновления, запустившего таймер: пачка username - не его работа
+        self._timer = loop.call_later(self.flush_interval, self.flush, context=contextvars.Context())
+
+    def flush(self) -> None:
+        """Записывает накопленные смены username одной транзакцией"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            database.update_usernames(list(pending.items()))
+        except Exception as e:
+            logging.error(f"❌ Не удалось сохранить username ({len(pending)} польз.): {e}")
+            # Повторим позже, если за это время не пришло новое значение
+            for user_id, username in pending.items():
+                self._pending.setdefault(user_id, username)
+            self._schedule_flush()
+            return
+        self.renamed += len(pending)
+        self.flushes += 1
+
+    async def stop(self) -> None:
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cached_users": len(self._seen),
+            "pending_writes": len(self._pending),
+            "created": self.created,
+            "loaded": self.loaded,
+            "renamed": self.renamed,
+            "flushes": self.flushes,
+        }
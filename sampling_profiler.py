@@ -0,0 +1,286 @@
+# coding: utf-8
+"""
+Сэмплирующий профайлер: раз в interval поток снимает стек потока цикла событий
+и копит одинаковые стеки. Результат - файлы в формате collapsed stacks
+("кадр;кадр;кадр количество"), которые открывают flamegraph.pl и speedscope.
+Файл на обработчик: <обработчик>.folded (обработчик определяется по стеку,
+как в loop_watchdog.attribute; стек без кода бота - idle).
+
+Режимы (включаются командой /profile администратора, handlers/admin.py):
+- окно: все сэмплы за N секунд -> PROFILE_DIR/<время>-window/
+- медленные обновления: сэмплы каждого обновления копятся отдельно, и если оно
+  попало в самые медленные PROFILE_SLOW_PERCENT % - дописываются в PROFILE_DIR/slow/
+  (файлы пишет поток-сэмплер, цикл событий на запись не ждёт). Пока обновление
+  ждёт (Bot API, блокировки), его кадров нет в стеке потока цикла: это время
+  пишется синтетическим кадром <await> (стек "update:<тип>;<await>"), иначе
+  самые медленные - ждущие - обновления не попали бы в профиль
+Когда режимы выключены, middleware только передаёт обновление дальше.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+import config
+from loop_watchdog import attribute
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Сколько последних обновлений учитывать при поиске самых медленных
+SLOW_HISTORY = 1000
+# Меньше обновлений - порог медленных ещё не определён
+SLOW_MIN_UPDATES = 20
+# Кадр для времени, когда обновление ждало и не было в стеке
+AWAIT_FRAME = "<await>"
+
+class _FrameInfo:
+    """Кадр стека в виде, нужном attribute() (filename, name)"""
+    __slots__ = ("filename", "name")
+
+    def __init__(self, filename: str, name: str) -> None:
+        self.filename = filename
+        self.name = name
+
+def _label(filename: str, name: str) -> str:
+    if filename.startswith(_ROOT + os.sep):
+        module = os.path.splitext(os.path.relpath(filename, _ROOT))[0].replace(os.sep, ".")
+    else:
+        module = os.path.splitext(os.path.basename(filename))[0]
+    return f"{module}:{name}"
+
+def _file_name(handler: str) -> str:
+    return "".join(c if c.isalnum() or c in "._-" else "_" for c in handler) + ".folded"
+
+class _UpdateSamples:
+    __slots__ = ("update_id", "kind", "started", "samples")
+
+    def __init__(self, update_id: int, kind: str) -> None:
+        self.update_id = update_id
+        self.kind = kind
+        self.started = time.perf_counter()
+        self.samples: "Counter[Tuple[str, str]]" = Counter()
+
+class SamplingProfiler(BaseMiddleware):
+    """Outer middleware обновлений + поток-сэмплер"""
+
+    def __init__(self, output_dir: str = "profiles", interval_ms: float = 5.0, slow_percent: float = 1.0) -> None:
+        self.output_dir = output_dir
+        self.interval = interval_ms / 1000
+        self.slow_percent = slow_percent
+        self.window_until = 0.0
+        self.slow_mode = False
+        # (обработчик, стек) -> число сэмплов
+        self._window: "Counter[Tuple[str, str]]" = Counter()
+        self._slow: "Counter[Tuple[str, str]]" = Counter()
+        # Обработчики, чьи файлы в slow/ нужно переписать
+        self._slow_dirty: set = set()
+        # id кадра корутины middleware -> сэмплы этого обновления
+        self._updates: Dict[int, _UpdateSamples] = {}
+        self._durations: deque = deque(maxlen=SLOW_HISTORY)
+        self._loop_thread: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.samples = 0
+        self.slow_updates = 0
+        self.last_output: Optional[str] = None
+
+    # ---- Управление ---------------------------------------------------------
+
+    @property
+    def active(self) -> bool:
+        return self.slow_mode or self.window_until > time.monotonic()
+
+    def start_window(self, seconds: float) -> None:
+        with self._lock:
+            self._window.clear()
+        self.window_until = time.monotonic() + seconds
+        self._ensure_thread()
+        asyncio.get_running_loop().call_later(seconds, self._finish_window)
+
+    def set_slow_mode(self, enabled: bool) -> None:
+        self.slow_mode = enabled
+        if enabled:
+            self._ensure_thread()
+
+    def stop_all(self) -> Optional[str]:
+        """Выключает оба режима; возвращает папку с результатом окна, если оно шло"""
+        self.slow_mode = False
+        if self.window_until:
+            self.window_until = 0.0
+            return self._write_window()
+        return None
+
+    def status(self) -> str:
+        lines = []
+        left = self.window_until - time.monotonic()
+        lines.append(f"Окно: идёт, осталось {left:.0f} с" if left > 0 else "Окно: выключено")
+        lines.append(f"Медленные обновления: {'включено' if self.slow_mode else 'выключено'}"
+                     f" (сохранено: {self.slow_updates})")
+        lines.append(f"Сэмплов: {self.samples}, интервал {self.interval * 1000:.0f} мс")
+        if self.last_output:
+            lines.append(f"Последний результат: {self.last_output}")
+        return "\n".join(lines)
+
+    async def start(self) -> None:
+        """dp.startup: запоминаем поток цикла событий"""
+        self._loop_thread = threading.get_ident()
+        if self.slow_mode:
+            self._ensure_thread()
+
+    async def stop(self) -> None:
+        self.stop_all()
+
+    # ---- Сэмплирование ------------------------------------------------------
+
+    def _ensure_thread(self) -> None:
+        if self._loop_thread is None:
+            self._loop_thread = threading.get_ident()
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._sample_loop, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def _sample_loop(self) -> None:
+        while self.active:
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is not None:
+                self._sample(frame)
+            self._flush_slow()
+            time.sleep(self.interval)
+        self._flush_slow()
+
+    def _sample(self, frame) -> None:
+        frames: List[_FrameInfo] = []
+        owner = None
+        while frame is not None:
+            code = frame.f_code
+            frames.append(_FrameInfo(code.co_filename, code.co_name))
+            if owner is None:
+                owner = self._updates.get(id(frame))
+            frame = frame.f_back
+        frames.reverse()
+
+        handler, _ = attribute(frames)
+        if handler == "-":
+            handler = "idle" if owner is None else "other"
+        stack = ";".join(_label(f.filename, f.name) for f in frames)
+        key = (handler, stack)
+        with self._lock:
+            self.samples += 1
+            if self.window_until > time.monotonic():
+                self._window[key] += 1
+            if owner is not None:
+                owner.samples[key] += 1
+
+    # ---- Обновления ---------------------------------------------------------
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not self.slow_mode:
+            return await handler(event, data)
+
+        # Кадр этой корутины есть в стеке, пока обновление обрабатывается
+        frame_id = id(sys._getframe())
+        if isinstance(event, Update):
+            update = _UpdateSamples(event.update_id, event.event_type)
+        else:
+            update = _UpdateSamples(0, type(event).__name__)
+        self._updates[frame_id] = update
+        try:
+            return await handler(event, data)
+        finally:
+            self._updates.pop(frame_id, None)
+            self._finish_update(update)
+
+    def _finish_update(self, update: _UpdateSamples) -> None:
+        duration = time.perf_counter() - update.started
+        self._durations.append(duration)
+        if len(self._durations) < SLOW_MIN_UPDATES:
+            return
+        ordered = sorted(self._durations)
+        threshold = ordered[min(len(ordered) - 1, int(len(ordered) * (100 - self.slow_percent) / 100))]
+        if duration < threshold:
+            return
+        with self._lock:
+            # Время без сэмплов - ожидание; в файл обработчика, который чаще всего был в стеке
+            waited = round(duration / self.interval) - sum(update.samples.values())
+            if waited > 0:
+                handlers = Counter()
+                for (handler, _), count in update.samples.items():
+                    handlers[handler] += count
+                handler = handlers.most_common(1)[0][0] if handlers else "await"
+                update.samples[(handler, f"update:{update.kind};{AWAIT_FRAME}")] += waited
+            self._slow.update(update.samples)
+            self._slow_dirty.update(handler for handler, _ in update.samples)
+        self.slow_updates += 1
+        # Режим уже выключен - поток запишет файлы и завершится
+        self._ensure_thread()
+        logging.info(f"🔥 Медленное обновление {update.update_id}: {duration * 1000:.0f} мс, "
+                     f"сэмплы в {os.path.join(self.output_dir, 'slow')}")
+
+    # ---- Запись -------------------------------------------------------------
+
+    def _flush_slow(self) -> None:
+        """Поток-сэмплер: переписывает в slow/ файлы обработчиков из новых медленных обновлений"""
+        with self._lock:
+            if not self._slow_dirty:
+                return
+            handlers, self._slow_dirty = self._slow_dirty, set()
+        try:
+            self._write(os.path.join(self.output_dir, "slow"), self._slow, handlers)
+        except OSError as e:
+            logging.warning(f"⚠️ Профайлер: не удалось записать медленные обновления: {e}")
+
+    def _finish_window(self) -> None:
+        if self.window_until and self.window_until <= time.monotonic():
+            self.window_until = 0.0
+            self._write_window()
+
+    def _write_window(self) -> Optional[str]:
+        with self._lock:
+            samples = Counter(self._window)
+            self._window.clear()
+        if not samples:
+            return None
+        directory = os.path.join(self.output_dir, datetime.now().strftime("%Y%m%d-%H%M%S") + "-window")
+        self._write(directory, samples)
+        logging.info(f"🔥 Профиль за окно: {directory}")
+        return directory
+
+    def _write(self, directory: str, samples: "Counter[Tuple[str, str]]", only: Optional[set] = None) -> None:
+        by_handler: Dict[str, List[Tuple[str, int]]] = {}
+        with self._lock:
+            for (handler, stack), count in samples.items():
+                if only is None or handler in only:
+                    by_handler.setdefault(handler, []).append((stack, count))
+        os.makedirs(directory, exist_ok=True)
+        for handler, stacks in by_handler.items():
+            with open(os.path.join(directory, _file_name(handler)), "w", encoding="utf-8") as f:
+                for stack, count in sorted(stacks):
+                    f.write(f"{stack} {count}\n")
+        self.last_output = directory
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "samples": self.samples,
+            "slow_updates": self.slow_updates,
+            "window_active": int(self.window_until > time.monotonic()),
+            "slow_mode": int(self.slow_mode),
+        }
+
+def create_sampling_profiler() -> SamplingProfiler:
+    """Профайлер с настройками из config"""
+    profiler = SamplingProfiler(config.PROFILE_DIR, config.PROFILE_INTERVAL_MS, config.PROFILE_SLOW_PERCENT)
+    profiler.slow_mode = config.PROFILE_SLOW_UPDATES
+    return profiler
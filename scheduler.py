@@ -0,0 +1,249 @@
+# coding: utf-8
+"""
+Планировщик фоновых заданий: обслуживание БД и события по времени
+(maintenance.py), не мешая обработке обновлений.
+
+- Задания хранятся в таблице scheduled_jobs: тип, payload (JSON), время запуска.
+  Задание выполняется хотя бы один раз: выполненным оно помечается только после
+  успешного завершения, а задание упавшего процесса (locked_until в прошлом)
+  снова попадает в очередь - обработчики должны допускать повторный запуск.
+- Ближайшие задания - в куче (heapq) по времени запуска; раз в poll_interval
+  из БД подгружаются задания, добавленные другими процессами (кластер, вебхук).
+  Забирает задание тот процесс, чей UPDATE ... status = 'running' прошёл первым.
+- Повторяющиеся задания (every): интервал или ежедневно в "ЧЧ:ММ", со случайным
+  сдвигом jitter; одна строка на задание (job_key "every:<тип>"), после
+  выполнения она переносится на следующий запуск.
+- Не больше concurrency одновременных заданий каждого типа; запросы к БД -
+  в потоке (asyncio.to_thread), цикл событий не блокируется.
+- Ошибка - повтор через retry_delay * 2^(попытка - 1); после max_attempts
+  разовое задание помечается failed, повторяющееся ждёт следующего запуска.
+"""
+import asyncio
+import heapq
+import logging
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from aiogram import Bot
+
+import config
+import database
+
+JobHandler = Callable[[Bot, Dict[str, Any]], Awaitable[Any]]
+
+def next_daily_run(at: str, now: float) -> float:
+    """Ближайший момент после now, когда на часах at ("ЧЧ:ММ", местное время)"""
+    hour, minute = (int(part) for part in at.split(":"))
+    current = datetime.fromtimestamp(now)
+    run = current.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if run.timestamp() <= now:
+        run += timedelta(days=1)
+    return run.timestamp()
+
+class JobType:
+    """Обработчик типа заданий и его ограничения"""
+
+    def __init__(self, handler: JobHandler, concurrency: int, timeout: float) -> None:
+        self.handler = handler
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.running = 0
+        # Повторяющееся задание: интервал, секунды, или время суток "ЧЧ:ММ"
+        self.interval: Optional[float] = None
+        self.at: Optional[str] = None
+        self.jitter = 0.0
+
+    def next_run(self, now: float) -> float:
+        if self.at:
+            run_at = next_daily_run(self.at, now)
+        else:
+            run_at = now + self.interval
+        return run_at + random.uniform(0, self.jitter)
+
+class Scheduler:
+    """Очередь заданий по времени с хранением в SQLite"""
+
+    def __init__(
+        self,
+        poll_interval: float = 30.0,
+        retry_delay: float = 60.0,
+        max_attempts: int = 5,
+    ) -> None:
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self._types: Dict[str, JobType] = {}
+        self._heap: List[Tuple[float, int, str]] = []
+        self._queued: Set[int] = set()
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._bot: Optional[Bot] = None
+        self.completed: Counter = Counter()
+        self.failed: Counter = Counter()
+        self.retried: Counter = Counter()
+
+    # ---- Регистрация ---------------------------------------------------------
+
+    def register(self, job_type: str, handler: JobHandler, concurrency: int = 1, timeout: float = 600) -> None:
+        """handler(bot, payload) выполняет задание job_type; не больше concurrency одновременно"""
+        self._types[job_type] = JobType(handler, max(1, concurrency), timeout)
+
+    def every(self, job_type: str, interval: Optional[float] = None, at: Optional[str] = None,
+              jitter: float = 0) -> None:
+        """Повторять зарегистрированное задание каждые interval секунд или ежедневно в at ("ЧЧ:ММ")"""
+        if (interval is None) == (at is None):
+            raise ValueError("нужен либо interval, либо at")
+        spec = self._types[job_type]
+        spec.interval, spec.at, spec.jitter = interval, at, jitter
+
+    async def schedule(self, job_type: str, run_at: float, payload: Optional[Dict[str, Any]] = None,
+                       job_key: Optional[str] = None) -> int:
+        """Разовое задание на момент run_at (time.time()). Задание с тем же job_key не дублируется"""
+        if job_type not in self._types:
+            raise KeyError(f"неизвестный тип задания: {job_type}")
+        job_id, due = await asyncio.to_thread(database.add_scheduled_job, job_type, run_at, payload, job_key)
+        if due <= time.time() + self.poll_interval:
+            self._push(job_id, job_type, due)
+        return job_id
+
+    # ---- Очередь ---------------------------------------------------------
+
+    def _push(self, job_id: int, job_type: str, run_at: float) -> None:
+        if job_id in self._queued or job_id in self._tasks:
+            return
+        self._queued.add(job_id)
+        heapq.heappush(self._heap, (run_at, job_id, job_type))
+        # Новое задание раньше ближайшего - циклу нужно проснуться раньше
+        if self._wakeup is not None and self._heap[0][1] == job_id:
+            self._wakeup.set()
+
+    async def _poll(self) -> None:
+        now = time.time()
+        jobs = await asyncio.to_thread(database.get_due_jobs, now + self.poll_interval, now)
+        for job in jobs:
+            if job["job_type"] in self._types:
+                self._push(job["id"], job["job_type"], job["run_at"])
+
+    async def _run_loop(self) -> None:
+        next_poll = 0.0
+        while True:
+            now = time.time()
+            if now >= next_poll:
+                try:
+                    await self._poll()
+                except Exception as e:
+                    logging.error(f"❌ Планировщик: не удалось прочитать задания: {e}")
+                next_poll = now + self.poll_interval
+            while self._heap and self._heap[0][0] <= time.time():
+                _, job_id, job_type = heapq.heappop(self._heap)
+                self._queued.discard(job_id)
+                task = asyncio.create_task(self._run(job_id, job_type))
+                self._tasks[job_id] = task
+                task.add_done_callback(lambda _, job_id=job_id: self._tasks.pop(job_id, None))
+            wait = next_poll - time.time()
+            if self._heap:
+                wait = min(wait, self._heap[0][0] - time.time())
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(wait, 0.01))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(self, job_id: int, job_type: str) -> None:
+        spec = self._types[job_type]
+        if spec.semaphore is None:
+            spec.semaphore = asyncio.Semaphore(spec.concurrency)
+        async with spec.semaphore:
+            # Запас к таймауту: задание не считается зависшим, пока его могут выполнять
+            job = await asyncio.to_thread(database.claim_scheduled_job, job_id, time.time(), spec.timeout + 60)
+            if job is None:
+                return
+            spec.running += 1
+            try:
+                await asyncio.wait_for(spec.handler(self._bot, job["payload"]), timeout=spec.timeout)
+            except asyncio.CancelledError:
+                await asyncio.to_thread(database.release_scheduled_job, job_id)
+                raise
+            except Exception as e:
+                await self._failed(job, spec, e)
+            else:
+                self.completed[job_type] += 1
+                next_run = spec.next_run(time.time()) if job["job_key"] == f"every:{job_type}" else None
+                await asyncio.to_thread(database.finish_scheduled_job, job_id, next_run)
+            finally:
+                spec.running -= 1
+
+    async def _failed(self, job: Dict[str, Any], spec: JobType, error: Exception) -> None:
+        job_type, attempts = job["job_type"], job["attempts"]
+        error_text = f"{type(error).__name__}: {error}"
+        periodic = job["job_key"] == f"every:{job_type}"
+        now = time.time()
+        if attempts < self.max_attempts:
+            self.retried[job_type] += 1
+            run_at = now + self.retry_delay * 2 ** (attempts - 1)
+            if periodic:
+                run_at = min(run_at, spec.next_run(now))
+            logging.warning(f"⚠️ Задание {job_type} #{job['id']} (попытка {attempts}): {error_text}")
+            await asyncio.to_thread(database.retry_scheduled_job, job["id"], run_at, error_text)
+            return
+        self.failed[job_type] += 1
+        logging.error(f"❌ Задание {job_type} #{job['id']} не выполнено за {attempts} попыток: {error_text}")
+        if periodic:
+            # Повторяющееся задание не выключается - ждёт следующего запуска
+            await asyncio.to_thread(database.finish_scheduled_job, job["id"], spec.next_run(now))
+        else:
+            await asyncio.to_thread(database.retry_scheduled_job, job["id"], now, error_text, True)
+
+    # ---- Запуск и остановка ------------------------------------------------
+
+    async def start(self, bot: Bot) -> None:
+        if self._loop_task is not None:
+            return
+        self._bot = bot
+        self._wakeup = asyncio.Event()
+        now = time.time()
+        for job_type, spec in self._types.items():
+            if spec.interval is None and spec.at is None:
+                continue
+            # Первый запуск интервального задания - сразу (со сдвигом), ежедневного - в ближайшее at.
+            # Строка уже есть в БД - её время запуска сохраняется между перезапусками
+            first_run = spec.next_run(now) if spec.at else now + random.uniform(0, spec.jitter)
+            await asyncio.to_thread(database.add_scheduled_job, job_type, first_run, None, f"every:{job_type}")
+        self._loop_task = asyncio.create_task(self._run_loop())
+        periodic = sum(1 for spec in self._types.values() if spec.interval or spec.at)
+        logging.info(f"⏰ Планировщик: типов заданий {len(self._types)}, повторяющихся {periodic}")
+
+    async def stop(self) -> None:
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+            self._loop_task = None
+        # Прерванные задания возвращаются в очередь и выполнятся после перезапуска
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._heap.clear()
+        self._queued.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": len(self._heap),
+            "running": {job_type: spec.running for job_type, spec in self._types.items()},
+            "completed": dict(self.completed),
+            "retried": dict(self.retried),
+            "failed": dict(self.failed),
+        }
+
+def create_scheduler() -> Scheduler:
+    """Планировщик с настройками из config"""
+    return Scheduler(
+        config.SCHEDULER_POLL_SEC,
+        config.SCHEDULER_RETRY_DELAY_SEC,
+        config.SCHEDULER_MAX_ATTEMPTS,
+    )
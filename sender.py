@@ -0,0 +1,76 @@
+# coding: utf-8
+"""
+Отправка сообщений с учётом лимитов Bot API.
+Telegram разрешает боту около 30 сообщений в секунду в целом и около
+одного в секунду в один чат. Массовые рассылки и обновления карточек
+идут через RateLimitedSender: запросы распределяются по времени, а при
+ответе 429 (TelegramRetryAfter) отправка ждёт retry_after и повторяется.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from aiogram.exceptions import TelegramRetryAfter
+
+import config
+
+class RateLimitedSender:
+    """Общий лимит запросов в секунду + пауза между запросами в один чат"""
+
+    def __init__(self, rate_per_sec: float = 25, chat_interval: float = 1.0, max_retries: int = 3) -> None:
+        self.interval = 1.0 / rate_per_sec if rate_per_sec > 0 else 0.0
+        self.chat_interval = chat_interval
+        self.max_retries = max_retries
+        self._next_slot = 0.0
+        self._chat_slots: Dict[int, float] = {}
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    def _reserve(self, chat_id: int) -> float:
+        """Резервирует время отправки. Возвращает, сколько секунд ждать"""
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot, self._chat_slots.get(chat_id, 0.0))
+        self._next_slot = slot + self.interval
+        self._chat_slots[chat_id] = slot + self.chat_interval
+        if len(self._chat_slots) > 10000:
+            # Чаты, в которые давно ничего не отправляли, больше не ограничены
+            self._chat_slots = {key: value for key, value in self._chat_slots.items() if value > now}
+        return slot - now
+
+    async def call(self, chat_id: int, make_request: Callable[[], Awaitable[Any]]) -> Any:
+        """Выполняет make_request() в свою очередь. Ошибки, кроме 429, пробрасываются"""
+        for attempt in range(self.max_retries + 1):
+            delay = self._reserve(chat_id)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                result = await make_request()
+                self.sent += 1
+                return result
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    self.failed += 1
+                    raise
+                self.retried += 1
+                logging.warning(f"⚠️ Лимит Bot API (чат {chat_id}), повтор через {e.retry_after} с")
+                # Сдвигаем общую очередь - остальные отправки тоже подождут
+                self._next_slot = max(self._next_slot, asyncio.get_running_loop().time() + e.retry_after)
+            except Exception:
+                self.failed += 1
+                raise
+
+    async def call_many(self, calls: List[Tuple[int, Callable[[], Awaitable[Any]]]]) -> List[Any]:
+        """Пачка запросов (chat_id, make_request) одновременно, каждый в свою очередь.
+        Возвращает результаты по порядку; ошибка запроса возвращается вместо результата"""
+        return await asyncio.gather(
+            *(self.call(chat_id, make_request) for chat_id, make_request in calls),
+            return_exceptions=True,
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {"sent": self.sent, "retried": self.retried, "failed": self.failed}
+
+def create_sender() -> RateLimitedSender:
+    """Отправитель с лимитами из config"""
+    return RateLimitedSender(config.SENDER_RATE_PER_SEC, config.SENDER_CHAT_INTERVAL_MS / 1000)
@@ -0,0 +1,212 @@
+# coding: utf-8
+"""
+Трассировка обновлений: на каждое обновление - trace ID, внутри спаны
+обработчика (middlewares/tracing.py), функций database.py и запросов Bot API.
+Спаны пишутся в TRACE_FILE строками JSONL в формате OTLP JSON (как у file
+exporter OpenTelemetry Collector): строка = {"resourceSpans": [...]} с пачкой спанов.
+Сводка p50/p95/p99 по именам спанов: python -m bench.trace_report TRACE_FILE
+
+Имена спанов: update, handler.<функция>, db.<функция>, bot_api.<метод>.
+Текущий спан хранится в contextvar, поэтому задачи, созданные во время
+обработки (отправка через sender и т.п.), попадают в ту же трассу.
+"""
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from aiogram import Bot
+from aiogram.methods import TelegramMethod
+
+import config
+import instrumentation
+
+SERVICE_NAME = "poputchik_bot"
+
+# Коды из OTLP
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("poputchik_span", default=None)
+
+def _attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start", "end", "attributes", "error")
+
+    def __init__(self, trace_id: str, parent_id: str, name: str, kind: int, attributes: Dict[str, Any]) -> None:
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = time.time_ns()
+        self.end = 0
+        self.attributes = attributes
+        self.error = ""
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end),
+            "attributes": [_attribute(key, value) for key, value in self.attributes.items() if value is not None],
+            "status": {"code": STATUS_ERROR, "message": self.error} if self.error else {"code": STATUS_OK},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+class Tracer:
+    """Создание спанов и буферизованная запись в JSONL"""
+
+    def __init__(self, path: str, sample_rate: float = 1.0, flush_interval: float = 1.0,
+                 max_buffer: int = 1000) -> None:
+        self.path = path
+        self.sample_rate = sample_rate
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer: List[Dict[str, Any]] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._sessions = set()
+        self.traces = 0
+        self.spans = 0
+        self.write_errors = 0
+
+    # ---- Спаны --------------------------------------------------------------
+
+    @contextmanager
+    def trace(self, name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+        """Корневой спан обновления (с вероятностью sample_rate)"""
+        if random.random() >= self.sample_rate:
+            yield None
+            return
+        self.traces += 1
+        with self._span(f"{random.getrandbits(128):032x}", "", name, KIND_SERVER, attributes) as span:
+            yield span
+
+    @contextmanager
+    def span(self, name: str, kind: int = KIND_INTERNAL, **attributes: Any) -> Iterator[Optional[Span]]:
+        """Дочерний спан текущей трассы; вне трассы - ничего не делает"""
+        parent = _current.get()
+        if parent is None:
+            yield None
+            return
+        with self._span(parent.trace_id, parent.span_id, name, kind, attributes) as span:
+            yield span
+
+    @contextmanager
+    def _span(self, trace_id: str, parent_id: str, name: str, kind: int,
+              attributes: Dict[str, Any]) -> Iterator[Span]:
+        span = Span(trace_id, parent_id, name, kind, attributes)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"[:200]
+            raise
+        finally:
+            _current.reset(token)
+            span.end = time.time_ns()
+            self._finish(span)
+
+    def _finish(self, span: Span) -> None:
+        self.spans += 1
+        self._buffer.append(span.to_otlp())
+        if len(self._buffer) >= self.max_buffer:
+            self.flush()
+
+    # ---- База данных и Bot API ---------------------------------------------
+
+    def instrument_database(self, module: Any) -> int:
+        """Спаны db.<функция> вокруг функций модуля БД"""
+        return instrumentation.wrap_database_functions(module, self._traced, "_traced")
+
+    def _traced(self, name: str, function: Callable) -> Callable:
+        span_name = f"db.{name}"
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return function(*args, **kwargs)
+            with self.span(span_name, KIND_CLIENT, **{"db.system": "sqlite", "db.operation": name}):
+                return function(*args, **kwargs)
+        return wrapper
+
+    async def install(self, bot: Bot) -> None:
+        """Middleware сессии бота (dp.startup): спаны bot_api.<метод>"""
+        instrumentation.install_session_middleware(self._sessions, bot, self._intercept)
+
+    async def _intercept(self, make_request, bot: Bot, method: TelegramMethod) -> Any:
+        if _current.get() is None:
+            return await make_request(bot, method)
+        name = type(method).__name__
+        with self.span(f"bot_api.{name}", KIND_CLIENT, **{"rpc.system": "telegram", "rpc.method": name,
+                                                          "telegram.chat_id": getattr(method, "chat_id", None)}):
+            return await make_request(bot, method)
+
+    # ---- Запись -------------------------------------------------------------
+
+    def flush(self) -> None:
+        if not self._buffer:
+            return
+        spans, self._buffer = self._buffer, []
+        line = json.dumps({"resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", SERVICE_NAME)]},
+            "scopeSpans": [{"scope": {"name": "poputchik.tracing"}, "spans": spans}],
+        }]}, ensure_ascii=False)
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            self.write_errors += 1
+            logging.warning(f"⚠️ Не удалось записать трассы в {self.path}: {e}")
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    async def start(self) -> None:
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+            logging.info(f"🧵 Трассировка: {self.path} (доля обновлений {self.sample_rate:g})")
+
+    async def stop(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "traces": self.traces,
+            "spans": self.spans,
+            "buffered": len(self._buffer),
+            "write_errors": self.write_errors,
+        }
+
+def create_tracer() -> Tracer:
+    """Трассировка с настройками из config"""
+    return Tracer(config.TRACE_FILE, config.TRACE_SAMPLE_RATE)
@@ -1,152 +1,156 @@
 # coding: utf-8
 """
-Скрипт для обновления старых карточек с новыми URL-кнопками
+Массовое обновление карточек маршрутов, сохранённых в заявках
+(requests.card_chat_id / card_message_id), - например, после изменения
+формата карточки или кнопок.
+
+- Заявки читаются порциями по --chunk, а не одним fetchall
+- Карточка рисуется тем же кодом, что и в боте (cards.route_card); маршрут и
+  статусы заявок читаются один раз на маршрут в порции
+- Редактирования внутри порции идут параллельно через RateLimitedSender
+  (лимиты Bot API и 429 retry_after учитываются)
+- После каждой порции прогресс сохраняется в таблицу card_jobs: после сбоя
+  повторный запуск продолжит с места остановки (--restart - начать заново)
+- В конце - скорость и ошибки по типам
+
+Запуск из корня проекта:
+    python update_old_cards.py
+    python update_old_cards.py --chunk 500 --restart
 """
+import argparse
 import asyncio
-import sqlite3
+import logging
+import time
+from collections import Counter
+
 from aiogram import Bot
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-import os
+from aiogram.exceptions import TelegramBadRequest
 
-DATABASE_NAME = 'poputchik.db'
+import card_refresher
+import cards
+import database
+import main
+import sender
 
-# Читаем токен из .env файла вручную
-def get_bot_token():
-    """Читаем BOT_TOKEN из .env файла"""
-    try:
-        with open('.env', 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if line.startswith('TELEGRAM_BOT_TOKEN='):
-                    token = line.split('=', 1)[1].strip()
-                    # Убираем кавычки если есть
-                    token = token.strip('"').strip("'")
-                    return token
-    except Exception as e:
-        print(f"❌ Ошибка чтения .env: {e}")
-    return None
-
-BOT_TOKEN = get_bot_token()
-
-if not BOT_TOKEN:
-    print("❌ ОШИБКА: Не найден BOT_TOKEN в файле .env!")
-    print("Проверьте что в .env есть строка: BOT_TOKEN=ваш_токен")
-    exit(1)
-
-print(f"✅ Токен найден: {BOT_TOKEN[:10]}...{BOT_TOKEN[-10:]}")
-
-def _format_route_card(route: dict, passenger_id: int = None, status: str = None) -> str:
-    """Форматирование карточки маршрута"""
-    from_location = route.get('from_location', '—')
-    to_location = route.get('to_location', '—')
-    date_dmy = route.get('date_dmy', '—')
-    time_hm = route.get('time_hm', '—')
-    price = route.get('price', 0)
-    seats = route.get('seats', 0)
-    comment = route.get('comment', '')
-
-    card = f"• {date_dmy}г. {time_hm} — {from_location} → {to_location} | цена: {price}₽ | мест: {seats}"
-
-    if comment:
-        card += f"\n💬 {comment}"
-
-    if status:
-        if status == 'pending':
-            card += "\n\n⏳ <b>Заявка отправлена</b>"
-        elif status == 'rejected':
-            card += "\n\n❌ <b>Заявка отклонена</b>"
-        elif status == 'accepted':
-            card += "\n\n✅ <b>Заявка принята!</b>"
-
-    return card
-
-def _make_route_card_keyboard(route_id: int, driver_username: str = None) -> InlineKeyboardMarkup:
-    """Клавиатура с URL-кнопкой чата"""
-    buttons = []
-    
-    buttons.append(InlineKeyboardButton(
-        text="👋 Откликнуться",
-        callback_data=f"rs:card:reply:{route_id}"
-    ))
-    
-    if driver_username:
-        buttons.append(InlineKeyboardButton(
-            text="💬 Чат",
-            url=f"https://t.me/{driver_username}"
-        ))
-    else:
-        buttons.append(InlineKeyboardButton(
-            text="💬 Чат",
-            callback_data=f"route:chat:error:{route_id}"
-        ))
-    
-    return InlineKeyboardMarkup(inline_keyboard=[buttons])
-
-async def update_all_cards():
-    """Обновить все карточки с новыми URL-кнопками"""
-    bot = Bot(token=BOT_TOKEN)
-    
-    conn = sqlite3.connect(DATABASE_NAME)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    # Получаем все заявки с карточками
-    cursor.execute('''
-        SELECT r.id, r.route_id, r.passenger_id, r.status, r.card_chat_id, r.card_message_id,
-               rt.from_location, rt.to_location, rt.date_dmy, rt.time_hm, rt.price, rt.seats, rt.comment, rt.user_id,
-               u.tg_username as driver_username
-        FROM requests r
-        JOIN routes rt ON r.route_id = rt.id
-        JOIN users u ON rt.user_id = u.user_id
-        WHERE r.card_chat_id IS NOT NULL AND r.card_message_id IS NOT NULL
-    ''')
-    
-    requests = cursor.fetchall()
-    conn.close()
-    
-    print(f"🔍 Найдено карточек: {len(requests)}")
-    
-    updated = 0
-    failed = 0
-    
-    for req in requests:
+class CardRerenderJob:
+    """Перерисовка карточек заявок с контрольными точками в БД"""
+
+    def __init__(self, bot: Bot, job_id: str = "update_old_cards", chunk: int = 200) -> None:
+        self.bot = bot
+        self.job_id = job_id
+        self.chunk = chunk
+        self.sender = sender.create_sender()
+        self.updated = 0
+        self.unchanged = 0
+        self.failed = 0
+        self.errors = Counter()
+        self._routes = {}
+
+    def _route(self, route_id: int):
+        """(маршрут, {passenger_id: статус заявки}) - один раз на маршрут в порции"""
+        if route_id not in self._routes:
+            self._routes[route_id] = (database.get_card_route(route_id),
+                                      database.get_route_request_statuses(route_id))
+        return self._routes[route_id]
+
+    async def _rerender(self, request: dict):
+        """Редактирует одну карточку. Возвращает строку для displayed_cards или None"""
+        chat_id, message_id = request["card_chat_id"], request["card_message_id"]
+        route, statuses = self._route(request["route_id"])
+        text, keyboard, active = card_refresher.render_card(
+            route, cards.VARIANT_REPLY, statuses.get(request["passenger_id"])
+        )
         try:
-            route = {
-                'id': req['route_id'],
-                'from_location': req['from_location'],
-                'to_location': req['to_location'],
-                'date_dmy': req['date_dmy'],
-                'time_hm': req['time_hm'],
-                'price': req['price'],
-                'seats': req['seats'],
-                'comment': req['comment']
-            }
-            
-            card_text = _format_route_card(route, req['passenger_id'], req['status'])
-            kb = _make_route_card_keyboard(req['route_id'], req['driver_username'])
-            
-            await bot.edit_message_text(
-                chat_id=req['card_chat_id'],
-                message_id=req['card_message_id'],
-                text=card_text,
-                reply_markup=kb,
-                parse_mode="HTML"
-            )
-            
-            updated += 1
-            print(f"✅ {updated}/{len(requests)}: маршрут {req['route_id']}")
-            await asyncio.sleep(0.1)
-            
+            await self.sender.call(chat_id, lambda: self.bot.edit_message_text(
+                chat_id=chat_id,
+                message_id=message_id,
+                text=text,
+                reply_markup=keyboard,
+                parse_mode="HTML",
+            ))
+            self.updated += 1
+        except TelegramBadRequest as e:
+            if "not modified" not in str(e):
+                self.failed += 1
+                self.errors[f"{type(e).__name__}: {e.message}"] += 1
+                return None
+            self.unchanged += 1
         except Exception as e:
-            failed += 1
-            print(f"❌ Ошибка маршрут {req['route_id']}: {e}")
-    
-    await bot.session.close()
-    
-    print(f"\n🎉 Готово!")
-    print(f"✅ Обновлено: {updated}")
-    print(f"❌ Ошибок: {failed}")
+            self.failed += 1
+            self.errors[type(e).__name__] += 1
+            return None
+
+        if not active:
+            return None
+        # Карточка снова актуальна - дальше её обновляет card_refresher
+        return (request["route_id"], chat_id, message_id, request["passenger_id"],
+                cards.VARIANT_REPLY, card_refresher.card_hash(text, keyboard))
+
+    async def run(self, restart: bool = False) -> dict:
+        job = database.start_card_job(self.job_id, restart=restart)
+        self.updated, self.unchanged, self.failed = job["updated"], job["unchanged"], job["failed"]
+        if job.get("finished_at"):
+            logging.info(f"Задание {self.job_id} уже завершено ({job['finished_at']}), --restart - начать заново")
+            return self.report(job, 0.0)
+
+        last_id = job["last_request_id"] or 0
+        if last_id:
+            logging.info(f"Продолжаем задание {self.job_id} после заявки {last_id}")
+
+        started = time.perf_counter()
+        processed = 0
+        while True:
+            requests = database.get_card_requests_after(last_id, self.chunk)
+            if not requests:
+                break
+            shown = await asyncio.gather(*(self._rerender(request) for request in requests))
+            database.register_displayed_cards([card for card in shown if card])
+
+            last_id = requests[-1]["id"]
+            processed += len(requests)
+            database.save_card_job_progress(self.job_id, last_id, self.updated, self.unchanged, self.failed)
+            self._routes.clear()
+
+            elapsed = time.perf_counter() - started
+            logging.info(f"Обработано {processed} карточек (до заявки {last_id}), {processed / elapsed:.1f}/с")
+
+        database.save_card_job_progress(self.job_id, last_id, self.updated, self.unchanged, self.failed, finished=True)
+        elapsed = time.perf_counter() - started
+        return self.report(database.get_card_job(self.job_id), processed / elapsed if elapsed else 0.0)
+
+    def report(self, job: dict, cards_per_sec: float) -> dict:
+        return {
+            "job_id": self.job_id,
+            "last_request_id": job["last_request_id"],
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "failed": self.failed,
+            "cards_per_sec": round(cards_per_sec, 1),
+            "errors": dict(self.errors.most_common()),
+            "retried_429": self.sender.retried,
+        }
+
+async def update_all_cards(chunk: int = 200, restart: bool = False) -> dict:
+    """Обновить все сохранённые карточки"""
+    database.init_db()
+    bot = main.create_bot()
+    try:
+        return await CardRerenderJob(bot, chunk=chunk).run(restart=restart)
+    finally:
+        await bot.session.close()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Обновление старых карточек маршрутов")
+    parser.add_argument("--chunk", type=int, default=200, help="заявок за одну порцию")
+    parser.add_argument("--restart", action="store_true", help="начать заново, а не продолжить")
+    args = parser.parse_args()
+
     print("🚀 Обновляем старые карточки...")
-    asyncio.run(update_all_cards())
\ No newline at end of file
+    result = asyncio.run(update_all_cards(args.chunk, args.restart))
+    print(f"\n🎉 Готово!")
+    print(f"✅ Обновлено: {result['updated']}")
+    print(f"➖ Без изменений: {result['unchanged']}")
+    print(f"❌ Ошибок: {result['failed']}")
+    for error, count in result["errors"].items():
+        print(f"   {count} × {error}")
+    print(f"⚡ Скорость: {result['cards_per_sec']} карточек/с")
@@ -0,0 +1,205 @@
+# coding: utf-8
+"""
+Журнал входящих обновлений для воспроизведения нагрузки (python -m bench.replay).
+Outer middleware dp.update пишет каждое обновление до любой обработки строкой
+{"ts": время получения, "update": {...}} в UPDATE_RECORD_FILE - JSONL, сжатый gzip.
+
+Обезличивание (до записи на диск):
+- id пользователей и чатов заменяются псевдонимами (HMAC с UPDATE_RECORD_SALT):
+  один и тот же пользователь остаётся одним и тем же во всём журнале;
+- имена, фамилии, username, телефоны, описание и название чата - маска;
+- текст и подписи: числа, время и "-" сохраняются (от них зависит ход
+  сценариев), остальные буквы заменяются на "x" с сохранением длины; числа
+  длиннее цены или времени (телефоны, номера карт) - нулями; у команды
+  сохраняется только "/команда", аргументы маскируются целиком;
+- file_id фото - хеш; координаты и контакты удаляются.
+callback_data: id водителя в "driver:profile:<id>" - псевдоним,
+ID маршрутов и заявок не меняются.
+"""
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+import callbacks
+import config
+
+# Поля с id пользователя или чата
+_ID_PARENTS = {"from", "chat", "user", "sender_chat", "sender_user", "forward_from", "forward_from_chat",
+               "via_bot", "new_chat_members", "left_chat_member"}
+_MASKED_FIELDS = {"first_name", "last_name", "username", "title", "bio", "phone_number", "vcard"}
+_TEXT_FIELDS = {"text", "caption"}
+_CALLBACK_FIELDS = {"data", "callback_data"}
+_FILE_FIELDS = {"file_id", "file_unique_id"}
+_DROPPED_FIELDS = {"location", "venue", "contact"}
+# Текст, который сохраняется как есть: числа, время, цена, "-"
+_KEEP_TEXT = re.compile(r"^[\d\s:.,+\-₽]*$")
+_COMMAND = re.compile(r"^/\S+")
+# Больше 6 цифр подряд (можно через пробел, скобки, "-") - не цена и не время
+_LONG_NUMBER = re.compile(r"\d(?:[\s()\-]*\d){6,}")
+_DIGIT = re.compile(r"\d")
+_LETTER = re.compile(r"[^\W\d_]")
+
+class UpdateRecorder(BaseMiddleware):
+    """Outer middleware обновлений: обезличенный журнал в gzip JSONL"""
+
+    def __init__(self, path: str, salt: str = "", flush_interval: float = 1.0, max_buffer: int = 500) -> None:
+        self.path = path
+        # Без соли псевдонимы меняются при каждом запуске
+        self._key = (salt or os.urandom(16).hex()).encode()
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer: List[str] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._ids: Dict[int, int] = {}
+        self.recorded = 0
+        self.write_errors = 0
+
+    # ---- Обезличивание ------------------------------------------------------
+
+    def pseudonym(self, value: int) -> int:
+        """Стабильный псевдоним id (знак сохраняется: группы остаются отрицательными)"""
+        alias = self._ids.get(value)
+        if alias is None:
+            digest = hmac.new(self._key, str(abs(value)).encode(), hashlib.sha256).hexdigest()
+            alias = int(digest[:12], 16) % 10 ** 12 + 10 ** 9
+            alias = -alias if value < 0 else alias
+            if len(self._ids) > 100000:
+                self._ids.clear()
+            self._ids[value] = alias
+        return alias
+
+    def _hash(self, value: str) -> str:
+        return hmac.new(self._key, value.encode(), hashlib.sha256).hexdigest()[:32]
+
+    def username_alias(self, username: str) -> str:
+        """Псевдоним username (тот же, что в журнале)"""
+        return f"username_{self._hash(username)[:8]}"
+
+    @staticmethod
+    def mask_text(text: str) -> str:
+        command = _COMMAND.match(text)
+        if command:
+            return command.group() + _DIGIT.sub("0", _LETTER.sub("x", text[command.end():]))
+        text = _LONG_NUMBER.sub(lambda number: _DIGIT.sub("0", number.group()), text)
+        if _KEEP_TEXT.match(text):
+            return text
+        return _LETTER.sub("x", text)
+
+    def mask_callback_data(self, data: str) -> str:
+        """ID пользователя в кнопке профиля водителя - псевдоним"""
+        driver_id = callbacks.unpack_id(data, callbacks.DRIVER_PROFILE)
+        if driver_id is None:
+            return data
+        return callbacks.pack(callbacks.DRIVER_PROFILE, self.pseudonym(driver_id))
+
+    def anonymize(self, value: Any, parent: str = "") -> Any:
+        if isinstance(value, list):
+            return [self.anonymize(item, parent) for item in value]
+        if not isinstance(value, dict):
+            return value
+        result = {}
+        for key, item in value.items():
+            if key in _DROPPED_FIELDS:
+                continue
+            if key == "id" and parent in _ID_PARENTS and isinstance(item, int):
+                result[key] = self.pseudonym(item)
+            elif key in _MASKED_FIELDS and isinstance(item, str):
+                result[key] = self.username_alias(item) if key == "username" else "x" * len(item)
+            elif key in _TEXT_FIELDS and isinstance(item, str):
+                result[key] = self.mask_text(item)
+            elif key in _CALLBACK_FIELDS and isinstance(item, str):
+                result[key] = self.mask_callback_data(item)
+            elif key in _FILE_FIELDS and isinstance(item, str):
+                result[key] = self._hash(item)
+            elif key == "chat_instance" and isinstance(item, str):
+                result[key] = self._hash(item)[:16]
+            else:
+                result[key] = self.anonymize(item, key)
+        return result
+
+    # ---- Запись -------------------------------------------------------------
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if isinstance(event, Update):
+            try:
+                self.record(event)
+            except Exception as e:
+                logging.error(f"Не удалось записать обновление {event.update_id}: {e}")
+        return await handler(event, data)
+
+    def record(self, update: Update) -> None:
+        raw = update.model_dump(mode="json", exclude_none=True, by_alias=True)
+        line = json.dumps({"ts": round(time.time(), 3), "update": self.anonymize(raw)}, ensure_ascii=False)
+        self._buffer.append(line)
+        self.recorded += 1
+        if len(self._buffer) >= self.max_buffer:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        try:
+            # Каждая пачка - отдельный член gzip; gzip.open читает их подряд
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            self.write_errors += 1
+            logging.warning(f"⚠️ Не удалось записать журнал обновлений {self.path}: {e}")
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    async def start(self) -> None:
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+            logging.info(f"📼 Запись обновлений: {self.path}")
+
+    async def stop(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "recorded": self.recorded,
+            "buffered": len(self._buffer),
+            "write_errors": self.write_errors,
+        }
+
+def read_journal(path: str) -> Iterator[Dict[str, Any]]:
+    """Записи журнала {"ts", "update"}; понимает и .gz, и обычный JSONL.
+    Строка без "update" считается самим обновлением (ts = None)"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if "update" in record and "update_id" not in record:
+                yield record
+            else:
+                yield {"ts": None, "update": record}
+
+def create_update_recorder() -> UpdateRecorder:
+    """Журнал обновлений с настройками из config"""
+    return UpdateRecorder(config.UPDATE_RECORD_FILE, config.UPDATE_RECORD_SALT)
@@ -0,0 +1,99 @@
+# coding: utf-8
+"""
+Лист ожидания маршрута.
+Когда мест нет, отклик пассажира ставит его в очередь (database.join_waitlist).
+Освободилось место - пассажир отменил заявку, водитель отклонил заявку или
+увеличил число мест - первые в очереди переводятся в заявки
+(database.promote_waitlist), и участники получают уведомления:
+- маршрут с мгновенным бронированием: место сразу за пассажиром
+- обычный маршрут: заявка уходит водителю на решение
+"""
+import logging
+from typing import Any, Dict
+
+from aiogram import Bot
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+import callbacks
+import cards
+import database
+from driver_digest import DriverDigest
+from sender import RateLimitedSender
+
+def _passenger_text(route: dict) -> str:
+    return (
+        f"🔔 <b>Освободилось место!</b>\n\n"
+        f"📍 Маршрут: {route.get('from_location', '?')} → {route.get('to_location', '?')}\n"
+        f"📅 Дата: {route.get('date_dmy', '?')}г.\n"
+        f"🕐 Время: {route.get('time_hm', '?')}\n\n"
+        f"Вы были в листе ожидания - заявка отправлена водителю."
+    )
+
+def _driver_text(route: dict, passenger: str, status: str) -> str:
+    title = "⚡ <b>Место забронировано из листа ожидания</b>" if status == "accepted" \
+        else "🔔 <b>Новая заявка из листа ожидания!</b>"
+    question = "" if status == "accepted" else "\n\nПринять заявку?"
+    return (
+        f"{title}\n\n"
+        f"📍 Маршрут: {route.get('from_location', '?')} → {route.get('to_location', '?')}\n"
+        f"📅 Дата: {route.get('date_dmy', '?')}г.\n"
+        f"🕐 Время: {route.get('time_hm', '?')}\n"
+        f"💰 Цена: {route.get('price', '?')}₽\n"
+        f"👤 Пассажир: {passenger}"
+        f"{question}"
+    )
+
+def _driver_keyboard(request_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="✅ Принять", callback_data=callbacks.pack(callbacks.DRIVER_ACCEPT, request_id)),
+        InlineKeyboardButton(text="❌ Отклонить", callback_data=callbacks.pack(callbacks.DRIVER_REJECT, request_id)),
+    ]])
+
+class WaitlistPromoter:
+    """Перевод из листа ожидания после освобождения мест + уведомления"""
+
+    def __init__(self, sender: RateLimitedSender, driver_digest: DriverDigest) -> None:
+        self.sender = sender
+        self.driver_digest = driver_digest
+        self.promoted = 0
+
+    async def promote(self, bot: Bot, route_id: int) -> int:
+        """Вызывается после освобождения места. Возвращает число переведённых"""
+        route, promoted = database.promote_waitlist(route_id)
+        if not promoted:
+            return 0
+        self.promoted += len(promoted)
+
+        # route - состояние до перевода, driver - настройки водителя
+        driver = database.get_card_route(route_id) or {}
+        driver_id = route.get("user_id")
+        calls = []
+        for request_id, passenger_id, status, seats_left in promoted:
+            if status == "accepted":
+                text = cards.instant_booking_text(route, seats_left, driver.get("driver_username"))
+            else:
+                text = _passenger_text(route)
+            calls.append((passenger_id, lambda passenger_id=passenger_id, text=text: bot.send_message(
+                chat_id=passenger_id, text=text, parse_mode="HTML"
+            )))
+        await self.sender.call_many(calls)
+
+        # Водителю - как о новых заявках (или строкой в сводке)
+        for request_id, passenger_id, status, _ in promoted:
+            try:
+                if driver.get("driver_notify_digest"):
+                    await self.driver_digest.add(bot, driver_id, request_id)
+                    continue
+                user = database.get_user_by_id(passenger_id)
+                username = user.get("tg_username") if user else None
+                text = _driver_text(route, f"@{username}" if username else f"ID{passenger_id}", status)
+                keyboard = _driver_keyboard(request_id) if status == "pending" else None
+                await self.sender.call(driver_id, lambda text=text, keyboard=keyboard: bot.send_message(
+                    chat_id=driver_id, text=text, reply_markup=keyboard, parse_mode="HTML"
+                ))
+            except Exception as e:
+                logging.warning(f"⚠️ Не удалось уведомить водителя {driver_id} о заявке {request_id}: {e}")
+        return len(promoted)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"promoted": self.promoted}
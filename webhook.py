@@ -0,0 +1,88 @@
+# coding: utf-8
+"""
+Режим webhook: aiohttp-приложение с обработчиком обновлений Telegram.
+- Проверка секретного токена (X-Telegram-Bot-Api-Secret-Token); без
+  WEBHOOK_SECRET секрет генерируется при запуске - webhook без проверки
+  принимал бы поддельные обновления от кого угодно
+- allowed_updates только для типов, которые используют роутеры
+- /healthz для проверки живости сервиса
+"""
+import asyncio
+import logging
+import secrets
+from typing import List, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+import config
+
+async def health(request: web.Request) -> web.Response:
+    """Проверка живости: отвечает 200, пока процесс обрабатывает запросы"""
+    return web.json_response({"status": "ok", "mode": "webhook"})
+
+def webhook_secret() -> str:
+    """WEBHOOK_SECRET или случайный секрет на время работы процесса
+    (Telegram получает его в setWebhook при каждом запуске)"""
+    if not config.WEBHOOK_SECRET:
+        config.WEBHOOK_SECRET = secrets.token_urlsafe(32)
+        logging.warning("⚠️ WEBHOOK_SECRET не задан - сгенерирован секрет на время работы процесса")
+    return config.WEBHOOK_SECRET
+
+def create_app(
+    dp: Dispatcher,
+    bot: Bot,
+    allowed_updates: Optional[List[str]] = None,
+    handle_in_background: bool = None,
+) -> web.Application:
+    """Собирает aiohttp-приложение для приёма обновлений"""
+    if handle_in_background is None:
+        handle_in_background = config.WEBHOOK_HANDLE_IN_BACKGROUND
+
+    secret = webhook_secret()
+    app = web.Application()
+    app.router.add_get("/healthz", health)
+
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=secret,
+        handle_in_background=handle_in_background,
+    ).register(app, path=config.WEBHOOK_PATH)
+
+    async def on_startup(bot: Bot) -> None:
+        # Без публичного адреса (локальный запуск, бенчмарк) webhook не регистрируем
+        if not config.WEBHOOK_BASE_URL:
+            logging.info("WEBHOOK_BASE_URL не задан - webhook в Telegram не регистрируется")
+            return
+        await bot.set_webhook(
+            url=f"{config.WEBHOOK_BASE_URL}{config.WEBHOOK_PATH}",
+            secret_token=secret,
+            allowed_updates=allowed_updates,
+        )
+        logging.info(f"Webhook установлен: {config.WEBHOOK_BASE_URL}{config.WEBHOOK_PATH}")
+
+    dp.startup.register(on_startup)
+    setup_application(app, dp, bot=bot)
+    return app
+
+async def run_webhook(
+    dp: Dispatcher,
+    bot: Bot,
+    allowed_updates: Optional[List[str]] = None,
+    host: str = None,
+    port: int = None,
+) -> None:
+    """Запускает aiohttp-сервер и работает до остановки процесса"""
+    app = create_app(dp, bot, allowed_updates=allowed_updates)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host or config.WEBAPP_HOST, port or config.WEBAPP_PORT)
+    await site.start()
+    logging.info(f"Webhook-сервер слушает {host or config.WEBAPP_HOST}:{port or config.WEBAPP_PORT}")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()